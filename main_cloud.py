@@ -3,23 +3,33 @@
 import asyncio
 import base64
 import csv
-import glob
+import hashlib
+import heapq
 import logging
 import os
+import queue
+import random
 import re
+import shutil
+import sqlite3
 import subprocess
 import sys
 import threading
 import time
 import traceback
+import zipfile
+from collections import deque
 from datetime import date, datetime, timedelta
 import html
+import json
 from io import BytesIO
 from urllib.parse import urljoin
 from typing import Optional
 from telegram.ext import Application
 # Local application imports
 import config  # make sure this has TWO_CAPTCHA_API_KEY
+import statements
+import txn_archive
 import os
 
 # Base folder for per-alias downloads
@@ -61,7 +71,9 @@ logger.addHandler(console_handler)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Third-party imports
+import psutil
 import requests
+import websocket
 
 # Telegram imports
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
@@ -87,9 +99,11 @@ from selenium.common.exceptions import (
     ElementClickInterceptedException,
     ElementNotInteractableException,
     NoSuchElementException,
+    NoSuchWindowException,
     StaleElementReferenceException,
     TimeoutException,
     UnexpectedAlertPresentException,
+    WebDriverException,
 )
 
 # Tweak Selenium’s HTTP connection pool
@@ -103,16 +117,22 @@ last_active: dict[str, datetime] = {}
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- pool of up to 10 pre-warmed AutoBank profiles ---
-MAX_PROFILES = 10
+# --- elastic pool of AutoBank profiles ---
+# MIN_WARM_PROFILES idle Chromes are kept warm, up to MAX_PROFILES are launched
+# on demand by /run, and idle extras are shut down after PROFILE_IDLE_TIMEOUT s.
+MAX_PROFILES         = getattr(config, "MAX_PROFILES", 10)
+MIN_WARM_PROFILES    = getattr(config, "MIN_WARM_PROFILES", 2)
+PROFILE_IDLE_TIMEOUT = getattr(config, "PROFILE_IDLE_TIMEOUT", 900)
 BASE_PROFILE_DIR = os.path.join(os.path.expanduser("~"), "chrome-profiles")
 os.makedirs(BASE_PROFILE_DIR, exist_ok=True)
 
 # --- NEW GLOBALS for “always-up” profiles ---
 _drivers: dict[str, webdriver.Chrome] = {}    # profile_dir → Chrome instance
 _active: dict[str, bool]          = {}        # profile_dir → is alias running?
+_idle_since: dict[str, float]     = {}        # profile_dir → time it went idle
+_pool_lock = threading.RLock()                # guards the pool state below
 
-# create exactly 10 empty profile dirs (you can manually sign in to each)
+# create MAX_PROFILES empty profile dirs (you can manually sign in to each)
 PROFILE_DIRS = [
     os.path.join(BASE_PROFILE_DIR, f"profile{i}")
     for i in range(1, MAX_PROFILES + 1)
@@ -120,15 +140,2353 @@ PROFILE_DIRS = [
 for d in PROFILE_DIRS:
     os.makedirs(d, exist_ok=True)
 
+# With CONTEXTS_PER_CHROME > 1 every profile Chrome carries that many isolated
+# browser contexts, and each context ("<profile>#ctx<n>") is one pool slot.
+CONTEXTS_PER_CHROME = max(1, getattr(config, "CONTEXTS_PER_CHROME", 1))
+MAX_SESSIONS        = MAX_PROFILES * CONTEXTS_PER_CHROME
+if CONTEXTS_PER_CHROME > 1:
+    POOL_SLOTS = [
+        f"{d}#ctx{j}" for d in PROFILE_DIRS for j in range(1, CONTEXTS_PER_CHROME + 1)
+    ]
+else:
+    POOL_SLOTS = PROFILE_DIRS
+
 # pool state
-_free_profiles = PROFILE_DIRS.copy()       # list of unused profile-dirs
-_profile_assignments = {}                  # alias -> profile-dir
+_free_profiles = POOL_SLOTS.copy()         # list of unused profile-dirs / slots
+_profile_assignments = {}                  # alias -> profile-dir / slot
+
+# --- Chrome tuning: headless toggle + CDP URL blocking ---
+CHROME_HEADLESS  = getattr(config, "CHROME_HEADLESS", False)
+CDP_URL_BLOCKING = getattr(config, "CDP_URL_BLOCKING", True)
+# optional root for the HTTP disk caches (e.g. on a fast disk); each profile gets
+# its own <root>/<profile name>, since Chrome needs exclusive use of a cache dir.
+# None keeps the cache inside the profile
+DISK_CACHE_ROOT = getattr(config, "DISK_CACHE_ROOT", None)
+
+_CHROME_TUNING_FLAGS = (
+    "--disable-extensions",
+    "--disable-component-extensions-with-background-pages",
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+)
+
+# analytics, web fonts and media are never needed to drive a bank page
+_BLOCK_COMMON = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*connect.facebook.net*", "*hotjar.com*", "*clarity.ms*",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3",
+]
+_BLOCK_IMAGES = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico"]
+
+# per-site extras (config.CDP_URL_BLOCKLIST entries are appended)
+_URL_BLOCKLIST: dict[str, list[str]] = {
+    "AutoBank": _BLOCK_IMAGES,
+    "IDFC":     _BLOCK_IMAGES,     # OTP login, no image captcha
+}
+# sites whose login shows an image captcha: image patterns are never applied
+_CAPTCHA_SITES = {"TMB", "IOB", "KGB", "IDBI"}
+
+
+def _tune_chrome_options(opts: webdriver.ChromeOptions) -> webdriver.ChromeOptions:
+    """Add the low-overhead flags (and headless mode if enabled) to `opts`."""
+    for flag in _CHROME_TUNING_FLAGS:
+        opts.add_argument(flag)
+    if CHROME_HEADLESS:
+        opts.add_argument("--headless=new")
+        opts.add_argument("--window-size=1920,1080")
+    profile_dir = next(
+        (a.split("=", 1)[1] for a in opts.arguments if a.startswith("--user-data-dir=")), None
+    )
+    if DISK_CACHE_ROOT and profile_dir:
+        cache_dir = os.path.join(DISK_CACHE_ROOT, os.path.basename(os.path.normpath(profile_dir)))
+        os.makedirs(cache_dir, exist_ok=True)
+        opts.add_argument(f"--disk-cache-dir={cache_dir}")
+    return opts
+
+
+def _apply_url_blocklist(driver, site: str) -> None:
+    """
+    Block analytics/fonts/media (and images where safe) in the current tab.
+    CDP blocking is per-tab, so call this after switching into a fresh tab.
+    """
+    if not CDP_URL_BLOCKING:
+        return
+    extra = getattr(config, "CDP_URL_BLOCKLIST", {}).get(site, [])
+    patterns = _BLOCK_COMMON + _URL_BLOCKLIST.get(site, []) + list(extra)
+    if site in _CAPTCHA_SITES:
+        patterns = [p for p in patterns if p not in _BLOCK_IMAGES]
+    patterns = [p for p in patterns if "captcha" not in p.lower()]
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception as e:
+        logger.warning(f"[CDP] could not set URL blocklist for {site}: {e!r}")
+
+
+# --- session reset (keeps the HTTP cache) + login page-load timing ---
+_BANK_ORIGINS = {
+    "TMB":  "https://www.tmbnet.in",
+    "IOB":  "https://www.iobnet.co.in",
+    "KGB":  "https://netbanking.keralagbank.com",
+    "IDBI": "https://inet.idbibank.co.in",
+    "IDFC": "https://my.idfcfirstbank.com",
+}
+# everything a site can persist except the HTTP cache
+_SESSION_STORAGE_TYPES = (
+    "cookies,local_storage,session_storage,indexeddb,websql,"
+    "service_workers,cache_storage,file_systems"
+)
+
+
+def _reset_session(driver, site: str) -> None:
+    """
+    Clean slate for a login: drop all cookies and the bank's web storage,
+    but leave the disk cache alone so static assets aren't fetched again.
+    """
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    try:
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+            "origin": _BANK_ORIGINS[site],
+            "storageTypes": _SESSION_STORAGE_TYPES,
+        })
+    except Exception as e:
+        logger.warning(f"[CDP] could not clear {site} storage: {e!r}")
+
+
+_page_loads: dict[str, deque] = {}     # site → recent login page-load times (ms)
+
+
+def _log_page_load(driver, site: str, alias: str) -> None:
+    """Record how long the bank's login page took and how much came from cache."""
+    try:
+        nav, cached, total = driver.execute_script("""
+            const nav = performance.getEntriesByType('navigation')[0];
+            const res = performance.getEntriesByType('resource');
+            return [nav ? nav.loadEventEnd - nav.startTime : null,
+                    res.filter(r => r.transferSize === 0 && r.decodedBodySize > 0).length,
+                    res.length];
+        """)
+    except Exception:
+        return
+    if nav is None:
+        return
+    times = _page_loads.setdefault(site, deque(maxlen=50))
+    times.append(nav)
+    logger.info(
+        f"[{alias}] {site} login page loaded in {nav:.0f} ms "
+        f"({cached}/{total} assets from cache, avg {sum(times) / len(times):.0f} ms)"
+    )
+
+
+class _BrowserCDP:
+    """
+    Minimal browser-level DevTools session.  Target.* and the browser-context
+    variants of Browser.* / Storage.* are not reachable through chromedriver's
+    per-page execute_cdp_cmd, so we talk to the browser endpoint directly.
+    One listener thread reads the socket: replies go to the waiting send(),
+    events to whoever subscribed with on().
+    """
+
+    REPLY_TIMEOUT = 30   # seconds
+
+    def __init__(self, debugger_address: str):
+        info = requests.get(f"http://{debugger_address}/json/version", timeout=5).json()
+        self._ws       = websocket.create_connection(info["webSocketDebuggerUrl"], timeout=None)
+        self._lock     = threading.Lock()
+        self._next_id  = 0
+        self._replies: dict[int, list] = {}      # id → [Event, reply]
+        self._handlers: dict[str, list] = {}     # event method → callbacks(params)
+        self._on_close: list = []
+        self.alive = True
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def send(self, method: str, **params) -> dict:
+        done = threading.Event()
+        with self._lock:
+            if not self.alive:
+                raise RuntimeError(f"{method}: DevTools connection closed")
+            self._next_id += 1
+            msg_id = self._next_id
+            self._replies[msg_id] = [done, None]
+            self._ws.send(json.dumps({"id": msg_id, "method": method, "params": params}))
+        done.wait(self.REPLY_TIMEOUT)
+        reply = self._replies.pop(msg_id, [None, None])[1]
+        if reply is None:
+            raise RuntimeError(f"{method}: no reply from Chrome")
+        if "error" in reply:
+            raise RuntimeError(f"{method}: {reply['error'].get('message')}")
+        return reply.get("result", {})
+
+    def on(self, method: str, callback) -> None:
+        """Call `callback(params)` on the listener thread for every `method` event."""
+        with self._lock:
+            self._handlers.setdefault(method, []).append(callback)
+
+    def on_close(self, callback) -> None:
+        """Call `callback()` once the connection is gone (right away if it already is)."""
+        with self._lock:
+            if self.alive:
+                self._on_close.append(callback)
+                return
+        callback()
+
+    def _listen(self):
+        try:
+            while True:
+                msg = json.loads(self._ws.recv())
+                if "id" in msg:
+                    slot = self._replies.get(msg["id"])
+                    if slot:
+                        slot[1] = msg
+                        slot[0].set()
+                    continue
+                with self._lock:
+                    handlers = list(self._handlers.get(msg.get("method"), ()))
+                for callback in handlers:
+                    try:
+                        callback(msg.get("params", {}))
+                    except Exception as e:
+                        logger.debug(f"[CDP] {msg.get('method')} handler failed: {e!r}")
+        except Exception:
+            pass   # Chrome gone or socket closed
+        with self._lock:
+            self.alive = False
+            callbacks, self._on_close = self._on_close, []
+        for slot in list(self._replies.values()):
+            slot[0].set()
+        for callback in callbacks:
+            callback()
+
+    def close(self) -> None:
+        try:
+            self._ws.close()
+        except Exception:
+            pass
+
+
+class BrowserContextDriver:
+    """
+    What a worker gets instead of a whole Chrome when CONTEXTS_PER_CHROME > 1.
+
+    Each instance owns one CDP browser context (own cookies, storage and
+    download directory) inside a shared Chrome, driven through its own
+    chromedriver session attached to that Chrome's debugger port, so
+    switch_to / current window never clash between aliases.  window_handles
+    only lists this context's tabs and quit() disposes the context, not the
+    browser.  Everything else is delegated to the attached WebDriver.
+    """
+
+    # cookies copied from the host's default context so every new context
+    # starts with the operator's AutoBank login
+    _SEED_DOMAIN = "payatom"
+    _COOKIE_KEYS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+
+    def __init__(self, host: webdriver.Chrome, cdp: _BrowserCDP, download_dir: str):
+        self.host         = host
+        self.cdp          = cdp
+        self.context_id   = cdp.send("Target.createBrowserContext", disposeOnDetach=False)["browserContextId"]
+        self.download_dir = download_dir
+
+        cdp.send(
+            "Browser.setDownloadBehavior",
+            behavior="allow", downloadPath=download_dir, browserContextId=self.context_id,
+        )
+        seed = [
+            {k: c[k] for k in self._COOKIE_KEYS if k in c}
+            for c in cdp.send("Storage.getCookies").get("cookies", [])
+            if self._SEED_DOMAIN in c.get("domain", "")
+        ]
+        if seed:
+            cdp.send("Storage.setCookies", cookies=seed, browserContextId=self.context_id)
+
+        target = cdp.send(
+            "Target.createTarget", url="about:blank", browserContextId=self.context_id
+        )["targetId"]
+
+        opts = webdriver.ChromeOptions()
+        opts.debugger_address = host.capabilities["goog:chromeOptions"]["debuggerAddress"]
+        self._driver = webdriver.Chrome(options=opts)
+        self._driver.switch_to.window(target)   # chromedriver handles are target ids
+
+    @property
+    def window_handles(self) -> list[str]:
+        mine = {
+            t["targetId"]
+            for t in self.cdp.send("Target.getTargets")["targetInfos"]
+            if t.get("type") == "page" and t.get("browserContextId") == self.context_id
+        }
+        return [h for h in self._driver.window_handles if h in mine]
+
+    def quit(self) -> None:
+        try:
+            self.cdp.send("Target.disposeBrowserContext", browserContextId=self.context_id)
+        except Exception:
+            pass
+        try:
+            # an attached session never owns the browser, so this only detaches
+            self._driver.quit()
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+_hosts: dict[str, tuple] = {}      # profile_dir → (host Chrome, _BrowserCDP)
+_hosts_lock = threading.RLock()
+
+
+def _slot_host(slot: str) -> str:
+    """Profile dir of the Chrome that carries pool slot `slot`."""
+    return slot.split("#ctx")[0]
+
+
+def _start_chrome(profile_dir: str, download_folder: str) -> webdriver.Chrome:
+    """Start a tuned Chrome on `profile_dir` that downloads into `download_folder`."""
+    opts = webdriver.ChromeOptions()
+    opts.add_argument(f"--user-data-dir={profile_dir}")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-dev-shm-usage")
+    # ─── (B) ─── Give Chrome a unique download.default_directory ───
+    prefs = {
+        "download.default_directory": download_folder,
+        "download.prompt_for_download": False,
+        "profile.default_content_setting_values.automatic_downloads": 1,
+    }
+    opts.add_experimental_option("prefs", prefs)
+    driver = webdriver.Chrome(options=_tune_chrome_options(opts))
+
+    # instruct Chrome to dump all downloads into our profile folder
+    driver.execute_cdp_cmd(
+        "Browser.setDownloadBehavior",
+        {"behavior": "allow", "downloadPath": download_folder}
+    )
+    return driver
+
+
+def _ensure_host(profile_dir: str) -> tuple:
+    """Return (Chrome, _BrowserCDP) for a multiplexing profile, starting it if needed."""
+    with _hosts_lock:
+        host = _hosts.get(profile_dir)
+        if host and _probe_driver(host[0]):
+            return host
+        if host:
+            _stop_host(profile_dir)
+        download_folder = os.path.join(_download_base, os.path.basename(profile_dir))
+        os.makedirs(download_folder, exist_ok=True)
+        driver = _start_chrome(profile_dir, download_folder)
+        driver.get("https://autobank.payatom.in/bankupload.php")
+        cdp = _BrowserCDP(driver.capabilities["goog:chromeOptions"]["debuggerAddress"])
+        _hosts[profile_dir] = (driver, cdp)
+        logger.info(f"[Pool] launched multiplexing Chrome for {os.path.basename(profile_dir)}")
+        return _hosts[profile_dir]
+
+
+def _stop_host(profile_dir: str) -> None:
+    with _hosts_lock:
+        host = _hosts.pop(profile_dir, None)
+    if host is None:
+        return
+    _recycle_done(profile_dir)
+    driver, cdp = host
+    cdp.close()
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+def _launch_profile(profile: str) -> webdriver.Chrome:
+    """Start Chrome (or a browser context) for a pool slot and register it in `_drivers`."""
+    # a) create a download folder named for this profile / slot
+    prof_name = os.path.basename(profile)
+    download_folder = os.path.join(_download_base, prof_name)
+    os.makedirs(download_folder, exist_ok=True)
+    _profile_downloads[profile] = download_folder
+
+    # b) start Chrome with that profile, or carve a context out of its host
+    if CONTEXTS_PER_CHROME > 1:
+        host, cdp = _ensure_host(_slot_host(profile))
+        driver = BrowserContextDriver(host, cdp, download_folder)
+    else:
+        driver = _start_chrome(profile, download_folder)
+    _apply_url_blocklist(driver, "AutoBank")
+    driver.get("https://autobank.payatom.in/bankupload.php")
+    _learn_autobank_form(driver)
+
+    # track driver and its state
+    with _pool_lock:
+        _drivers[profile] = driver
+        _active.setdefault(profile, False)
+        # spread first keep-alives so freshly launched profiles don't sync up
+        _next_refresh[profile] = time.time() + random.uniform(0, KEEPALIVE_INTERVAL)
+    logger.info(f"[Pool] launched Chrome for {prof_name} ({len(_drivers)}/{MAX_SESSIONS} running)")
+    return driver
+
+
+def _recycle_pooled_driver(driver) -> None:
+    """Leave a pooled Chrome with one fresh AutoBank tab for the next alias."""
+    driver.switch_to.window(driver.window_handles[0])
+    driver.execute_script(
+        "window.open('https://autobank.payatom.in/operator_index.php');"
+    )
+    # close every tab except the new one
+    for handle in driver.window_handles[:-1]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(driver.window_handles[0])
+
+
+def _shutdown_profile(profile: str) -> None:
+    """Quit the Chrome of an idle pooled profile; the profile stays in the pool."""
+    with _pool_lock:
+        driver = _drivers.pop(profile, None)
+        _active.pop(profile, None)
+        _idle_since.pop(profile, None)
+        _next_refresh.pop(profile, None)
+    if driver is None:
+        return
+    try:
+        driver.quit()
+    except Exception:
+        pass
+    logger.info(f"[Pool] shut down idle Chrome for {os.path.basename(profile)}")
+
+    # a multiplexing Chrome goes once its last context is gone
+    if CONTEXTS_PER_CHROME > 1:
+        host = _slot_host(profile)
+        with _pool_lock:
+            in_use = any(_slot_host(p) == host for p in _drivers)
+        if not in_use:
+            _stop_host(host)
+
+
+def _take_free_profile() -> Optional[str]:
+    """
+    Reserve a free profile, preferring one whose Chrome is already warm.
+    Returns None once all MAX_SESSIONS slots are in use.
+    """
+    with _pool_lock:
+        if not _free_profiles:
+            return None
+        # slots on a Chrome waiting to be recycled only as a last resort
+        usable = [p for p in _free_profiles if _slot_host(p) not in _recycle_requested]
+        candidates = usable or _free_profiles
+        warm = [p for p in candidates if p in _drivers]
+        profile = warm[0] if warm else candidates[0]
+        _free_profiles.remove(profile)
+        _idle_since.pop(profile, None)
+        return profile
+
+
+
+class ProfileLeaseManager:
+    """
+    Thread-safe leases over `_free_profiles` / `_profile_assignments`.
+    When the pool is exhausted, aliases wait in a FIFO queue and are handed
+    the next released profile directly, so nobody can jump the queue.
+    """
+
+    def __init__(self):
+        self._waiting: deque = deque()     # (alias, start_cb, loop)
+
+    def acquire(self, alias: str, start_cb, loop) -> tuple[Optional[str], int]:
+        """
+        Lease a profile to `alias`.  Returns (profile, 0) on success, or
+        (None, queue position) after queueing `start_cb(profile)` for later.
+        """
+        with _pool_lock:
+            for pos, (queued, _, _) in enumerate(self._waiting, start=1):
+                if queued == alias:
+                    return None, pos
+            profile = None if self._waiting else _take_free_profile()
+            if profile is not None:
+                _profile_assignments[alias] = profile
+                _active[profile] = True
+                return profile, 0
+            self._waiting.append((alias, start_cb, loop))
+            return None, len(self._waiting)
+
+    def release(self, alias: str, profile: Optional[str] = None) -> Optional[str]:
+        """
+        Return `alias`'s profile to the pool (or to the next queued alias).
+        Safe to call any number of times; a stale `profile` is ignored.
+        """
+        with _pool_lock:
+            held = _profile_assignments.get(alias)
+            if held is None or (profile is not None and held != profile):
+                return None
+            del _profile_assignments[alias]
+            _active[held] = False
+            self._hand_back(held)
+        return held
+
+    def checkin(self, profile: str) -> None:
+        """Put back a profile that was taken out without a lease (pool manager)."""
+        with _pool_lock:
+            if profile in _free_profiles or profile in _profile_assignments.values():
+                return
+            since = _idle_since.get(profile)
+            self._hand_back(profile)
+            if since is not None and profile in _free_profiles:
+                _idle_since[profile] = since      # a health check is not a use
+
+    def cancel(self, alias: str) -> bool:
+        """Drop `alias` from the wait queue."""
+        with _pool_lock:
+            for entry in self._waiting:
+                if entry[0] == alias:
+                    self._waiting.remove(entry)
+                    return True
+        return False
+
+    def queued(self) -> list[str]:
+        with _pool_lock:
+            return [alias for alias, _, _ in self._waiting]
+
+    def _hand_back(self, profile: str) -> None:
+        # caller holds _pool_lock
+        if self._waiting:
+            alias, start_cb, loop = self._waiting.popleft()
+            _profile_assignments[alias] = profile
+            _active[profile] = True
+            asyncio.run_coroutine_threadsafe(start_cb(profile), loop)
+        else:
+            _idle_since[profile] = time.time()
+            _free_profiles.insert(0, profile)     # reuse the warm one first
+
+
+_leases = ProfileLeaseManager()
+
+# --- pool manager: health probes, jittered keep-alive, replacement ---
+KEEPALIVE_INTERVAL = getattr(config, "KEEPALIVE_INTERVAL", 600)   # s between AutoBank refreshes
+KEEPALIVE_JITTER   = getattr(config, "KEEPALIVE_JITTER", 120)     # ± s added to each refresh
+PROBE_TIMEOUT      = getattr(config, "PROBE_TIMEOUT", 5)          # s before a driver counts as hung
+
+_next_refresh: dict[str, float] = {}      # profile_dir → next keep-alive time
+
+# set in on_startup so background threads can post to the ops chat
+_notify_bot  = None
+_notify_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _notify(text: str) -> None:
+    """Post a message to the ops chat from any thread."""
+    if _notify_bot is None or _notify_loop is None:
+        logger.info(text)
+        return
+    asyncio.run_coroutine_threadsafe(
+        _notify_bot.send_message(
+            chat_id=config.TELEGRAM_CHAT_ID,
+            text=text,
+            parse_mode=ParseMode.MARKDOWN,
+        ),
+        _notify_loop,
+    )
+
+
+def _probe_driver(driver, timeout: float = PROBE_TIMEOUT) -> bool:
+    """
+    Cheap liveness check: ask chromedriver for its window handles.  Each probe
+    gets its own daemon thread, so a hung driver only ever blocks its own probe
+    and can't starve the checks of healthy ones.
+    """
+    result = []
+
+    def probe():
+        try:
+            result.append(bool(driver.window_handles))
+        except Exception:
+            result.append(False)
+
+    thread = threading.Thread(target=probe, name="probe", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return bool(result and result[0])
+
+
+def _checkout_idle(profile: str, warm: bool = True) -> bool:
+    """
+    Take a free profile out of the free list while the manager works on it,
+    so /run can't lease it meanwhile.  `warm` → it must have a Chrome,
+    otherwise it must not.
+    """
+    with _pool_lock:
+        if profile in _free_profiles and (profile in _drivers) == warm:
+            _free_profiles.remove(profile)
+            return True
+        return False
+
+
+def _checkin_idle(profile: str) -> None:
+    _leases.checkin(profile)
+
+
+def _check_idle_profile(profile: str) -> None:
+    """Probe an idle Chrome; refresh AutoBank when due, relaunch it if dead."""
+    name = os.path.basename(profile)
+    driver = _drivers.get(profile)
+    if driver is None:
+        return
+
+    if _recycle_due(profile):
+        if CONTEXTS_PER_CHROME > 1:
+            # just let go: the host restarts once its busy slots have drained
+            logger.info(f"[Pool] closing idle context {name} on a Chrome being recycled")
+            _shutdown_profile(profile)
+        else:
+            logger.info(f"[Pool] recycling idle Chrome for {name}")
+            _recycle_profile(profile)
+        return
+
+    if not _probe_driver(driver):
+        logger.warning(f"[Pool] Chrome for {name} is not responding — replacing it")
+        _notify(f"♻️ Chrome for profile `{name}` stopped responding — relaunching it.")
+        _shutdown_profile(profile)
+        _launch_profile(profile)
+        return
+
+    now = time.time()
+    if now < _next_refresh.get(profile, 0):
+        return
+    _next_refresh[profile] = now + KEEPALIVE_INTERVAL + random.uniform(
+        -KEEPALIVE_JITTER, KEEPALIVE_JITTER
+    )
+
+    # keep-alive doubles as the AutoBank login check: the upload page only
+    # shows its drop-zone to a signed-in operator
+    driver.switch_to.window(driver.window_handles[0])
+    driver.get("https://autobank.payatom.in/bankupload.php")
+    if not driver.find_elements(By.ID, "drop-zone"):
+        logger.warning(f"[Pool] AutoBank session lost in {name}")
+        _notify(f"🔐 AutoBank session expired in profile `{name}` — please log in again.")
+
+
+def _pool_manager_loop():
+    """
+    Background pool manager:
+      1) keep MIN_WARM_PROFILES idle Chromes warm and reap idle extras
+      2) probe every idle Chrome and relaunch crashed ones
+      3) refresh idle AutoBank sessions on a jittered KEEPALIVE_INTERVAL
+    """
+    while True:
+        time.sleep(30)
+        now = time.time()
+        with _pool_lock:
+            idle = [p for p in dict.fromkeys(_free_profiles) if p in _drivers]
+            for p in idle:
+                _idle_since.setdefault(p, now)
+            # oldest-idle first, so the most recently used Chromes stay warm
+            idle.sort(key=lambda p: _idle_since[p])
+            expired = [
+                p for p in idle[:max(len(idle) - MIN_WARM_PROFILES, 0)]
+                if now - _idle_since[p] > PROFILE_IDLE_TIMEOUT
+            ]
+            cold = [p for p in dict.fromkeys(_free_profiles)
+                    if p not in _drivers and _slot_host(p) not in _recycle_requested]
+            missing = min(MIN_WARM_PROFILES - len(idle), len(cold))
+
+        # reserve each profile before touching its Chrome; one leased since
+        # the snapshot above is skipped
+        for p in expired:
+            if not _checkout_idle(p):
+                continue
+            try:
+                if time.time() - _idle_since.get(p, now) > PROFILE_IDLE_TIMEOUT:
+                    _shutdown_profile(p)
+            finally:
+                _checkin_idle(p)
+        for p in cold[:max(missing, 0)]:
+            if not _checkout_idle(p, warm=False):
+                continue
+            try:
+                _launch_profile(p)
+            except Exception as e:
+                logger.error(f"[Pool] could not warm {os.path.basename(p)}: {e!r}")
+            finally:
+                _checkin_idle(p)
+
+        for p in idle:
+            if p in expired or not _checkout_idle(p):
+                continue
+            try:
+                _check_idle_profile(p)
+            except Exception as e:
+                logger.warning(f"[Pool] health check failed for {os.path.basename(p)}: {e!r}")
+            finally:
+                _checkin_idle(p)
+
+# --- statement artifacts: per-run folders, retention, daily archives ---
+ARTIFACT_ROOT = getattr(config, "ARTIFACT_ROOT", _download_base)
+ARTIFACT_KEEP = getattr(config, "ARTIFACT_KEEP", 20)     # run folders kept per alias
+
+
+class ArtifactStore:
+    """
+    Layout per alias:
+        <ARTIFACT_ROOT>/<alias>/runs/<timestamp>/<file>   last ARTIFACT_KEEP runs
+        <ARTIFACT_ROOT>/<alias>/archive/<YYYY-MM-DD>.zip  everything older
+    plus index.json (alias → latest file) so /file needs no directory scan.
+    """
+
+    def __init__(self, root: str = ARTIFACT_ROOT, keep: int = ARTIFACT_KEEP):
+        self.root  = root
+        self.keep  = keep
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(root, "index.json")
+        try:
+            with open(self._index_path, encoding="utf-8") as fh:
+                self._latest = json.load(fh)
+        except (OSError, ValueError):
+            self._latest = {}
+
+    def new_run(self, alias: str) -> str:
+        """Create and return an empty folder for one download of `alias`."""
+        folder = os.path.join(
+            self.root, alias, "runs", datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        )
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def latest(self, alias: str) -> Optional[str]:
+        path = self._latest.get(alias)
+        return path if path and os.path.exists(path) else None
+
+    def add(self, alias: str, path: str) -> None:
+        """Record a finished download and apply the retention policy."""
+        with self._lock:
+            self._latest[alias] = path
+            tmp = self._index_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(self._latest, fh)
+            os.replace(tmp, self._index_path)
+        try:
+            self._compact(alias)
+        except Exception as e:
+            logger.warning(f"[Artifacts] compaction failed for {alias}: {e!r}")
+
+    def _compact(self, alias: str) -> None:
+        runs_dir = os.path.join(self.root, alias, "runs")
+        runs = sorted(os.listdir(runs_dir))          # timestamp names sort by age
+        for run in runs[:-self.keep]:
+            folder = os.path.join(runs_dir, run)
+            files  = os.listdir(folder)
+            if any(f.lower().endswith((".tmp", ".crdownload")) for f in files):
+                continue                              # still being written
+            day = datetime.strptime(run[:8], "%Y%m%d").strftime("%Y-%m-%d")
+            archive_dir = os.path.join(self.root, alias, "archive")
+            os.makedirs(archive_dir, exist_ok=True)
+            with zipfile.ZipFile(os.path.join(archive_dir, f"{day}.zip"), "a",
+                                 compression=zipfile.ZIP_DEFLATED) as zf:
+                for f in files:
+                    zf.write(os.path.join(folder, f), arcname=f"{run}/{f}")
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+_artifacts = ArtifactStore()
+
+
+# --- cooperative cancellation: /stop interrupts a worker's sleeps and waits ---
+
+class Cancelled(BaseException):
+    """
+    Raised inside a worker thread once its alias has been stopped.  Not an
+    Exception, so the flows' broad `except Exception` fallbacks (captcha
+    retries, click fallbacks) don't swallow it and carry on.  A bare
+    `except:` still would: never wrap a wait or _sleep() in one.
+    """
+
+
+_cancel = threading.local()     # .token = the stop event of the worker running on this thread
+
+
+def _bind_cancel(worker) -> None:
+    """Make the calling thread's sleeps and waits abort once `worker` is stopped."""
+    _cancel.token = getattr(worker, "stop_evt", None) or worker._stop_event
+
+
+def _unbind_cancel() -> None:
+    """Clean-up (logout, recycle) must run to completion even though we're stopping."""
+    _cancel.token = None
+
+
+def _check_cancel() -> None:
+    token = getattr(_cancel, "token", None)
+    if token is not None and token.is_set():
+        raise Cancelled()
+
+
+def _sleep(seconds: float) -> None:
+    """time.sleep that returns early with Cancelled when this thread's worker is stopped."""
+    token = getattr(_cancel, "token", None)
+    if token is None:
+        time.sleep(seconds)
+    elif token.wait(seconds):
+        raise Cancelled()
+
+
+class CancellableWait(WebDriverWait):
+    """WebDriverWait whose condition raises Cancelled as soon as the worker is stopped."""
+
+    def _wrap(self, method):
+        token = getattr(_cancel, "token", None)
+        if token is None:
+            return method
+
+        def check(driver):
+            if token.is_set():
+                raise Cancelled()
+            return method(driver)
+        return check
+
+    def until(self, method, message: str = ""):
+        return super().until(self._wrap(method), message)
+
+    def until_not(self, method, message: str = ""):
+        return super().until_not(self._wrap(method), message)
+
+
+# every WebDriverWait(...) in the bank flows becomes cancellable
+WebDriverWait = CancellableWait
+
+
+_stop_guard = threading.Lock()
+
+
+def _claim_stop(worker) -> bool:
+    """True for the first stop() of `worker`; later calls must not log out / recycle again."""
+    with _stop_guard:
+        if getattr(worker, "_stop_claimed", False):
+            return False
+        worker._stop_claimed = True
+        return True
+
+
+def _stop_worker(worker) -> None:
+    """
+    /stop and /stopall: flip the stop flag so the worker drops out of its
+    current sleep or page wait and wait for its thread to exit — run() ends
+    with stop(), so the logout, recycle and lease release happen there, once,
+    after nothing uses the driver any more.  The stop() here only covers a
+    thread that never started.
+    """
+    (getattr(worker, "stop_evt", None) or worker._stop_event).set()
+    if worker.is_alive():
+        worker.join()
+    worker.stop()
+
+
+# --- condition waits: poll for the real page state instead of fixed sleeps ---
+WAIT_POLL     = getattr(config, "WAIT_POLL", 0.25)      # seconds between condition checks
+NETWORK_QUIET = getattr(config, "NETWORK_QUIET", 0.5)   # no request for this long = idle
+
+# counts XHR / fetch requests still in flight; installed on every new document
+_INFLIGHT_JS = """
+(() => {
+  if (window.__abInflight !== undefined) return;
+  window.__abInflight = 0;
+  const done = () => { window.__abInflight = Math.max(0, window.__abInflight - 1); };
+  const send = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function (...args) {
+    window.__abInflight++;
+    this.addEventListener("loadend", done, { once: true });
+    return send.apply(this, args);
+  };
+  if (window.fetch) {
+    const fetch = window.fetch;
+    window.fetch = (...args) => { window.__abInflight++; return fetch(...args).finally(done); };
+  }
+})();
+"""
+_NETWORK_STATE_JS = (
+    "return [document.readyState, window.__abInflight || 0,"
+    " performance.getEntriesByType('resource').length];"
+)
+
+_wait_stats: dict[str, list] = {}    # label → [count, total s, max s]
+
+
+def _record_wait(label: str, seconds: float) -> None:
+    stats = _wait_stats.setdefault(label, [0, 0.0, 0.0])
+    stats[0] += 1
+    stats[1] += seconds
+    stats[2] = max(stats[2], seconds)
+    logger.debug(f"[Wait] {label}: {seconds:.2f}s")
+
+
+def _wait_for(driver, condition, timeout: float, label: str):
+    """WebDriverWait with fast polling that records how long it really took."""
+    started = time.monotonic()
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=WAIT_POLL).until(condition)
+    finally:
+        _record_wait(label, time.monotonic() - started)
+
+
+def _wait_present(driver, locator, timeout: float = 30, label: str = None):
+    return _wait_for(driver, EC.presence_of_element_located(locator), timeout,
+                     label or f"present {locator[1]}")
+
+
+def _wait_gone(driver, locator, timeout: float = 30, label: str = None):
+    """Until the element (spinner, overlay, popup) is hidden or removed."""
+    return _wait_for(driver, EC.invisibility_of_element_located(locator), timeout,
+                     label or f"gone {locator[1]}")
+
+
+def _wait_text(driver, locator, timeout: float = 30, label: str = None):
+    """Until the element exists and has non-blank text; returns the element."""
+    def has_text(d):
+        elems = d.find_elements(*locator)
+        return elems[0] if elems and elems[0].text.strip() else False
+    return _wait_for(driver, has_text, timeout, label or f"text {locator[1]}")
+
+
+def _watch_network(driver) -> None:
+    """
+    Install the in-flight request counter in this tab (now and on every
+    navigation).  The new-document hook is registered once per tab and its
+    identifier kept, so switching between tabs doesn't pile up hooks.
+    """
+    scripts = getattr(driver, "_network_scripts", None)
+    if scripts is None:
+        scripts = driver._network_scripts = {}     # window handle → script identifier
+    handle = driver.current_window_handle
+    if handle not in scripts:
+        try:
+            scripts[handle] = driver.execute_cdp_cmd(
+                "Page.addScriptToEvaluateOnNewDocument", {"source": _INFLIGHT_JS}
+            ).get("identifier")
+        except Exception as e:
+            scripts[handle] = None
+            logger.debug(f"[Wait] CDP script injection failed: {e!r}")
+    driver.execute_script(_INFLIGHT_JS)        # no-op once this document has it
+
+
+def _wait_network_idle(driver, timeout: float = 30, quiet: float = NETWORK_QUIET,
+                       label: str = "network idle") -> bool:
+    """
+    Until the document is loaded, no XHR / fetch is in flight and no new
+    resource has finished for `quiet` seconds.  A page that keeps polling
+    never goes idle, so a timeout only logs and returns False.
+    """
+    _watch_network(driver)
+    state = {"resources": -1, "since": time.monotonic()}
+
+    def idle(d):
+        ready, inflight, resources = d.execute_script(_NETWORK_STATE_JS)
+        now = time.monotonic()
+        if ready != "complete" or inflight or resources != state["resources"]:
+            state["resources"], state["since"] = resources, now
+            return False
+        return now - state["since"] >= quiet
+    try:
+        _wait_for(driver, idle, timeout, label)
+        return True
+    except TimeoutException:
+        logger.info(f"[Wait] {label}: network still busy after {timeout}s, continuing")
+        return False
+
+
+# --- bank sessions: valid / expired detection, keep-alive, resume after errors ---
+SESSION_KEEPALIVE = getattr(config, "SESSION_KEEPALIVE", 240)   # s between pings while idle, 0 = off
+# site → same-origin path that is safe to GET in the background (e.g. a session ping)
+SESSION_KEEPALIVE_URLS: dict = getattr(config, "SESSION_KEEPALIVE_URLS", {})
+
+# site → (worker attribute holding the bank tab, element only shown while logged in)
+_SESSION_MARKERS = {
+    "TMB":  ("tmb_window", (By.ID, "Account_Summary")),
+    "IOB":  ("iob_win",    (By.CSS_SELECTOR, "nav.accordian")),
+    "KGB":  ("kgb_win",    (By.LINK_TEXT, "Account Statement")),
+    "IDBI": ("idbi_win",   (By.LINK_TEXT, "A/C Statement")),
+    "IDFC": ("idfc_win",   (By.CSS_SELECTOR, "span[data-testid='Accounts']")),
+}
+_EXPIRED_RE = re.compile(
+    r"session (has )?(expired|timed out|is invalid)|you have been logged out|"
+    r"login again|log in again|logged out for (application )?security",
+    re.IGNORECASE,
+)
+# resets client-side idle timers and accepts a "your session is about to expire" prompt
+_KEEPALIVE_JS = """
+for (const type of ["mousemove", "keydown", "scroll"]) {
+  document.dispatchEvent(new Event(type, { bubbles: true }));
+}
+if (/session/i.test(document.body.innerText) && /expir|time.?out/i.test(document.body.innerText)) {
+  for (const el of document.querySelectorAll("button, a, input[type=button], input[type=submit]")) {
+    const label = (el.innerText || el.value || "").trim();
+    if (el.offsetParent && /^(continue|extend|stay (logged|signed) in|keep me (logged|signed) in)/i.test(label)) {
+      el.click();
+      return label;
+    }
+  }
+}
+return null;
+"""
+
+
+class BankSession:
+    """
+    Tells whether a worker's bank login is still good, so an error in the
+    middle of a cycle costs a return to the landing page instead of a fresh
+    login (captcha / OTP), and keeps the session warm while the alias waits
+    for its next cycle.
+    """
+
+    def __init__(self, worker, site: str):
+        self.worker = worker
+        self.site   = site
+        self.window_attr, self.marker = _SESSION_MARKERS[site]
+        self.resumed = 0            # errors recovered without a new login
+        self.clean   = True         # browser state fit for a login (no half-done attempt)
+
+    def _to_bank_tab(self) -> bool:
+        handle = getattr(self.worker, self.window_attr, None)
+        driver = self.worker.driver
+        if handle is None or handle not in driver.window_handles:
+            return False
+        driver.switch_to.window(handle)
+        try:
+            driver.switch_to.alert.accept()      # leftover alert from the failed step
+        except Exception:
+            pass
+        return True
+
+    def state(self) -> str:
+        """'valid', 'expired' or 'unknown' for the page open in the bank tab."""
+        driver = self.worker.driver
+        if driver.find_elements(*self.marker):
+            return "valid"
+        try:
+            text = driver.execute_script("return document.body ? document.body.innerText : '';")
+        except Exception:
+            return "unknown"
+        return "expired" if _EXPIRED_RE.search(text or "") else "unknown"
+
+    def resume(self) -> bool:
+        """
+        Start of every login attempt: if the worker is still logged in (the last
+        error wasn't an auth failure) go back to the landing page and skip the
+        login.  Otherwise clean up through the worker's _retry() and return
+        False so it logs in from scratch.
+        """
+        if not self.worker.logged_in:
+            # a login that failed part-way leaves captcha / OTP and tabs behind
+            if not self.clean:
+                self.worker._retry()
+            self.clean = False      # until the next reset: a login attempt follows
+            return False
+        try:
+            ok = self._to_bank_tab() and self._on_landing()
+        except Exception:
+            ok = False
+        if ok:
+            self.resumed += 1
+            self.worker._send("↩️ Bank session still valid — resuming without a new login")
+            return True
+        self.worker._retry()
+        self.clean = False
+        return False
+
+    def _on_landing(self) -> bool:
+        if self.state() == "unknown":
+            self.worker.driver.back()     # step off an error page / half-loaded popup
+            try:
+                _wait_for(self.worker.driver, lambda d: self.state() != "unknown",
+                          10, f"{self.site} resume")
+            except TimeoutException:
+                return False
+        return self.state() == "valid"
+
+    def keep_alive(self) -> None:
+        """Between cycles: notice a logout early and keep a live session from idling out."""
+        driver = self.worker.driver
+        if not self.worker.logged_in:
+            return
+        try:
+            original = driver.current_window_handle
+            if not self._to_bank_tab():
+                return
+            if self.state() == "expired":
+                logger.info(f"[{self.worker.alias}] {self.site} session expired while idle")
+                self.worker._retry()             # clears logged_in → fresh login next
+                self.clean = True
+                return
+            clicked = driver.execute_script(_KEEPALIVE_JS)
+            if clicked:
+                logger.info(f"[{self.worker.alias}] {self.site} session prompt: clicked {clicked!r}")
+            path = SESSION_KEEPALIVE_URLS.get(self.site)
+            if path:
+                driver.execute_script("fetch(arguments[0], {credentials: 'include'});", path)
+            driver.switch_to.window(original)
+        except Exception as e:
+            logger.debug(f"[{self.worker.alias}] {self.site} keep-alive failed: {e!r}")
+
+
+# --- download tracking via CDP download events ---
+DOWNLOAD_TIMEOUT = getattr(config, "DOWNLOAD_TIMEOUT", 60)   # seconds
+
+
+class _Download:
+    """One expected download, routed into its own empty folder."""
+
+    def __init__(self, tracker, folder: str, alias: str):
+        self.tracker = tracker
+        self.folder  = folder
+        self.alias   = alias
+        self.path    = None
+        self.done    = threading.Event()
+
+    def _finished_files(self) -> list:
+        return [f for f in os.listdir(self.folder)
+                if not f.lower().endswith((".tmp", ".crdownload"))]
+
+    def _on_completed(self, name: Optional[str]) -> None:
+        # other contexts of the same Chrome report their downloads here too;
+        # ours is the one that landed in our folder
+        files = self._finished_files()
+        if files:
+            self.path = os.path.join(self.folder, name if name in files else files[0])
+            self.done.set()
+
+    def wait(self, timeout: float = DOWNLOAD_TIMEOUT) -> str:
+        """Path of the finished file; raises TimeoutException if none arrives."""
+        deadline = time.time() + timeout
+        try:
+            if self.tracker is not None and self.tracker.alive:
+                # short slices so /stop isn't held up by a slow download
+                while not self.done.wait(0.5) and time.time() < deadline:
+                    _check_cancel()
+            # no event stream → the folder only ever holds this request's file
+            while self.path is None and time.time() < deadline:
+                files = self._finished_files()
+                if files:
+                    self.path = os.path.join(self.folder, files[0])
+                    break
+                _sleep(0.5)
+        finally:
+            if self.tracker is not None:
+                self.tracker.forget(self)
+        if self.path is None:
+            raise TimeoutException(f"Download did not finish within {timeout}s")
+        _artifacts.add(self.alias, self.path)
+        return self.path
+
+
+class DownloadTracker:
+    """
+    Listens on a Chrome's browser-level _BrowserCDP session for
+    Browser.downloadWillBegin / downloadProgress, so a worker learns about its
+    file the moment Chrome finishes writing it instead of polling the folder.
+    """
+
+    def __init__(self, cdp: _BrowserCDP):
+        self.cdp      = cdp
+        self._lock    = threading.Lock()
+        self._names:   dict[str, str]  = {}      # guid → suggested file name
+        self._waiting: list[_Download] = []
+        cdp.on("Browser.downloadWillBegin", self._on_begin)
+        cdp.on("Browser.downloadProgress", self._on_progress)
+        cdp.on_close(self._on_closed)
+
+    @property
+    def alive(self) -> bool:
+        return self.cdp.alive
+
+    def _on_begin(self, params: dict) -> None:
+        self._names[params["guid"]] = params.get("suggestedFilename")
+
+    def _on_progress(self, params: dict) -> None:
+        if params.get("state") not in ("completed", "canceled"):
+            return
+        name = self._names.pop(params["guid"], None)
+        if params["state"] == "completed":
+            with self._lock:
+                waiting = list(self._waiting)
+            for download in waiting:
+                download._on_completed(name)
+
+    def _on_closed(self) -> None:
+        # Chrome gone or socket closed: wake everyone, they fall back to polling
+        with self._lock:
+            waiting = list(self._waiting)
+        for download in waiting:
+            download.done.set()
+
+    def expect(self, folder: str, alias: str, context_id: Optional[str] = None) -> _Download:
+        """Send the next download(s) of this Chrome / context into `folder`."""
+        params = {"behavior": "allow", "downloadPath": folder, "eventsEnabled": True}
+        if context_id:
+            params["browserContextId"] = context_id
+        self.cdp.send("Browser.setDownloadBehavior", **params)
+        download = _Download(self, folder, alias)
+        with self._lock:
+            self._waiting.append(download)
+        return download
+
+    def forget(self, download: _Download) -> None:
+        with self._lock:
+            if download in self._waiting:
+                self._waiting.remove(download)
+
+
+_trackers: dict[str, DownloadTracker] = {}   # debugger address → tracker
+_trackers_lock = threading.Lock()
+
+
+def _download_tracker(driver) -> DownloadTracker:
+    """Tracker on the Chrome's existing DevTools session (its own one for a plain Chrome)."""
+    address = driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+    with _trackers_lock:
+        tracker = _trackers.get(address)
+        if tracker is None or not tracker.alive:
+            # a context shares its host's session
+            cdp = driver.cdp if isinstance(driver, BrowserContextDriver) else None
+            if cdp is None or not cdp.alive:
+                cdp = _BrowserCDP(address)
+            tracker = _trackers[address] = DownloadTracker(cdp)
+        return tracker
+
+
+def _expect_download(worker) -> _Download:
+    """
+    Call right before clicking a download button: the file will land in a new
+    per-run folder of the alias (see ArtifactStore), and .wait() returns it.
+    """
+    folder = _artifacts.new_run(worker.alias)
+    context_id = getattr(worker.driver, "context_id", None)
+    try:
+        return _download_tracker(worker.driver).expect(folder, worker.alias, context_id)
+    except Exception as e:
+        logger.warning(f"[{worker.alias}] download events unavailable ({e!r}); polling {folder}")
+    # still route the file into the fresh folder so polling can't pick a stale one
+    if context_id:
+        worker.driver.cdp.send(
+            "Browser.setDownloadBehavior",
+            behavior="allow", downloadPath=folder, browserContextId=context_id,
+        )
+    else:
+        worker.driver.execute_cdp_cmd(
+            "Browser.setDownloadBehavior", {"behavior": "allow", "downloadPath": folder}
+        )
+    return _Download(None, folder, worker.alias)
+
+
+# --- direct AutoBank upload over HTTP (Selenium only as fallback) ---
+AUTOBANK_BASE        = "https://autobank.payatom.in"
+AUTOBANK_HTTP_UPLOAD = getattr(config, "AUTOBANK_HTTP_UPLOAD", True)
+# the upload endpoint must be configured: the form's own action falls back to
+# the page URL, and a re-rendered page can't tell success from rejection
+AUTOBANK_UPLOAD_URL  = getattr(config, "AUTOBANK_UPLOAD_URL", None)
+# the endpoint answers JSON; this field says whether the upload was taken
+AUTOBANK_STATUS_FIELD = getattr(config, "AUTOBANK_STATUS_FIELD", "status")
+_AUTOBANK_OK     = ("success", "ok", "true", "1", "uploaded")
+_AUTOBANK_FAILED = ("error", "fail", "failed", "false", "0")
+
+_autobank_form: dict = {}                          # field names, bank → option value
+_http_sessions: dict[str, requests.Session] = {}   # profile/alias → keep-alive session
+_http_lock = threading.Lock()
+
+
+def _learn_autobank_form(driver) -> None:
+    """Read field names and bank option values from an open bankupload.php."""
+    try:
+        form = driver.execute_script("""
+            const f = document.getElementById('file_input');
+            if (!f) return null;
+            const bank = document.getElementById('bank');
+            const acct = document.getElementById('account_number');
+            return {
+                file:    f.name || f.id,
+                bank:    bank ? (bank.name || bank.id) : 'bank',
+                account: acct ? (acct.name || acct.id) : 'account_number',
+                banks:   bank ? Object.fromEntries(
+                             [...bank.options].map(o => [o.text.trim(), o.value])) : {},
+            };
+        """)
+    except Exception:
+        return
+    if form:
+        with _http_lock:
+            _autobank_form.update(form)
+
+
+def _autobank_cookies(driver) -> list:
+    """AutoBank session cookies of `driver` (empty if they can't be read)."""
+    try:
+        return driver.execute_cdp_cmd(
+            "Network.getCookies", {"urls": [AUTOBANK_BASE + "/"]}
+        )["cookies"]
+    except Exception:
+        return []
+
+
+def _upload_via_http(job: dict) -> Optional[bool]:
+    """
+    POST the statement straight to AutoBank with the browser's session cookies.
+      True  → AutoBank's JSON status confirms the upload
+      False → nothing was accepted (no endpoint, form not learned yet, no
+              cookies, session expired), so the worker can use the browser
+      None  → posted, but the answer is not the JSON contract: the upload may
+              have gone through, so it must not be sent again
+    Raises on an explicit rejection or HTTP error so the job is retried.
+    """
+    url  = AUTOBANK_UPLOAD_URL
+    form = dict(_autobank_form)
+    if not AUTOBANK_HTTP_UPLOAD or not url or job["bank"] not in form.get("banks", {}):
+        return False
+    if not job["cookies"]:
+        return False
+
+    # 1) one pooled session per Chrome profile keeps the TLS connection warm
+    with _http_lock:
+        session = _http_sessions.setdefault(job["session_key"], requests.Session())
+    session.cookies.clear()
+    for c in job["cookies"]:
+        session.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"])
+
+    # 2) same multipart form the drop-zone submits
+    with open(job["path"], "rb") as fh:
+        resp = session.post(
+            url,
+            data={
+                form["bank"]:    form["banks"][job["bank"]],
+                form["account"]: job["account"],
+            },
+            files={form["file"]: (os.path.basename(job["path"]), fh)},
+            headers={"Referer": f"{AUTOBANK_BASE}/bankupload.php"},
+            timeout=60,
+        )
+
+    # 3) a signed-out operator is bounced to the login page before the upload runs
+    if resp.status_code in (401, 403) or "operator_index" in resp.url:
+        logger.info(f"[{job['alias']}] AutoBank session invalid for direct upload — using browser")
+        return False
+    resp.raise_for_status()
+
+    # 4) only the JSON status decides; the journal marks the job uploaded and
+    #    dedup never sends this statement again
+    try:
+        body = resp.json()
+    except ValueError:
+        body = None
+    status = str(body.get(AUTOBANK_STATUS_FIELD, "")).lower() if isinstance(body, dict) else ""
+    if status in _AUTOBANK_FAILED:
+        raise RuntimeError(f"AutoBank rejected upload: {body.get('message', body)}")
+    if status in _AUTOBANK_OK:
+        return True
+    logger.warning(f"[{job['alias']}] AutoBank answered without a {AUTOBANK_STATUS_FIELD!r} "
+                   f"status (HTTP {resp.status_code}) — outcome unknown")
+    return None
+
+
+# --- durable upload journal (SQLite) ---
+UPLOAD_JOURNAL_PATH = getattr(config, "UPLOAD_JOURNAL_PATH", "uploads.db")
+
+
+class UploadJournal:
+    """
+    One row per statement handed to the uploader:
+    downloaded → queued → uploaded | unconfirmed | failed.  Survives /restart and
+    crashes, so pending uploads are resumed and finished (or possibly finished)
+    ones are never sent twice.
+    """
+
+    def __init__(self, path: str = UPLOAD_JOURNAL_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute("""
+              CREATE TABLE IF NOT EXISTS statements (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                alias       TEXT    NOT NULL,
+                bank        TEXT    NOT NULL,
+                account     TEXT    NOT NULL,
+                path        TEXT    NOT NULL,
+                digest      TEXT    NOT NULL,
+                status      TEXT    NOT NULL,
+                attempts    INTEGER NOT NULL DEFAULT 0,
+                error       TEXT,
+                created_at  TEXT    NOT NULL,
+                updated_at  TEXT    NOT NULL
+              )
+            """)
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS statements_alias_digest ON statements (alias, digest)"
+            )
+            self.conn.commit()
+
+    def record(self, alias: str, bank: str, account: str, path: str, digest: str) -> int:
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO statements (alias, bank, account, path, digest, status, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, 'downloaded', ?, ?)",
+                (alias, bank, account, path, digest, now, now),
+            )
+            self.conn.commit()
+            return cur.lastrowid
+
+    def mark(self, row_id: int, status: str, attempts: int = None, error: str = None) -> None:
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            self.conn.execute(
+                "UPDATE statements SET status = ?, attempts = COALESCE(?, attempts),"
+                " error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, error, now, row_id),
+            )
+            self.conn.commit()
+
+    def uploaded(self, alias: str, digest: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM statements WHERE alias = ? AND digest = ?"
+                " AND status IN ('uploaded', 'unconfirmed') LIMIT 1",
+                (alias, digest),
+            ).fetchone()
+        return row is not None
+
+    def pending(self) -> list:
+        """Rows left downloaded/queued by a previous run, oldest first."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, alias, bank, account, path, digest FROM statements"
+                " WHERE status IN ('downloaded', 'queued') ORDER BY id"
+            ).fetchall()
+
+
+_journal = UploadJournal()
+
+
+# --- upload service: queue, bounded concurrency, backoff with jitter ---
+UPLOAD_CONCURRENCY  = getattr(config, "UPLOAD_CONCURRENCY", 3)
+UPLOAD_MAX_ATTEMPTS = getattr(config, "UPLOAD_MAX_ATTEMPTS", 5)
+UPLOAD_BACKOFF_BASE = getattr(config, "UPLOAD_BACKOFF_BASE", 2)     # seconds
+UPLOAD_BACKOFF_CAP  = getattr(config, "UPLOAD_BACKOFF_CAP", 120)    # seconds
+
+
+class UploadService:
+    """
+    Uploads statements off the worker threads.  Workers hand over a job and
+    carry on with their bank; a fixed number of uploader threads post it over
+    HTTP, retrying with jittered exponential backoff.  When the direct upload
+    isn't possible the job goes back to the worker's `pending_uploads`, which
+    the worker drains through its own browser (Selenium isn't thread-safe).
+    """
+
+    def __init__(self, concurrency: int = UPLOAD_CONCURRENCY):
+        self.concurrency = concurrency
+        self._queue  = queue.Queue()
+        self._lock   = threading.Lock()
+        self._stats: dict[str, dict] = {}    # bank → counters
+
+    def start(self):
+        for i in range(self.concurrency):
+            threading.Thread(target=self._run, name=f"upload-{i}", daemon=True).start()
+
+    def submit(self, worker, bank: str, path: str, digest: str) -> None:
+        """Queue a statement; cookies are read here, on the worker's own thread."""
+        account = worker.cred["account_number"]
+        job = {
+            "worker":      worker,
+            "alias":       worker.alias,
+            "bank":        bank,
+            "account":     account,
+            "path":        path,
+            "digest":      digest,
+            "cookies":     _autobank_cookies(worker.driver),
+            "session_key": worker.profile_dir or worker.alias,
+            "attempt":     0,
+            "journal_id":  _journal.record(worker.alias, bank, account, path, digest),
+        }
+        self._enqueue(job)
+
+    def resume(self, row, cookies: list) -> None:
+        """Re-queue a journal row left pending by a previous run."""
+        row_id, alias, bank, account, path, digest = row
+        job = {
+            "worker":      workers.get(alias),
+            "alias":       alias,
+            "bank":        bank,
+            "account":     account,
+            "path":        path,
+            "digest":      digest,
+            "cookies":     cookies,
+            "session_key": alias,
+            "attempt":     0,
+            "journal_id":  row_id,
+        }
+        self._enqueue(job)
+
+    def _enqueue(self, job: dict) -> None:
+        _journal.mark(job["journal_id"], "queued")
+        self._count(job["bank"], "queued")
+        self._queue.put(job)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {bank: dict(st) for bank, st in self._stats.items()}
+
+    def _count(self, bank: str, key: str, amount: float = 1) -> None:
+        with self._lock:
+            st = self._stats.setdefault(
+                bank, {"queued": 0, "direct": 0, "browser": 0, "retries": 0, "failed": 0,
+                       "unconfirmed": 0, "secs": 0.0}
+            )
+            st[key] += amount
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._attempt(job)
+            except Exception:
+                logger.exception(f"[Upload] unexpected error for {job['alias']}")
+            finally:
+                self._queue.task_done()
+
+    def _attempt(self, job: dict) -> None:
+        job["attempt"] += 1
+        started = time.time()
+        try:
+            uploaded = _upload_via_http(job)
+        except Exception as e:
+            if job["attempt"] >= UPLOAD_MAX_ATTEMPTS:
+                return self.give_up(job, e)
+            # exponential backoff, full ±50% jitter so retries don't bunch up
+            delay = min(UPLOAD_BACKOFF_CAP, UPLOAD_BACKOFF_BASE * 2 ** (job["attempt"] - 1))
+            delay *= random.uniform(0.5, 1.5)
+            self._count(job["bank"], "retries")
+            logger.warning(
+                f"[Upload] {job['alias']} attempt {job['attempt']}/{UPLOAD_MAX_ATTEMPTS} "
+                f"failed ({e!r}); retrying in {delay:.0f}s"
+            )
+            timer = threading.Timer(delay, self._queue.put, args=(job,))
+            timer.daemon = True
+            timer.start()
+            return
+
+        if uploaded is None:
+            return self.unconfirmed(job)
+        if not uploaded:
+            # the worker that downloaded it may have been stopped since; only
+            # the alias's running worker drains pending_uploads
+            worker = workers.get(job["alias"])
+            if worker is None or not worker.is_alive():
+                # stays queued in the journal for the next start; drop the dedup
+                # claim so a restarted alias fetches and uploads it again
+                if _last_upload_digest.get(job["alias"]) == job["digest"]:
+                    _last_upload_digest.pop(job["alias"], None)
+                logger.info(f"[Upload] {job['alias']} needs the browser upload; left pending")
+                return
+            job["worker"] = worker
+            worker.pending_uploads.append(job)   # worker drives the browser
+            return
+        self._count(job["bank"], "direct")
+        self._count(job["bank"], "secs", time.time() - started)
+        _journal.mark(job["journal_id"], "uploaded", attempts=job["attempt"])
+        _job_send(job, "✅ AutoBank upload succeeded (direct)")
+
+    def unconfirmed(self, job: dict) -> None:
+        """Posted but not confirmed: keep the dedup claim and let the operator check."""
+        self._count(job["bank"], "unconfirmed")
+        _journal.mark(job["journal_id"], "unconfirmed", attempts=job["attempt"])
+        _job_send(job, "❓ AutoBank upload sent but not confirmed — please check it in AutoBank; "
+                       "it won't be sent again")
+
+    def browser_done(self, job: dict) -> None:
+        self._count(job["bank"], "browser")
+        _journal.mark(job["journal_id"], "uploaded", attempts=job["attempt"])
+
+    def give_up(self, job: dict, error: Exception) -> None:
+        """Final failure: report it and make the next cycle fetch + upload again."""
+        self._count(job["bank"], "failed")
+        alias = job["alias"]
+        if _last_upload_digest.get(alias) == job["digest"]:
+            _last_upload_digest.pop(alias, None)
+        if alias in _balance_gates:
+            _balance_gates[alias].last_fetch = 0.0
+        _journal.mark(job["journal_id"], "failed", attempts=job["attempt"], error=repr(error))
+        _job_send(job, f"❌ AutoBank upload failed after {job['attempt']} attempt(s): {error!r}")
+
+
+_uploads = UploadService()
+
+
+def _job_send(job: dict, text: str) -> None:
+    """Report on the alias's worker if there is one, else to the admin chat."""
+    if job["worker"] is not None:
+        job["worker"]._send(text)
+    else:
+        _notify(f"[{job['alias']}] {text}")
+
+
+def _idle_autobank_cookies() -> Optional[list]:
+    """AutoBank cookies of a free warm Chrome, checked out of the pool for the read."""
+    with _pool_lock:
+        idle = [p for p in dict.fromkeys(_free_profiles) if p in _drivers]
+    for profile in idle:
+        if not _checkout_idle(profile):
+            continue                      # leased meanwhile: a worker drives it now
+        try:
+            driver = _drivers.get(profile)
+            if driver is not None:
+                return _autobank_cookies(driver)
+        finally:
+            _checkin_idle(profile)
+    return None
+
+
+def _resume_pending_uploads():
+    """Re-queue uploads a previous run left unfinished (after /restart or a crash)."""
+    rows = _journal.pending()
+    if not rows:
+        return
+    # cookies + form field names come from a warm pooled Chrome nobody has leased
+    deadline = time.time() + 120
+    cookies = None
+    while cookies is None and time.time() < deadline:
+        if _autobank_form:
+            cookies = _idle_autobank_cookies()
+        if cookies is None:
+            time.sleep(2)
+    if cookies is None:
+        # no direct upload then: each job goes to its alias's worker (or stays
+        # in the journal until that alias runs)
+        logger.warning(f"[Upload] no idle Chrome for cookies; {len(rows)} pending upload(s) "
+                       "left to their workers")
+        cookies = []
+
+    resumed = 0
+    for row in rows:
+        row_id, alias, _, _, path, digest = row
+        if _journal.uploaded(alias, digest):
+            _journal.mark(row_id, "uploaded")      # same statement already went up
+            continue
+        if not os.path.exists(path):
+            _journal.mark(row_id, "failed", error="file missing")
+            continue
+        _last_upload_digest[alias] = digest
+        _uploads.resume(row, cookies)
+        resumed += 1
+    logger.info(f"[Upload] resumed {resumed} pending upload(s) from the journal")
+
+
+def _drain_browser_uploads(worker) -> None:
+    """Run the uploads the service handed back, through the worker's own Chrome."""
+    while worker.pending_uploads:
+        job = worker.pending_uploads.popleft()
+        try:
+            worker._upload_via_browser(job["path"])
+        except Exception as e:
+            _uploads.give_up(job, e)
+            raise  # same as before: a failed upload restarts the bank cycle
+        _uploads.browser_done(job)
+
+
+def _autobank_tab(worker, reload: bool = False) -> None:
+    """
+    Switch to the worker's long-lived AutoBank tab.  The tab is only reopened
+    when it has gone away, and only re-signed-in when it no longer shows the
+    upload form (or `reload` is set after a failed attempt).
+    """
+    driver = worker.driver
+    handle = getattr(worker, "autobank_win", None)
+    try:
+        if handle not in driver.window_handles:
+            raise NoSuchWindowException(handle)
+        driver.switch_to.window(handle)
+        healthy = ("bankupload.php" in driver.current_url
+                   and driver.find_elements(By.ID, "drop-zone"))
+    except WebDriverException:
+        # tab closed (e.g. by _retry) or crashed → open a new one
+        old_handles = set(driver.window_handles)
+        driver.execute_script("window.open('about:blank');")
+        handle = (set(driver.window_handles) - old_handles).pop()
+        driver.switch_to.window(handle)
+        _apply_url_blocklist(driver, "AutoBank")
+        worker.autobank_win = handle
+        healthy = False
+    if healthy and not reload:
+        return
+
+    # sign in if needed, then land on the upload page
+    driver.get(f"{AUTOBANK_BASE}/operator_index.php")
+    try:
+        WebDriverWait(driver, 5).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "a.auth-form-btn"))
+        ).click()
+    except TimeoutException:
+        pass  # already logged in
+    WebDriverWait(driver, 60).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, "nav.sidebar"))
+    )
+    driver.get(f"{AUTOBANK_BASE}/bankupload.php")
+    WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.ID, "drop-zone")))
+    _learn_autobank_form(driver)
+
+
+def _submit_autobank_form(driver, bank: str, account_number: str, path: str,
+                          timeout: int = 60) -> None:
+    """Reset the upload form in the current tab, submit one file and wait for success."""
+    # drop the previous alert and file so we wait for *this* upload's result
+    driver.execute_script("""
+        if (window.Swal) Swal.close();
+        document.querySelectorAll('.swal2-container').forEach(e => e.remove());
+        const f = document.getElementById('file_input');
+        if (f) f.value = '';
+    """)
+    Select(driver.find_element(By.ID, "bank")).select_by_visible_text(bank)
+    acct = driver.find_element(By.ID, "account_number")
+    acct.clear()
+    acct.send_keys(account_number)
+    driver.find_element(By.ID, "file_input").send_keys(path)
+    WebDriverWait(driver, timeout).until(
+        EC.visibility_of_element_located((By.CSS_SELECTOR, ".swal2-icon-success"))
+    )
+
+
+def _browser_upload(worker, bank: str, path: str, timeout: int, screenshot) -> None:
+    """Upload through the worker's AutoBank tab, up to 5 attempts; the last failure is raised."""
+    driver   = worker.driver
+    original = driver.current_window_handle
+
+    max_attempts = 5
+    try:
+        for attempt in range(1, max_attempts + 1):
+            try:
+                # 1) long-lived AutoBank tab, already on bankupload.php
+                _autobank_tab(worker, reload=attempt > 1)
+
+                # 2) reset the form, select the bank, fill account + file, wait for success
+                _submit_autobank_form(
+                    driver, bank, worker.cred["account_number"], path, timeout=timeout
+                )
+                worker._send(f"✅ AutoBank upload succeeded (attempt {attempt}/{max_attempts})")
+                worker._send(f"[DEBUG] XLS path: {path})")
+                break
+
+            except Exception as e:
+                try:
+                    screenshot()
+                except Exception:
+                    pass
+                worker._send(f"⚠️ AutoBank upload failed (attempt {attempt}/{max_attempts}): {e!r}")
+                if attempt == max_attempts:
+                    raise  # bubble up to the full retry cycle
+                _sleep(2)  # backoff before re-posting to AutoBank, not a page wait
+    finally:
+        # the AutoBank tab stays open for the next cycle
+        driver.switch_to.window(original)
+
+
+# --- balance change gate: only fetch the statement when the balance moved ---
+BALANCE_GATE_MAX_STALENESS = getattr(config, "BALANCE_GATE_MAX_STALENESS", 900)  # seconds
+
+
+class BalanceChangeGate:
+    """
+    Per-alias decision whether a cycle needs the statement download: only when
+    the balance differs from the last fetched one, or that fetch is older than
+    `max_staleness` seconds (catches credit+debit pairs that net to zero).
+    """
+
+    def __init__(self, alias: str, max_staleness: float = BALANCE_GATE_MAX_STALENESS):
+        self.alias         = alias
+        self.max_staleness = max_staleness
+        self.last_balance  = None
+        self.last_fetch    = 0.0
+        self.skipped       = 0
+        self.executed      = 0
+
+    def should_fetch(self, balance) -> bool:
+        fresh = time.time() - self.last_fetch < self.max_staleness
+        if self.last_balance is not None and balance != self.last_balance:
+            _scheduler.note_activity(self.alias)
+        if balance == self.last_balance and fresh:
+            self.skipped += 1
+            return False
+        self.executed += 1
+        return True
+
+    def fetched(self, balance) -> None:
+        """Record a completed statement fetch for `balance`."""
+        self.last_balance = balance
+        self.last_fetch   = time.time()
+
+
+_balance_gates: dict[str, BalanceChangeGate] = {}   # alias → gate (survives /stop + /run)
+
+
+def _balance_gate(alias: str) -> BalanceChangeGate:
+    if alias not in _balance_gates:
+        _balance_gates[alias] = BalanceChangeGate(alias)
+    return _balance_gates[alias]
+
+
+# --- incremental transaction deltas per alias ---
+DELTA_WINDOW = getattr(config, "DELTA_WINDOW", 2000)   # fingerprints remembered per alias
+
+# AutoBank's label → statements.BANK_FORMATS key
+_STATEMENT_BANK = {"Kerala Gramin Bank": "KGB"}
+
+
+class TransactionHighWaterMark:
+    """
+    Remembers the last DELTA_WINDOW transaction fingerprints (reference +
+    amounts + running balance) per alias, so each new download only yields
+    the rows not seen before.  Memory per alias is bounded by the window.
+    """
+
+    def __init__(self, window: int = DELTA_WINDOW):
+        self.window = window
+        self._seen: dict[str, tuple] = {}    # alias → (deque, set)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(txn) -> int:
+        key = f"{txn.date}|{txn.reference}|{txn.debit}|{txn.credit}|{txn.balance}"
+        # signed so it fits an SQLite INTEGER
+        return int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True
+        )
+
+    def new_rows(self, alias: str, txns) -> Optional[list]:
+        """Rows of `txns` not seen before; None the first time an alias is seen."""
+        with self._lock:
+            first = alias not in self._seen
+            order, seen = self._seen.setdefault(alias, (deque(), set()))
+            fresh = []
+            for txn in txns:
+                fp = self._fingerprint(txn)
+                if fp in seen:
+                    continue
+                seen.add(fp)
+                order.append(fp)
+                if len(order) > self.window:
+                    seen.discard(order.popleft())
+                fresh.append(txn)
+        return None if first else fresh
+
+
+_high_water = TransactionHighWaterMark()
+
+
+# --- transaction store (SQLite, optional FTS5 on narration) ---
+TXN_DB_PATH = getattr(config, "TXN_DB_PATH", "transactions.db")
+
+
+class TransactionStore:
+    """Every parsed transaction of every alias, indexed for /txn lookups."""
+
+    def __init__(self, path: str = TXN_DB_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute("""
+              CREATE TABLE IF NOT EXISTS transactions (
+                id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                alias        TEXT    NOT NULL,
+                bank         TEXT    NOT NULL,
+                txn_date     TEXT    NOT NULL,
+                narration    TEXT    NOT NULL,
+                debit        REAL    NOT NULL,
+                credit       REAL    NOT NULL,
+                balance      REAL,
+                reference    TEXT    NOT NULL,
+                fingerprint  INTEGER NOT NULL,
+                seen_at      TEXT    NOT NULL,
+                UNIQUE (alias, fingerprint)
+              )
+            """)
+            for col in ("credit", "debit", "txn_date"):
+                c.execute(f"CREATE INDEX IF NOT EXISTS transactions_{col} ON transactions ({col})")
+            # LIKE is case-insensitive, so the prefix search can only use a NOCASE index
+            c.execute("DROP INDEX IF EXISTS transactions_reference")
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS transactions_reference_nocase"
+                " ON transactions (reference COLLATE NOCASE)"
+            )
+            # full-text search on narration, where SQLite was built with FTS5
+            try:
+                c.execute("""
+                  CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts
+                  USING fts5(narration, content='transactions', content_rowid='id')
+                """)
+                c.execute("""
+                  CREATE TRIGGER IF NOT EXISTS transactions_fts_insert
+                  AFTER INSERT ON transactions BEGIN
+                    INSERT INTO transactions_fts (rowid, narration) VALUES (new.id, new.narration);
+                  END
+                """)
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.fts = False
+            self.conn.commit()
+
+    def add(self, alias: str, txns) -> list:
+        """Insert `txns`; returns the ones that weren't stored already."""
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (alias, t.bank, t.date.isoformat(), t.narration, round(t.debit, 2),
+             round(t.credit, 2), t.balance, t.reference,
+             TransactionHighWaterMark._fingerprint(t), now)
+            for t in txns
+        ]
+        added = []
+        with self._lock:
+            for txn, row in zip(txns, rows):
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO transactions (alias, bank, txn_date, narration, debit,"
+                    " credit, balance, reference, fingerprint, seen_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                if cur.rowcount:
+                    added.append(txn)
+            self.conn.commit()
+        return added
+
+    def search(self, query: str, on: Optional[date] = None, limit: int = 20) -> list:
+        """Match an amount, a reference (prefix) or narration text, newest first."""
+        cols = "alias, txn_date, debit, credit, reference, narration"
+        date_sql, date_args = ("AND txn_date = ?", [on.isoformat()]) if on else ("", [])
+        amount = query.replace(",", "").lstrip("₹")
+        if re.fullmatch(r"\d+(\.\d{1,2})?", amount):
+            sql = (f"SELECT {cols} FROM transactions WHERE (credit = ? OR debit = ?) {date_sql}"
+                   " ORDER BY txn_date DESC, id DESC LIMIT ?")
+            args = [float(amount), float(amount), *date_args, limit]
+        elif self.fts:
+            phrase = '"' + query.replace('"', '""') + '"'
+            sql = (f"SELECT {cols} FROM transactions WHERE (reference LIKE ? OR id IN"
+                   " (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?))"
+                   f" {date_sql} ORDER BY txn_date DESC, id DESC LIMIT ?")
+            args = [query + "%", phrase, *date_args, limit]
+        else:
+            sql = (f"SELECT {cols} FROM transactions WHERE (reference LIKE ? OR narration LIKE ?)"
+                   f" {date_sql} ORDER BY txn_date DESC, id DESC LIMIT ?")
+            args = [query + "%", f"%{query}%", *date_args, limit]
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+
+_txn_store = TransactionStore()
+
+# columnar copy of the same rows for month-end analytics (see txn_archive.py)
+TXN_ARCHIVE_ROOT = getattr(config, "TXN_ARCHIVE_ROOT", os.path.join(os.getcwd(), "txn_archive"))
+_txn_archive = txn_archive.TxnArchive(TXN_ARCHIVE_ROOT)
+# per-day, per-alias inflow / outflow for /flows
+FLOWS_DAYS = getattr(config, "FLOWS_DAYS", 31)
+_flows = txn_archive.DailyFlows(_txn_archive, FLOWS_DAYS)
+
+
+def _post_new_transactions(worker, bank: str, path: str) -> None:
+    """Parse the statement and post a one-line summary of rows not seen before."""
+    try:
+        txns = list(statements.parse_statement(path, _STATEMENT_BANK.get(bank, bank)))
+    except Exception as e:
+        logger.info(f"[{worker.alias}] statement not parsed for deltas: {e!r}")
+        return
+    fresh = _high_water.new_rows(worker.alias, txns)
+    # first statement since start-up: store it all (duplicates are ignored)
+    added = _txn_store.add(worker.alias, txns if fresh is None else fresh)
+    if added:
+        _txn_archive.append(worker.alias, added, TransactionHighWaterMark._fingerprint)
+        _flows.add(worker.alias, added)
+    if not fresh:
+        return  # first statement only seeds the mark
+    _scheduler.note_activity(worker.alias)
+    credits = [t.credit for t in fresh if t.credit]
+    debits  = [t.debit for t in fresh if t.debit]
+    # the 💰 balance line stays as is (balance_bot parses it); this is extra
+    worker._send(
+        f"🧾 {len(credits)} new credit(s) +{sum(credits):,.2f} / "
+        f"{len(debits)} new debit(s) -{sum(debits):,.2f}"
+    )
+
+
+# --- statement dedup: skip uploads whose content hasn't changed ---
+_last_upload_digest: dict[str, str] = {}   # alias → digest of last uploaded statement
+_dedup_skips: dict[str, int] = {}          # alias → uploads skipped as unchanged
+
+
+def _upload_statement(worker, bank: str, path: str) -> None:
+    """
+    Handle one downloaded statement: unless it matches the alias's last upload,
+    post its new transactions and queue it for AutoBank.
+    """
+    digest = statements.statement_digest(path)
+    if _last_upload_digest.get(worker.alias) == digest or _journal.uploaded(worker.alias, digest):
+        _dedup_skips[worker.alias] = _dedup_skips.get(worker.alias, 0) + 1
+        logger.info(f"[{worker.alias}] statement unchanged — AutoBank upload skipped")
+        return
+    _post_new_transactions(worker, bank, path)
+
+    # claimed now so a re-download of the same file isn't queued twice;
+    # released again by UploadService.give_up() if the upload never lands
+    _last_upload_digest[worker.alias] = digest
+    _uploads.submit(worker, bank, path, digest)
+
+
+# --- per-Chrome resource monitor with automatic recycling ---
+RESOURCE_SAMPLE_INTERVAL = getattr(config, "RESOURCE_SAMPLE_INTERVAL", 60)
+RECYCLE_RSS_MB           = getattr(config, "RECYCLE_RSS_MB", 2048)   # 0 disables
+RECYCLE_CPU_PCT          = getattr(config, "RECYCLE_CPU_PCT", 0)     # 0 disables
+RECYCLE_CPU_SAMPLES      = 3          # consecutive hot samples before recycling
+HOST_DRAIN_TIMEOUT       = getattr(config, "HOST_DRAIN_TIMEOUT", 900)  # s to wait for co-tenant contexts
+
+# keyed by Chrome, i.e. _slot_host(slot): with CONTEXTS_PER_CHROME > 1 all
+# contexts of a host share one process tree and are sampled / recycled together
+_resource_samples: dict[str, dict] = {}   # host profile_dir → latest sample
+_recycle_requested: set[str] = set()      # hosts to restart once their slots let go
+_cpu_strikes: dict[str, int] = {}
+_proc_cache: dict[int, psutil.Process] = {}
+
+
+def _chrome_processes(driver) -> list:
+    """chromedriver + every Chrome process it spawned (renderers, GPU, …)."""
+    owner = getattr(driver, "host", driver)      # contexts share their host's tree
+    root_pid = owner.service.process.pid
+    procs = []
+    for proc in [psutil.Process(root_pid)] + psutil.Process(root_pid).children(recursive=True):
+        # reuse Process objects so cpu_percent() measures since the last sample
+        procs.append(_proc_cache.setdefault(proc.pid, proc))
+    return procs
+
+
+def _sample_driver(driver) -> dict:
+    rss = cpu = 0.0
+    procs = _chrome_processes(driver)
+    for proc in procs:
+        try:
+            rss += proc.memory_info().rss
+            cpu += proc.cpu_percent(interval=None)
+        except psutil.Error:
+            continue
+    return {"rss_mb": rss / 2**20, "cpu": cpu, "procs": len(procs),
+            "pids": [p.pid for p in procs], "at": time.time()}
+
+
+def _recycle_due(profile: str) -> bool:
+    """Is the Chrome carrying pool slot `profile` flagged for a restart?"""
+    with _pool_lock:
+        return _slot_host(profile) in _recycle_requested
+
+
+def _recycle_done(host: str) -> None:
+    with _pool_lock:
+        _recycle_requested.discard(host)
+        _cpu_strikes.pop(host, None)
+        _resource_samples.pop(host, None)
+
+
+def _recycle_profile(profile: str):
+    """
+    Replace a slot's Chrome with a fresh one and return the new driver.  A
+    multiplexing host only goes once its last context is gone, so wait for
+    the other slots on it (busy ones leave at the end of their cycle) before
+    carving the new context out of the restarted host.
+    """
+    host = _slot_host(profile)
+    with _hosts_lock:
+        old_host = _hosts.get(host)
+    _shutdown_profile(profile)          # stops the host with its last context
+    deadline = time.time() + HOST_DRAIN_TIMEOUT
+    while old_host is not None and _hosts.get(host) is old_host and time.time() < deadline:
+        _sleep(1)
+    if old_host is not None and _hosts.get(host) is old_host:
+        logger.warning(f"[Monitor] {os.path.basename(host)} still has busy contexts — not restarted")
+    _recycle_done(host)
+    driver = _launch_profile(profile)
+    with _pool_lock:
+        if profile in _profile_assignments.values():
+            _active[profile] = True
+    return driver
+
+
+def _recycle_worker_browser(worker) -> bool:
+    """
+    Called by a worker between cycles: if its Chrome was flagged by the monitor,
+    swap in a fresh one so the next loop logs in on a clean browser.
+    """
+    profile = getattr(worker, "profile_dir", None)
+    if not profile or not getattr(worker, "reused_driver", True) or not _recycle_due(profile):
+        return False
+    sample = _resource_samples.get(_slot_host(profile), {})
+    shared = " (once the other sessions on it finish their cycle)" if CONTEXTS_PER_CHROME > 1 else ""
+    worker._send(
+        f"♻️ Chrome over its limit ({sample.get('rss_mb', 0):.0f} MB, "
+        f"{sample.get('cpu', 0):.0f}% CPU) — restarting it{shared} and logging in again…"
+    )
+    worker.driver    = _recycle_profile(profile)
+    worker.logged_in = False
+    if getattr(worker, "session", None):
+        worker.session.clean = True      # fresh Chrome: nothing to undo before logging in
+    return True
+
+
+def _resource_monitor_loop():
+    """Sample RSS/CPU once per Chrome process tree and flag the ones over their limits."""
+    while True:
+        time.sleep(RESOURCE_SAMPLE_INTERVAL)
+        hosts = {}
+        for profile, driver in list(_drivers.items()):
+            hosts.setdefault(_slot_host(profile), driver)   # any slot stands for its host
+
+        seen_pids = set()
+        for host, driver in hosts.items():
+            try:
+                sample = _sample_driver(driver)
+            except (psutil.Error, AttributeError):
+                continue
+            seen_pids.update(sample.pop("pids"))
+            _resource_samples[host] = sample
+
+            hot = RECYCLE_CPU_PCT and sample["cpu"] > RECYCLE_CPU_PCT
+            _cpu_strikes[host] = _cpu_strikes.get(host, 0) + 1 if hot else 0
+            over_rss = RECYCLE_RSS_MB and sample["rss_mb"] > RECYCLE_RSS_MB
+            if over_rss or _cpu_strikes[host] >= RECYCLE_CPU_SAMPLES:
+                with _pool_lock:
+                    if host not in _recycle_requested:    # draining hosts are flagged once
+                        logger.warning(
+                            f"[Monitor] {os.path.basename(host)} over limit "
+                            f"({sample['rss_mb']:.0f} MB, {sample['cpu']:.0f}% CPU) — recycling"
+                        )
+                    _recycle_requested.add(host)
+
+        # forget processes that have exited
+        for pid in list(_proc_cache):
+            if pid not in seen_pids:
+                _proc_cache.pop(pid, None)
+        for host in list(_resource_samples):
+            if host not in hosts:
+                _resource_samples.pop(host, None)
+
+
+# --- cycle scheduler: one min-heap of next-due times for every running alias ---
+CYCLE_INTERVAL = getattr(config, "CYCLE_INTERVAL", 60)    # seconds between cycles (starting point)
+CYCLE_JITTER   = getattr(config, "CYCLE_JITTER", 5)       # ± seconds, keeps aliases apart
+CYCLE_MIN_INTERVAL = getattr(config, "CYCLE_MIN_INTERVAL", 30)    # during bursts
+CYCLE_MAX_INTERVAL = getattr(config, "CYCLE_MAX_INTERVAL", 600)   # idle / overnight
+CYCLE_IDLE_BACKOFF = getattr(config, "CYCLE_IDLE_BACKOFF", 1.5)   # × per quiet cycle
+CYCLE_NIGHT_HOURS  = getattr(config, "CYCLE_NIGHT_HOURS", (0, 6)) # [start, end) local hours
+# alias → {"interval", "jitter", "min", "max"}, any subset
+CYCLE_OVERRIDES: dict = getattr(config, "CYCLE_OVERRIDES", {})
+
+
+def _worker_stopped(worker) -> bool:
+    stop = getattr(worker, "stop_evt", None) or getattr(worker, "_stop_event", None)
+    return stop is not None and stop.is_set()
+
+
+class CycleScheduler:
+    """
+    Fixed-rate scheduling of worker cycles.  Each alias' next cycle is due one
+    interval (± jitter) after its previous due time, not after the previous
+    cycle finished, so long cycles don't make the period drift.  A cycle that
+    is still running when its next one falls due counts as a missed deadline
+    and the schedule restarts after a `min`-interval pause.
+
+    The interval adapts to the account: a cycle that saw the balance move or
+    new transactions halves it (down to `min`), a quiet one stretches it by
+    CYCLE_IDLE_BACKOFF (up to `max`), and quiet cycles at night go straight
+    to `max`.
+    """
+
+    def __init__(self):
+        self._cond    = threading.Condition()
+        self._heap: list = []                  # (due, seq, alias)
+        self._entries: dict[str, dict] = {}    # alias → schedule state
+        self._seq     = 0
+
+    def settings(self, alias: str) -> dict:
+        return {
+            "interval": CYCLE_INTERVAL, "jitter": CYCLE_JITTER,
+            "min": CYCLE_MIN_INTERVAL, "max": CYCLE_MAX_INTERVAL,
+            **CYCLE_OVERRIDES.get(alias, {}),
+        }
+
+    def note_activity(self, alias: str) -> None:
+        """The current cycle of `alias` saw a balance change or new transactions."""
+        with self._cond:
+            entry = self._entries.get(alias)
+            if entry is not None:
+                entry["active"] = True
+
+    def _adapt(self, entry: dict, cfg: dict, active: bool) -> float:
+        start, end = CYCLE_NIGHT_HOURS
+        hour = datetime.now().hour
+        night = start <= hour < end if start <= end else (hour >= start or hour < end)
+        if active:
+            interval = entry["interval"] / 2
+        elif night:
+            interval = cfg["max"]
+        else:
+            interval = entry["interval"] * CYCLE_IDLE_BACKOFF
+        return min(cfg["max"], max(cfg["min"], interval))
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="cycle-scheduler", daemon=True).start()
+
+    def unregister(self, alias: str) -> None:
+        with self._cond:
+            self._entries.pop(alias, None)     # its heap entry is skipped when popped
+
+    def wait_turn(self, worker, idle=None, idle_every: float = 0) -> bool:
+        """
+        Called by a worker after each cycle: schedule its next one and block
+        until the scheduler dispatches it, calling `idle()` every `idle_every`
+        seconds meanwhile.  False once the worker is stopped.
+        """
+        now = time.time()
+        with self._cond:
+            cfg = self.settings(worker.alias)
+            entry = self._entries.get(worker.alias)
+            if entry is None or entry["worker"] is not worker:    # first cycle of this run
+                entry = self._entries[worker.alias] = {
+                    "worker": worker, "due": now, "ready": threading.Event(),
+                    "cycles": 0, "missed": 0, "late": 0.0,
+                    "interval": cfg["interval"], "active": False, "last_active": None,
+                }
+            else:
+                if entry["active"]:
+                    entry["last_active"] = now
+                entry["interval"] = self._adapt(entry, cfg, entry["active"])
+                entry["active"] = False
+            due = entry["due"] + entry["interval"] + random.uniform(-cfg["jitter"], cfg["jitter"])
+            if due <= now:
+                # overran: rest at least the minimum interval rather than
+                # running back-to-back against the bank site
+                entry["missed"] += 1
+                due = now + cfg["min"]
+            entry["due"] = due
+            entry["cycles"] += 1
+            entry["ready"].clear()
+            self._seq += 1
+            heapq.heappush(self._heap, (due, self._seq, worker.alias))
+            self._cond.notify()
+
+        last_idle = time.time()
+        while not entry["ready"].wait(1):
+            if _worker_stopped(worker):
+                self.unregister(worker.alias)
+                return False
+            if idle and idle_every and time.time() - last_idle >= idle_every:
+                idle()
+                last_idle = time.time()
+        return not _worker_stopped(worker)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cond.wait(self._heap[0][0] - time.time() if self._heap else None)
+                due, _, alias = heapq.heappop(self._heap)
+                entry = self._entries.get(alias)
+                if entry is None or entry["due"] != due:
+                    continue                   # unregistered or rescheduled since
+                entry["late"] = time.time() - due
+                entry["ready"].set()
+
+    def stats(self, alias: str) -> Optional[dict]:
+        with self._cond:
+            entry = self._entries.get(alias)
+            if entry is None:
+                return None
+            return {k: entry[k] for k in ("due", "cycles", "missed", "late", "interval", "last_active")}
+
+
+_scheduler = CycleScheduler()
+
 
 # ─── after your existing “from telegram.ext import …” block ───
 
 # track users mid‐flow in the KGB custom‐date sequence
 pending_kgb: dict[int, dict] = {}
 
+async def _start_leased_worker(bot, chat_id, alias, WorkerClass, profile, note="", attrs=None):
+    """Start `WorkerClass` for `alias` on its leased profile, launching Chrome if cold."""
+    name   = os.path.basename(profile)
+    driver = _drivers.get(profile)
+    try:
+        if driver is None:
+            # no warm Chrome left → launch this profile on demand
+            await bot.send_message(
+                chat_id=chat_id,
+                text=f"🧊 Launching Chrome for profile `{name}`…",
+                parse_mode=ParseMode.MARKDOWN,
+            )
+            driver = await asyncio.to_thread(_launch_profile, profile)
+        _active[profile] = True
+
+        # Collapse to a single AutoBank tab
+        main_handle = driver.window_handles[0]
+        for handle in driver.window_handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(main_handle)
+
+        # Spawn the worker with the existing driver and the profile's download folder
+        worker = WorkerClass(
+            bot=bot,
+            chat_id=chat_id,
+            alias=alias,
+            cred=creds[alias],
+            loop=asyncio.get_running_loop(),
+            driver=driver,
+            download_folder=_profile_downloads[profile],
+            profile_dir=profile,
+        )
+        for key, value in (attrs or {}).items():
+            setattr(worker, key, value)
+        workers[alias] = worker
+        worker.start()
+    except Exception as e:
+        # never keep a lease without a worker: the alias would read "already
+        # running" forever (and a queued start has nobody to report to)
+        logger.error(f"[Pool] could not start {alias} on {name}: {e!r}", exc_info=True)
+        workers.pop(alias, None)
+        if driver is not None and not await asyncio.to_thread(_probe_driver, driver):
+            await asyncio.to_thread(_shutdown_profile, profile)   # don't hand out a dead Chrome
+        _leases.release(alias, profile)
+        return await bot.send_message(
+            chat_id=chat_id, text=f"❌ Could not start “{alias}”: {e!r}"
+        )
+
+    await bot.send_message(
+        chat_id=chat_id,
+        text=f"Started *{alias}* using profile `{name}`{note}",
+        parse_mode=ParseMode.MARKDOWN,
+    )
+    return worker
+
+
+async def _lease_and_start(bot, chat_id, reply, alias, WorkerClass, note="", attrs=None):
+    """Lease a profile for `alias` and start it, or queue it until one frees up."""
+    def start(profile):
+        return _start_leased_worker(bot, chat_id, alias, WorkerClass, profile, note, attrs)
+
+    profile, position = _leases.acquire(alias, start, asyncio.get_running_loop())
+    if profile is None:
+        return await reply(
+            f"⏳ All {MAX_SESSIONS} sessions are busy — *{alias}* is #{position} "
+            f"in the queue and will start automatically.",
+            parse_mode=ParseMode.MARKDOWN,
+        )
+    return await start(profile)
+
+
 async def run_kgb(update, context, alias, from_dt=None, to_dt=None):
     """Start a KGBWorker by reusing a pre-warmed Chrome driver."""
     msg_target = update.message or update.callback_query.message
@@ -138,44 +2496,17 @@ async def run_kgb(update, context, alias, from_dt=None, to_dt=None):
         return await msg_target.reply_text(f"❌ Unknown alias “{alias}”.")
     if alias in _profile_assignments:
         return await msg_target.reply_text(f"❌ Already running “{alias}”.")
-    if not _free_profiles:
-        return await msg_target.reply_text("❌ Maximum of 10 concurrent sessions reached.")
-
-    # reserve credentials and profile
-    cred    = creds[alias]
-    profile = _free_profiles.pop(0)
-    driver  = _drivers[profile]
-    _active[profile]            = True
-    _profile_assignments[alias] = profile
-
-    # use the profile’s dedicated download folder
-    download_folder = _profile_downloads[profile]
-
-    # spawn the worker with the existing driver + its profile download folder
-    worker = KGBWorker(
-        bot=context.bot,
-        chat_id=update.effective_chat.id,
-        alias=alias,
-        cred=cred,
-        loop=asyncio.get_running_loop(),
-        driver=driver,
-        download_folder=download_folder,
-        profile_dir=profile,
-    )
 
     # attach custom dates if provided
+    note, attrs = "", None
     if from_dt and to_dt:
-        worker.from_dt = from_dt
-        worker.to_dt   = to_dt
-
-    workers[alias] = worker
-    worker.start()
+        note  = f" from {from_dt.strftime('%d/%m/%Y')} to {to_dt.strftime('%d/%m/%Y')}"
+        attrs = {"from_dt": from_dt, "to_dt": to_dt}
 
-    # notify user
-    msg = f"Started *{alias}* in profile *{profile}*"
-    if from_dt:
-        msg += f" from {from_dt.strftime('%d/%m/%Y')} to {to_dt.strftime('%d/%m/%Y')}"
-    await msg_target.reply_text(msg, parse_mode=ParseMode.MARKDOWN)
+    await _lease_and_start(
+        context.bot, update.effective_chat.id, msg_target.reply_text,
+        alias, KGBWorker, note, attrs,
+    )
 
 
 async def kgb_button(update, context):
@@ -219,7 +2550,7 @@ def solve_captcha_with_2captcha(image_bytes, min_len=None, max_len=None, regsens
         captcha_id = r.get("request")
 
         for _ in range(30):
-            time.sleep(5)
+            _sleep(5)  # 2Captcha asks clients to poll res.php no more than every 5 s
             res = requests.get(f"http://2captcha.com/res.php?key={config.TWO_CAPTCHA_API_KEY}&action=get&id={captcha_id}&json=1").json()
             if res.get("status") == 1:
                 return res["request"], captcha_id
@@ -349,6 +2680,10 @@ class TMBWorker(threading.Thread):
         self.logged_in    = False
         self._stop_event  = threading.Event()
         self.tmb_window   = None
+        self.profile_dir  = profile_dir
+        self.autobank_win = None         # long-lived AutoBank upload tab
+        self.pending_uploads = deque()   # uploads handed back for the browser path
+        self.session = BankSession(self, "TMB")   # keep-alive + resume after errors
 
         # ─── reuse injected Chrome if provided ───
         self.reused_driver = driver is not None
@@ -375,16 +2710,17 @@ class TMBWorker(threading.Thread):
         }
         opts.add_experimental_option("prefs", prefs)
 
-        self.driver = webdriver.Chrome(options=opts)
-        # clear cookies & cache
-        self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
-        self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
-        self.driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        self.driver = webdriver.Chrome(options=_tune_chrome_options(opts))
+        # clear cookies & storage (the HTTP cache is kept)
+        _reset_session(self.driver, "TMB")
 
 
     def stop(self):
         # signal the worker loop to exit
         self._stop_event.set()
+        _unbind_cancel()
+        if not _claim_stop(self):
+            return
 
         if self.logged_in:
             try:
@@ -420,16 +2756,14 @@ class TMBWorker(threading.Thread):
             pass
 
         if self.reused_driver:
-            # recycle the shared Chrome: open a new AutoBank tab, close all others
-            main = self.driver.window_handles[0]
-            self.driver.switch_to.window(main)
-            self.driver.execute_script(
-                "window.open('https://autobank.payatom.in/operator_index.php');"
-            )
-            for handle in self.driver.window_handles[:-1]:
-                self.driver.switch_to.window(handle)
-                self.driver.close()
-            self.driver.switch_to.window(self.driver.window_handles[0])
+            try:
+                # recycle the shared Chrome: open a new AutoBank tab, close all others
+                _recycle_pooled_driver(self.driver)
+            except Exception:
+                pass
+            finally:
+                # a dead Chrome must not keep the alias leased
+                _leases.release(self.alias, self.profile_dir)
         else:
             try:
                 self.driver.quit()
@@ -448,22 +2782,36 @@ class TMBWorker(threading.Thread):
             ),
             self.loop,
         )
+
+    # same name as the other workers use (and as stop()/upload already call)
+    _send = _send_msg
         
     def run(self):
+        _bind_cancel(self)
         self._send_msg("🚀 Starting TMB automation")
         retry_count = 0
 
         while not self._stop_event.is_set():
             try:
-                self._login()
-                retry_count = 0  # reset after success
+                if not self.session.resume():   # still logged in after a non-auth error?
+                    self._login()
+                    retry_count = 0  # reset after success
 
                 while not self._stop_event.is_set():
                     self._balance_and_pages_and_download()
-                    time.sleep(60)
-
-                break  # exit if stop was requested
-
+                    retry_count = 0  # a clean cycle; resumed sessions don't re-login
+                    _drain_browser_uploads(self)
+                    if _recycle_worker_browser(self):
+                        break  # fresh Chrome → log in again
+                    if not _scheduler.wait_turn(self, self.session.keep_alive, SESSION_KEEPALIVE):
+                        break
+                    if not self.logged_in:
+                        break  # bank ended the session while idle → log in again
+
+                # loop ends on stop, or re-logs in after a browser recycle
+
+            except Cancelled:
+                break  # /stop interrupted a sleep or wait
             except Exception as e:
                 retry_count += 1
                 try:
@@ -474,9 +2822,11 @@ class TMBWorker(threading.Thread):
 
                 if retry_count > 5:
                     self._send_msg(f"❌ Too many failures. Stopping this alias.")
-                    self.stop()
                     break
-                self._retry()
+                # next pass resumes if the bank session survived, else _retry() + login
+
+        # stopped (or gave up): log out, recycle Chrome, release the profile — once
+        self.stop()
 
 
     def _retry(self):
@@ -524,8 +2874,10 @@ class TMBWorker(threading.Thread):
 
 
     def _login(self):
+        _apply_url_blocklist(self.driver, "TMB")
         #self._send_msg("Navigating to tmbnet.in…")
         self.driver.get("https://www.tmbnet.in/")
+        _log_page_load(self.driver, "TMB", self.alias)
 
         #self._send_msg("Clicking Net Banking Login…")
         WebDriverWait(self.driver, 10).until(
@@ -573,7 +2925,7 @@ class TMBWorker(threading.Thread):
             )
             self._send_msg("⚠️ 2Captcha failed. Waiting for your reply…")
             while not self.captcha_code and not self._stop_event.is_set():
-                time.sleep(0.5)
+                _sleep(0.5)
 
         if self._stop_event.is_set():
             return
@@ -647,7 +2999,7 @@ class TMBWorker(threading.Thread):
 
         # Always start by scrolling back to the very top
         self.driver.execute_script("window.scrollTo(-50,-100);")
-        time.sleep(0.5)  # let any sticky headers collapse
+        _sleep(0.5)  # let any sticky headers collapse
 
         attempts = [
             ("sidebar-ID",        By.ID,           "Account_Summary"),
@@ -669,7 +3021,7 @@ class TMBWorker(threading.Thread):
                     "arguments[0].scrollIntoView({block:'start'});",
                     el
                 )
-                time.sleep(0.3)
+                _sleep(0.3)
                 self.driver.execute_script("window.scrollTo(-50,-100);")
                 # try three click methods
                 try:
@@ -709,6 +3061,9 @@ class TMBWorker(threading.Thread):
         balance = row.find_elements(By.TAG_NAME, "td")[2].text
         self._send_msg(f" 💰: {balance}")
         self.last_balance = balance
+        gate = _balance_gate(self.alias)
+        if not gate.should_fetch(balance):
+            return  # balance unchanged → no statement this cycle
         # 4) Click Account Statement
         #self._send_msg("Clicking Account Statement…")
         stmt_link = WebDriverWait(self.driver, 20).until(
@@ -766,6 +3121,7 @@ class TMBWorker(threading.Thread):
 
         # 8) Click Download
         #self._send_msg("Clicking Download…")
+        download = _expect_download(self)
         for by, loc in (
             (By.NAME, "Action.CUSTOM_GENERATE_REPORTS"),
             (By.ID,   "okButton"),
@@ -782,26 +3138,8 @@ class TMBWorker(threading.Thread):
         else:
             raise TimeoutException("Could not find any Download button to click")
 
-        # 9) Wait for the .xls to finish downloading
-        download_dir = self.download_dir
-        timeout = 60
-        end_time = time.time() + timeout
-        xls_file = None
-
-        while time.time() < end_time:
-            files = os.listdir(download_dir)
-            # ignore any in-progress .tmp/.crdownload files
-            candidates = [f for f in files if not f.lower().endswith(('.tmp', '.crdownload'))]
-            if candidates:
-                # pick the most recent fully-downloaded file
-                xls_file = max(candidates, key=lambda f: os.path.getctime(os.path.join(download_dir, f)))
-                full_path = os.path.join(download_dir, xls_file)
-                if os.path.exists(full_path):
-                    break
-            time.sleep(1)
-
-        if not xls_file:
-            raise TimeoutException("Timed out waiting for XLS download to finish")
+        # 9) Wait for exactly this request's .xls to finish downloading
+        full_path = download.wait()
 
         #self._send_msg(f"✅ Downloaded file: {xls_file}")
 
@@ -811,76 +3149,15 @@ class TMBWorker(threading.Thread):
         except Exception as e:
             self._send_msg(f"❌ AutoBank upload failed: {e!r}")
             raise
+        gate.fetched(balance)
         from selenium.webdriver.support.ui import Select
 
     def _upload_to_autobank(self, statement_path):
-        driver = self.driver
-        wait = WebDriverWait(driver, 20)
-        original = driver.current_window_handle
-
-        # Open AutoBank in a new tab
-        driver.execute_script("window.open();")
-        new_tab = [h for h in driver.window_handles if h != original][0]
-        driver.switch_to.window(new_tab)
-
-        max_attempts = 5
-        for attempt in range(1, max_attempts + 1):
-            try:
-                # 1) Start from the login page each time
-                driver.get("https://autobank.payatom.in/operator_index.php")
-
-                # 2) Click SIGN IN if present (else assume already logged in)
-                try:
-                    login_btn = WebDriverWait(driver, 5).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, "a.auth-form-btn"))
-                    )
-                    login_btn.click()
-                except TimeoutException:
-                    self._send_msg("🔄 AutoBank: already logged in")
-
-                # 3) Wait for dashboard sidebar
-                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "nav.sidebar")))
-
-                # 4) Go to upload page
-                driver.get("https://autobank.payatom.in/bankupload.php")
-                wait.until(EC.presence_of_element_located((By.ID, "drop-zone")))
-
-                # 5) Select TMB, fill account and file
-                Select(driver.find_element(By.ID, "bank")) \
-                    .select_by_visible_text("TMB")
-                acct = driver.find_element(By.ID, "account_number")
-                acct.clear()
-                acct.send_keys(self.cred["account_number"])
-                driver.find_element(By.ID, "file_input").send_keys(statement_path)
-
-                # 6) Wait for success alert
-                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ".swal2-icon-success")))
-
-                # Success!
-                self._send_msg(f"✅ AutoBank upload succeeded (attempt {attempt}/{max_attempts})")
-                self._send(f"[DEBUG] XLS path: {statement_path})")
-                break
+        """Direct HTTP upload; drive the AutoBank page only if that isn't possible."""
+        _upload_statement(self, "TMB", statement_path)
 
-            except Exception as e:
-                # Capture screenshots of both tabs on every failure
-                try:
-                    self._send_screenshots()
-                except:
-                    pass
-
-                self._send_msg(f"⚠️ AutoBank upload failed (attempt {attempt}/{max_attempts}): {e!r}")
-                if attempt < max_attempts:
-                    # retry from step 1 without full logout
-                    continue
-
-                # After final failure: close upload tab, switch back, and re-raise
-                driver.close()
-                driver.switch_to.window(original)
-                raise
-
-        # Cleanup on success: close upload tab and return to main window
-        driver.close()
-        driver.switch_to.window(original)
+    def _upload_via_browser(self, statement_path):
+        _browser_upload(self, "TMB", statement_path, timeout=20, screenshot=self._send_screenshots)
 
 # --- insert after your TMBWorker definition: ---
 class IOBWorker(threading.Thread):
@@ -909,6 +3186,10 @@ class IOBWorker(threading.Thread):
         self.logged_in    = False
         self.retry_count  = 0
         self.stop_evt     = threading.Event()
+        self.profile_dir  = profile_dir
+        self.autobank_win = None         # long-lived AutoBank upload tab
+        self.pending_uploads = deque()   # uploads handed back for the browser path
+        self.session = BankSession(self, "IOB")   # keep-alive + resume after errors
 
         # ─── reuse injected Chrome if provided ───
         self.reused_driver = driver is not None
@@ -943,7 +3224,7 @@ class IOBWorker(threading.Thread):
         }
         opts.add_experimental_option("prefs", prefs)
 
-        self.driver = webdriver.Chrome(options=opts)
+        self.driver = webdriver.Chrome(options=_tune_chrome_options(opts))
 
         
     def _send(self, text):
@@ -1000,24 +3281,34 @@ class IOBWorker(threading.Thread):
 
         
     def run(self):
+        _bind_cancel(self)
         # Notify start
         self._send("🚀 Starting IOB automation")
 
         # Outer loop: handles (re)login + retry logic
         while not self.stop_evt.is_set():
             try:
-                # Attempt login
-                self._login()
-                self.retry_count = 0
+                # Attempt login (unless the bank session survived the last error)
+                if not self.session.resume():
+                    self._login()
+                    self.retry_count = 0
 
                 # If login succeeds, enter steady-state upload/balance cycle
                 while not self.stop_evt.is_set():
                     self._download_and_upload_statement()
                     self._balance_enquiry()
                     self.retry_count = 0
-                    time.sleep(60)
-                break  # external stop requested
-
+                    _drain_browser_uploads(self)
+                    if _recycle_worker_browser(self):
+                        break  # fresh Chrome → log in again
+                    if not _scheduler.wait_turn(self, self.session.keep_alive, SESSION_KEEPALIVE):
+                        break
+                    if not self.logged_in:
+                        break  # bank ended the session while idle → log in again
+                # loop ends on external stop, or re-logs in after a browser recycle
+
+            except Cancelled:
+                break  # /stop interrupted a sleep or wait
             except Exception as e:
                 # Bump retry count
                 self.retry_count += 1
@@ -1033,15 +3324,16 @@ class IOBWorker(threading.Thread):
                 except:
                     pass
                 self._send(f"⚠️ Error: {e!r}\nRetrying {self.retry_count}/5…")
-                self._retry()
-                # Loop back to try login again
+                # Loop back: resume the bank session if still valid, else _retry() + login
 
         # Clean shutdown if stop_evt was set
         self.stop()
         
     def _login(self):
+        _apply_url_blocklist(self.driver, "IOB")
         # 1) Open the IOB login page
         self.driver.get("https://www.iobnet.co.in/ibanking/html/index.html")
+        _log_page_load(self.driver, "IOB", self.alias)
 
         # 2) Click “Continue to Internet Banking Home Page”
         WebDriverWait(self.driver, 20).until(
@@ -1088,7 +3380,7 @@ class IOBWorker(threading.Thread):
             )
             self._send("⚠️ 2Captcha failed. Waiting for your reply…")
             while not self.captcha_code and not self.stop_evt.is_set():
-                time.sleep(0.5)
+                _sleep(0.5)
 
         if self.stop_evt.is_set():
             return
@@ -1172,128 +3464,41 @@ class IOBWorker(threading.Thread):
         )
         self.driver.execute_script("arguments[0].scrollIntoView(true);", view_btn)
         view_btn.click()
-        time.sleep(10)
-        # 7) Wait for the CSV export button to appear, scroll to it…
-        csv_btn = WebDriverWait(self.driver, 30).until(
-            EC.element_to_be_clickable((By.ID, "accountstatement_csvAcctStmt"))
+        # 7) Wait for the statement request to settle and the CSV export button to appear…
+        _wait_network_idle(self.driver, 30, label="IOB view statement")
+        csv_btn = _wait_for(
+            self.driver, EC.element_to_be_clickable((By.ID, "accountstatement_csvAcctStmt")),
+            30, "IOB csv button",
         )
         # a) scroll so it’s roughly centered (avoids sticky headers)
         self.driver.execute_script(
             "arguments[0].scrollIntoView({block:'center'});", csv_btn
         )
-        time.sleep(5)  # give any animations a moment
+        # the button slides in with the results; wait until it is clickable where it landed
+        csv_btn = _wait_for(
+            self.driver, EC.element_to_be_clickable((By.ID, "accountstatement_csvAcctStmt")),
+            5, "IOB csv in view",
+        )
 
         # b) try the normal click, but if it’s still intercepted, do a JS click
+        download = _expect_download(self)
         try:
             csv_btn.click()
         except ElementClickInterceptedException:
             self.driver.execute_script("arguments[0].click();", csv_btn)
         # 8) Wait for the download to finish
-        download_dir = self.download_dir
-        end_time = time.time() + 60
-        csv_path = None
-        while time.time() < end_time:
-            files = [f for f in os.listdir(download_dir) if f.lower().endswith(".csv")]
-            if files:
-                csv_path = os.path.join(
-                    download_dir,
-                    max(files, key=lambda f: os.path.getctime(os.path.join(download_dir, f)))
-                )
-                self._send(f"[DEBUG1] XLS path: {csv_path})")
-                break
-            self._send(f"[DEBUG2] XLS path: {csv_path})")
-            time.sleep(1)
-        if not csv_path:
-            raise TimeoutException("Timed out waiting for IOB CSV download")
-
-        # 9) Open a new tab for AutoBank and remember the old one
-        # ————— (9) Robust AutoBank upload with 5 retries —————
-        original_handle = self.driver.current_window_handle
-        max_attempts    = 5
-        autobank_handle = None
-
-        for attempt in range(1, max_attempts + 1):
-            # On first try, open a new tab; thereafter reuse it
-            if attempt == 1:
-                self.driver.execute_script("window.open('about:blank');")
-                handles = self.driver.window_handles
-                autobank_handle = [h for h in handles if h != original_handle][-1]
-
-            self.driver.switch_to.window(autobank_handle)
-            #self._send(f"🔄 AutoBank upload attempt {attempt}/{max_attempts} starting…")
-
-            try:
-                # 9a) Go to login page
-                self.driver.get("https://autobank.payatom.in/operator_index.php")
-
-                # 9b) Click SIGN IN if present
-                try:
-                    WebDriverWait(self.driver, 10).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, "a.auth-form-btn"))
-                    ).click()
-                except TimeoutException:
-                    pass  # already logged in
-
-                # 9c) Wait for dashboard sidebar
-                WebDriverWait(self.driver, 60).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "nav.sidebar"))
-                )
-
-                # 9d) Go to upload page
-                self.driver.get("https://autobank.payatom.in/bankupload.php")
-                WebDriverWait(self.driver, 20).until(
-                    EC.presence_of_element_located((By.ID, "drop-zone"))
-                )
-
-                # 9e) Fill form
-                Select(WebDriverWait(self.driver, 60).until(
-                    EC.presence_of_element_located((By.ID, "bank"))
-                )).select_by_visible_text("IOB")
-
-                acct_field = WebDriverWait(self.driver, 60).until(
-                    EC.element_to_be_clickable((By.ID, "account_number"))
-                )
-                acct_field.clear()
-                acct_field.send_keys(self.cred["account_number"])
-
-                file_input = WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.ID, "file_input"))
-                )
-                file_input.send_keys(csv_path)
-
-                # 9f) Wait for success
-                WebDriverWait(self.driver, 30).until(
-                    EC.visibility_of_element_located((By.CSS_SELECTOR, ".swal2-icon-success"))
-                )
-
-                self._send(f"✅ AutoBank upload succeeded on attempt {attempt}/{max_attempts}")
-                self._send(f"[DEBUG] XLS path: {csv_path})")
-                break
-
-            except Exception as e:
-                # screenshot both tabs
-                try:
-                    self._screenshot_tabs()
-                except:
-                    pass
-
-                err_name = type(e).__name__
-                self._send(f"⚠️ AutoBank upload failed on attempt {attempt}/{max_attempts}: {err_name}: {e}")
+        csv_path = download.wait()
+        self._send(f"[DEBUG1] XLS path: {csv_path})")
 
-                if attempt == max_attempts:
-                    # final failure → close tab & re-raise
-                    self.driver.close()
-                    self.driver.switch_to.window(original_handle)
-                    raise
-                # otherwise brief pause then retry
-                time.sleep(2)
+        # 9) Upload to AutoBank
+        self._upload_to_autobank(csv_path)
 
-        # 10) Cleanup: ensure we're back on the IOB tab
-        if self.driver.current_window_handle != original_handle:
-            self.driver.close()
-            self.driver.switch_to.window(original_handle)
+    def _upload_to_autobank(self, csv_path):
+        """Direct HTTP upload; drive the AutoBank page only if that isn't possible."""
+        _upload_statement(self, "IOB", csv_path)
 
-        #self._send("✅ Uploaded statement to AutoBank")
+    def _upload_via_browser(self, csv_path):
+        _browser_upload(self, "IOB", csv_path, timeout=30, screenshot=self._screenshot_tabs)
 
     def _balance_enquiry(self):
         # 1) Make sure we're on the IOB tab
@@ -1301,7 +3506,7 @@ class IOBWorker(threading.Thread):
 
         # 2) Scroll back to the very top (so the nav is visible)
         self.driver.execute_script("window.scrollTo(0, 0);")
-        time.sleep(0.5)
+        _sleep(0.5)
 
         # 3) Locate the Balance Enquiry link
         balance_link = WebDriverWait(self.driver, 60).until(
@@ -1312,7 +3517,7 @@ class IOBWorker(threading.Thread):
         self.driver.execute_script(
             "arguments[0].scrollIntoView({block: 'center'});", balance_link
         )
-        time.sleep(0.3)
+        _sleep(0.3)
 
         # 5) Click (with JS fallback)
         try:
@@ -1328,11 +3533,10 @@ class IOBWorker(threading.Thread):
             )
         )
         link.click()
-        time.sleep(30)
-        tbl = WebDriverWait(self.driver, 180).until(
-            EC.presence_of_element_located(
-                (By.CSS_SELECTOR, "#dialogtbl table tr.querytr td")
-            )
+        # the popup is filled by an XHR: wait until the balance cell has text
+        tbl = _wait_text(
+            self.driver, (By.CSS_SELECTOR, "#dialogtbl table tr.querytr td"),
+            180, "IOB balance popup",
         )
         available = tbl.text.strip()
         self._send(f"💰: {available}")
@@ -1361,11 +3565,8 @@ class IOBWorker(threading.Thread):
             pass
         finally:
             self.stop_evt.set()
-            # 5) pop the profile assignment, return it to the pool, and mark inactive
-            profile = _profile_assignments.pop(self.alias, None)
-            if profile:
-                _free_profiles.append(profile)
-                _active[profile] = False
+            # 5) return the profile lease to the pool
+            _leases.release(self.alias, self.profile_dir)
             # only quit again if necessary
             if not self.reused_driver:
                 try:
@@ -1375,6 +3576,9 @@ class IOBWorker(threading.Thread):
 
     def stop(self):
         self.stop_evt.set()
+        _unbind_cancel()
+        if not _claim_stop(self):
+            return
         if self.logged_in:
             try:
                 self._send("🚪 Logging out…")
@@ -1390,22 +3594,14 @@ class IOBWorker(threading.Thread):
             pass
 
         if self.reused_driver:
-            # open a fresh AutoBank tab and close all others
-            self.driver.switch_to.window(self.driver.window_handles[0])
-            self.driver.execute_script(
-                "window.open('https://autobank.payatom.in/operator_index.php');"
-            )
-            # close every tab except the new one
-            for handle in self.driver.window_handles[:-1]:
-                self.driver.switch_to.window(handle)
-                self.driver.close()
-            # switch to the remaining AutoBank tab
-            self.driver.switch_to.window(self.driver.window_handles[0])
-            # 5) pop the profile assignment, return it to the pool, and mark inactive
-            profile = _profile_assignments.pop(self.alias, None)
-            if profile:
-                _free_profiles.append(profile)
-                _active[profile] = False            
+            try:
+                # open a fresh AutoBank tab and close all others
+                _recycle_pooled_driver(self.driver)
+            except Exception:
+                pass
+            finally:
+                # 5) return the profile lease to the pool, even if Chrome is gone
+                _leases.release(self.alias, self.profile_dir)
         else:
             try:
                 self.driver.quit()
@@ -1438,6 +3634,10 @@ class KGBWorker(threading.Thread):
         self.logged_in    = False
         self.retry_count  = 0
         self.stop_evt     = threading.Event()
+        self.profile_dir  = profile_dir
+        self.autobank_win = None         # long-lived AutoBank upload tab
+        self.pending_uploads = deque()   # uploads handed back for the browser path
+        self.session = BankSession(self, "KGB")   # keep-alive + resume after errors
 
         # ─── always use the injected driver ───
         assert driver, "KGBWorker requires a Chrome driver instance"
@@ -1481,25 +3681,37 @@ class KGBWorker(threading.Thread):
         )
 
     def run(self):
+        _bind_cancel(self)
         # initial notification
         self._send("🚀 Starting KGB automation")
 
         # outer loop: handles login + retry logic
         while not self.stop_evt.is_set():
             try:
-                # 1) Attempt login
-                self._login()
-                self.retry_count = 0
+                # 1) Attempt login (unless the bank session survived the last error)
+                if not self.session.resume():
+                    self._login()
+                    self.retry_count = 0
 
                 # 2) If login succeeds, do the normal cycle
                 while not self.stop_evt.is_set():
-                    self._read_balance_and_navigate_to_statement()
-                    self._download_and_upload_statement()
+                    gate = _balance_gate(self.alias)
+                    if self._read_balance_and_navigate_to_statement():
+                        if self._download_and_upload_statement():
+                            gate.fetched(self.last_balance)
                     self.retry_count = 0
-                    time.sleep(60)
-
-                break  # if stop_evt set, exit cleanly
-
+                    _drain_browser_uploads(self)
+                    if _recycle_worker_browser(self):
+                        break  # fresh Chrome → log in again
+                    if not _scheduler.wait_turn(self, self.session.keep_alive, SESSION_KEEPALIVE):
+                        break
+                    if not self.logged_in:
+                        break  # bank ended the session while idle → log in again
+
+                # loop ends if stop_evt set, or re-logs in after a browser recycle
+
+            except Cancelled:
+                break  # /stop interrupted a sleep or wait
             except Exception as e:
                 # bump retry count
                 self.retry_count += 1
@@ -1513,8 +3725,7 @@ class KGBWorker(threading.Thread):
                 try:    self._screenshot_tabs()
                 except: pass
                 self._send(f"⚠️ Error: {e!r}\nRetrying {self.retry_count}/5…")
-                self._retry()
-                # loop back to try login again
+                # loop back: resume the bank session if still valid, else _retry() + login
 
         # if externally stopped, ensure logout/quit
         self.stop()
@@ -1527,23 +3738,25 @@ class KGBWorker(threading.Thread):
         Step 1: Go to KGB Netbanking login page, solve CAPTCHA, click Login to reach 2nd‐factor page.
         """
         # 1a) Open the login URL
+        _apply_url_blocklist(self.driver, "KGB")
         self.driver.get("https://netbanking.keralagbank.com/")
-        time.sleep(5)
+        _log_page_load(self.driver, "KGB", self.alias)
         # 1b) Wait for User ID input:  (e1)
-        WebDriverWait(self.driver, 15).until(
-            EC.presence_of_element_located((By.ID, "AuthenticationFG.USER_PRINCIPAL"))
+        user_input = _wait_for(
+            self.driver, EC.element_to_be_clickable((By.ID, "AuthenticationFG.USER_PRINCIPAL")),
+            15, "KGB login form",
         )
-        time.sleep(5)
         # 1c) Fill in User ID (alias.login_id)
-        self.driver.find_element(By.ID, "AuthenticationFG.USER_PRINCIPAL")\
-            .send_keys(self.cred["username"])
-        time.sleep(5)
-        # 1d) Wait for CAPTCHA image and try auto-solve
-        img = WebDriverWait(self.driver, 15).until(
-            EC.presence_of_element_located((By.ID, "IMAGECAPTCHA"))
+        user_input.send_keys(self.cred["username"])
+        # 1d) Wait for CAPTCHA image to finish loading and try auto-solve
+        img = _wait_present(self.driver, (By.ID, "IMAGECAPTCHA"), 15, "KGB captcha")
+        _wait_for(
+            self.driver,
+            lambda d: d.execute_script(
+                "return arguments[0].complete && arguments[0].naturalWidth > 0", img),
+            15, "KGB captcha image",
         )
         bio = BytesIO(img.screenshot_as_png)
-        time.sleep(5)
         self._send("🤖 Trying to auto-solve CAPTCHA via 2Captcha…")
         solution, self._captcha_id = solve_captcha_with_2captcha(bio.getvalue())
         if solution:
@@ -1559,57 +3772,59 @@ class KGBWorker(threading.Thread):
                 self.loop
             )
             self._send("⚠️ 2Captcha failed. Waiting for your CAPTCHA reply…")
+            # polls the Telegram reply handler, nothing on the page to wait for
             while not self.captcha_code and not self.stop_evt.is_set():
-                time.sleep(5)
+                _sleep(0.5)
             if self.stop_evt.is_set():
                 return
             
 
-        time.sleep(5)
         # 1f) Fill in CAPTCHA (e3) and click Login (e4)
-        self.driver.find_element(By.ID, "AuthenticationFG.VERIFICATION_CODE")\
-            .send_keys(self.captcha_code)
-        time.sleep(5)
+        _wait_for(
+            self.driver, EC.element_to_be_clickable((By.ID, "AuthenticationFG.VERIFICATION_CODE")),
+            15, "KGB captcha field",
+        ).send_keys(self.captcha_code)
         # 1f) (Find & click whichever STU_VALIDATE_CREDENTIALS button is visible)
-        login_buttons = self.driver.find_elements(By.ID, "STU_VALIDATE_CREDENTIALS")
-        login_btn = None
-        for btn in login_buttons:
-            if btn.is_displayed() and btn.is_enabled():
-                login_btn = btn
-                break
-        if login_btn is None:
+        def visible_login_button(d):
+            for btn in d.find_elements(By.ID, "STU_VALIDATE_CREDENTIALS"):
+                if btn.is_displayed() and btn.is_enabled():
+                    return btn
+            return False
+        try:
+            login_btn = _wait_for(self.driver, visible_login_button, 15, "KGB login button")
+        except TimeoutException:
             raise TimeoutException("Could not find a visible/enabled STU_VALIDATE_CREDENTIALS button.")
 
         # Scroll into view + attempt a normal click, fallback to JS click if blocked
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", login_btn)
-        time.sleep(0.2)
+        _sleep(0.2)
         try:
             login_btn.click()
         except Exception:
             self.driver.execute_script("arguments[0].click();", login_btn)
-        time.sleep(5)
-        # 🧠 Check for CAPTCHA error message under span.errorCodeWrapper
+        # 🧠 Wait for either the CAPTCHA error under span.errorCodeWrapper or the 2nd-factor page
+        error_loc = (By.CSS_SELECTOR, "span.errorCodeWrapper p[style='display: inline']")
+        checkbox_loc = (By.CSS_SELECTOR, "span.span-checkbox")
         try:
-            error_text_elem = WebDriverWait(self.driver, 5).until(
-                EC.presence_of_element_located(
-                    (By.CSS_SELECTOR, "span.errorCodeWrapper p[style='display: inline']")
-                )
-            )
-            if "enter the characters" in error_text_elem.text.lower() and hasattr(self, "_captcha_id"):
-                self._send("❌ Login failed — reporting bad CAPTCHA to 2Captcha.")
-                report_bad_captcha(self._captcha_id)
-                self._retry()
-                return
+            _wait_for(self.driver, EC.any_of(
+                EC.presence_of_element_located(error_loc),
+                EC.element_to_be_clickable(checkbox_loc),
+            ), 30, "KGB login submit")
         except TimeoutException:
-            pass  # No error found — proceed
+            pass  # fall through to the checkbox wait below, which reports the timeout
+        errors = self.driver.find_elements(*error_loc)
+        if errors and "enter the characters" in errors[0].text.lower() and hasattr(self, "_captcha_id"):
+            self._send("❌ Login failed — reporting bad CAPTCHA to 2Captcha.")
+            report_bad_captcha(self._captcha_id)
+            self._retry()
+            return
 
 
         # ─── Now we’re on the 2nd‐factor page ───
         # 1) Instead of waiting for #messageContent to go away, simply wait for
         #    the visible <span class="span-checkbox"> to be clickable.
-        time.sleep(5)
         checkbox_span = WebDriverWait(self.driver, 30).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "span.span-checkbox"))
+            EC.element_to_be_clickable(checkbox_loc)
         )
 
         # Scroll it into view, then click it
@@ -1617,7 +3832,7 @@ class KGBWorker(threading.Thread):
             "arguments[0].scrollIntoView({ block: 'center' });",
             checkbox_span
         )
-        time.sleep(5)
+        _sleep(0.2)  # let the smooth scroll land before clicking
         try:
             checkbox_span.click()
         except Exception:
@@ -1633,7 +3848,6 @@ class KGBWorker(threading.Thread):
         #     There is no separate “Submit” button here—filling the checkbox + password
         #     and pressing ENTER will work. We can send an ENTER key:
         pwd.send_keys("\n")
-        time.sleep(5)
         # 1j) Wait until the main Dashboard (with “Account Balances” or a breadcrumb) appears.
         #     We know we’re logged in when the “Account Statement” link (on the left nav) is clickable.
         WebDriverWait(self.driver, 60).until(
@@ -1656,6 +3870,8 @@ class KGBWorker(threading.Thread):
                 wait for the Account Balances Summary, scrape the Available Balance,
                 send it to Telegram, then click on the account‐nickname link to reach
                 the statement‐download page.
+        Returns False (without leaving the summary) when the balance gate says
+        the statement isn't needed this cycle.
         """
 
         # 2a) Make sure we’re on the main KGB window
@@ -1667,7 +3883,7 @@ class KGBWorker(threading.Thread):
         )
         # Scroll it into view & click
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", acct_stmt_link)
-        time.sleep(0.2)
+        _sleep(0.2)
         try:
             acct_stmt_link.click()
         except:
@@ -1706,6 +3922,10 @@ class KGBWorker(threading.Thread):
                     self.loop
                 )
                 self.last_balance = available_balance
+                # an explicit /kgb from–to range is always fetched
+                custom_range = getattr(self, "from_dt", None) and getattr(self, "to_dt", None)
+                if not custom_range and not _balance_gate(self.alias).should_fetch(available_balance):
+                    return False  # balance unchanged → stay on the summary page
                 # ────────────────────────────────────────────────────────────────
 
                 # ─── now click the matching Account Nickname link ────────────────
@@ -1719,7 +3939,7 @@ class KGBWorker(threading.Thread):
                 self.driver.execute_script(
                     "arguments[0].scrollIntoView({block:'center'});", acct_link
                 )
-                time.sleep(0.2)
+                _sleep(0.2)
                 try:
                     acct_link.click()
                 except:
@@ -1732,6 +3952,7 @@ class KGBWorker(threading.Thread):
 
         # At this point, you should be on the “Account Statement” download page.
         # From here you can proceed to choose date ranges, click “Search,” and then download CSV/XLS.
+        return True
 
     from selenium.webdriver.common.by import By
     from selenium.webdriver.support.ui import WebDriverWait, Select
@@ -1745,6 +3966,7 @@ class KGBWorker(threading.Thread):
         Step 3: On the “Account Statement” page (after clicking the nickname link),
                 fill “From”/“To” dates, click Search, force-select “XLS” in the hidden <select>,
                 click OK to download, then upload to AutoBank.
+                Returns False when no statement was fetched (no transactions → logged out).
         """
 
         # 3a) Wait for the “From Date” field (ID ending with .FROM_TXN_DATE) to appear
@@ -1783,13 +4005,12 @@ class KGBWorker(threading.Thread):
         )
         self.driver.execute_script("arguments[0].removeAttribute('readonly')", to_input)
         self.driver.execute_script("arguments[0].value = arguments[1]", to_input, to_str)
-        time.sleep(5)
         # 3e) Click “Search”
         search_btn = WebDriverWait(self.driver, 60).until(
             EC.element_to_be_clickable((By.ID, "PageConfigurationMaster_RXACBSW__1:SEARCH"))
         )
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", search_btn)
-        time.sleep(2)
+        _sleep(0.2)  # let the smooth scroll land before clicking
         attempts = 0
         while attempts < 3:
             try:
@@ -1797,25 +4018,39 @@ class KGBWorker(threading.Thread):
             except Exception:
                 self.driver.execute_script("arguments[0].click();", search_btn)
 
-            # ⏳ Give it time to load fully
-            time.sleep(30)
+            # ⏳ Wait for the results (download widget) or the error box, then for the XHRs
+            _wait_for(self.driver, EC.any_of(
+                EC.presence_of_element_located(
+                    (By.CSS_SELECTOR, 'select[name="TransactionHistoryFG.OUTFORMAT"]')),
+                EC.presence_of_element_located((By.CSS_SELECTOR, "div.error-box, .errormessages")),
+            ), 60, "KGB search results")
+            _wait_network_idle(self.driver, 30, label="KGB search settle")
 
             # ❗ Check for error message indicating no transactions
             try:
                 err_box = self.driver.find_element(By.CSS_SELECTOR, "div.error-box, .errormessages")
                 if "do not exist for the account" in err_box.text:
                     self._send(f"⚠️ No transactions found, retrying search... ({attempts+1}/3)")
+                    # drop this attempt's error box so the next wait only sees the new answer
+                    self.driver.execute_script(
+                        "document.querySelectorAll('div.error-box, .errormessages')"
+                        ".forEach(e => e.remove());"
+                    )
+                    search_btn = self.driver.find_element(
+                        By.ID, "PageConfigurationMaster_RXACBSW__1:SEARCH"
+                    )
                     self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", search_btn)
-                    time.sleep(2)
+                    # deliberate backoff: the bank posts new entries with a lag, re-asking at once finds none
+                    _sleep(2)
                     attempts += 1
                     continue
-            except:
+            except Exception:
                 break  # No error box means success — break loop
         else:
             self._send("❌ Tried 3 times but no transactions found. Logging out.")
             self._screenshot_tabs()
             self._logout()
-            return
+            return False
 
         # ─── small pagination‐fix: if “1 – 5 of 500” then jump to page 101 ───
         # … after your SEARCH click, before STEP 1 …
@@ -1855,7 +4090,7 @@ class KGBWorker(threading.Thread):
        #         )
         #        self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", go_btn)
          #       go_btn.click()
-          #      time.sleep(30)
+          #      _sleep(30)
         # ─── STEP 1: after clicking SEARCH, take a screenshot & dump dropdown-wrapper HTML ───
         #self.driver.save_screenshot("step1_search.png")
         #print("STEP 1: Screenshot saved as step1_search.png")
@@ -1896,7 +4131,7 @@ class KGBWorker(threading.Thread):
 
         # ─── (D) SCROLL wrapper into view and JS‐click the <input.select-dropdown> ───
         self.driver.execute_script("arguments[0].scrollIntoView({block:'end'});", wrapper)
-        time.sleep(0.3)
+        _sleep(0.3)
         # Take another screenshot now that we’ve scrolled down:
         #self.driver.save_screenshot("step2_wrapper_in_view.png")
         #print("STEP 2: Screenshot after scrolling wrapper into view: step2_wrapper_in_view.png")
@@ -1913,7 +4148,7 @@ class KGBWorker(threading.Thread):
 
         # JS‐click it (normal .click() may fail):
         self.driver.execute_script("arguments[0].click();", dropdown_input)
-        time.sleep(0.5)
+        _sleep(0.5)
 
         # Screenshot after opening the dropdown:
         self.driver.save_screenshot("step3_dropdown_open.png")
@@ -1963,7 +4198,7 @@ class KGBWorker(threading.Thread):
             "arguments[0].scrollIntoView({block:'center'});",
             visible_ul
         )
-        time.sleep(0.2)
+        _sleep(0.2)
 
         try:
             # Correct XPath to match the <span> inside <li>
@@ -1983,7 +4218,7 @@ class KGBWorker(threading.Thread):
 
         # JS‐click that <li>:
         self.driver.execute_script("arguments[0].click();", li_xls)
-        time.sleep(0.3)
+        _sleep(0.3)
 
         # Screenshot after clicking “XLS”:
         self.driver.save_screenshot("step6_clicked_xls.png")
@@ -2006,7 +4241,8 @@ class KGBWorker(threading.Thread):
 
         # Scroll OK into view and click
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", ok_btn)
-        time.sleep(0.2)
+        _sleep(0.2)
+        download = _expect_download(self)
         try:
             ok_btn.click()
         except:
@@ -2016,87 +4252,11 @@ class KGBWorker(threading.Thread):
         self.driver.save_screenshot("step7_clicked_ok.png")
         print("STEP 7: Screenshot after clicking OK: step7_clicked_ok.png")
 
-        # 3i) Wait up to 60 seconds for the new .xls to appear in our download folder:
-        download_dir = self.download_dir
-        end_time = time.time() + 60
-        xls_path = None
-        while time.time() < end_time:
-            files = [f for f in os.listdir(download_dir) if f.lower().endswith(".xls")]
-            if files:
-                newest = max(files, key=lambda f: os.path.getctime(os.path.join(download_dir, f)))
-                xls_path = os.path.join(download_dir, newest)
-                break
-            time.sleep(1)
-
-        if not xls_path:
-            raise TimeoutException("Timed out waiting for KGB .xls to finish downloading")
-
-        # 3j) Open AutoBank in a new tab
-        original_handle = self.driver.current_window_handle
-        self.driver.execute_script("window.open();")
-        new_tab = [h for h in self.driver.window_handles if h != original_handle][0]
-        self.driver.switch_to.window(new_tab)
-
-        max_attempts = 5
-        for attempt in range(1, max_attempts + 1):
-            try:
-                # ← retry always starts here
-                self.driver.get("https://autobank.payatom.in/operator_index.php")
-
-                # 3k) Sign-in if needed
-                try:
-                    sign_in_btn = WebDriverWait(self.driver, 5).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, "a.auth-form-btn"))
-                    )
-                    sign_in_btn.click()
-                except TimeoutException:
-                    pass  # already logged in
-
-                # 3l) Go to upload page
-                WebDriverWait(self.driver, 20).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "nav.sidebar"))
-                )
-                self.driver.get("https://autobank.payatom.in/bankupload.php")
-                WebDriverWait(self.driver, 20).until(
-                    EC.presence_of_element_located((By.ID, "drop-zone"))
-                )
-
-                # 3m) Select KGB, fill account_number, attach file & wait for success
-                Select(self.driver.find_element(By.ID, "bank")) \
-                    .select_by_visible_text("Kerala Gramin Bank")
-                acct = self.driver.find_element(By.ID, "account_number")
-                acct.clear()
-                acct.send_keys(self.cred["account_number"])
-                self.driver.find_element(By.ID, "file_input").send_keys(xls_path)
-                WebDriverWait(self.driver, 120).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".swal2-icon-success"))
-                )
-
-                # ✅ success: report and break
-                self._send(f"✅ AutoBank upload succeeded (attempt {attempt}/{max_attempts})")
-                self._send(f"[DEBUG] XLS path: {xls_path})")
-                break
-
-            except Exception as e:
-                # 📸 capture both tabs on error
-                try:
-                    self._screenshot_tabs()
-                except:
-                    pass
+        # 3i) Wait up to 60 seconds for this request's .xls to finish downloading:
+        xls_path = download.wait()
 
-                self._send(f"⚠️ AutoBank upload failed (attempt {attempt}/{max_attempts}): {e!r}")
-                if attempt < max_attempts:
-                    # transient → retry (loop re-GETs operator_index.php)
-                    continue
-                else:
-                    # permanent → close and re-raise for full-login cycle
-                    self.driver.close()
-                    self.driver.switch_to.window(original_handle)
-                    raise
-
-        # cleanup after success
-        self.driver.close()
-        self.driver.switch_to.window(original_handle)
+        # 3j) Upload to AutoBank
+        self._upload_to_autobank(xls_path)
         self._send("✅ Uploaded statement to AutoBank")
 
         # 3o) Scroll to top and click “Account Statement” breadcrumb to return to Balances
@@ -2104,7 +4264,7 @@ class KGBWorker(threading.Thread):
             EC.element_to_be_clickable((By.LINK_TEXT, "Account Statement"))
         )
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", back_btn)
-        time.sleep(0.2)
+        _sleep(0.2)
         try:
             back_btn.click()
         except Exception:
@@ -2118,6 +4278,14 @@ class KGBWorker(threading.Thread):
         )
         updated_balance = refreshed_balance_span.text.strip()
         #self._send(f"Balance (after upload): {updated_balance}")
+        return True
+
+    def _upload_to_autobank(self, xls_path):
+        """Direct HTTP upload; drive the AutoBank page only if that isn't possible."""
+        _upload_statement(self, "Kerala Gramin Bank", xls_path)
+
+    def _upload_via_browser(self, xls_path):
+        _browser_upload(self, "Kerala Gramin Bank", xls_path, timeout=120, screenshot=self._screenshot_tabs)
 
     def stop(self):
         """
@@ -2126,10 +4294,13 @@ class KGBWorker(threading.Thread):
           2) perform logout if logged in
           3) capture diagnostics screenshots
           4) recycle the shared Chrome: close old tabs, open a fresh AutoBank tab
-          5) pop the profile assignment, return it to the pool, and mark inactive
+          5) return the profile lease to the pool
         """
         # 1) signal halt
         self.stop_evt.set()
+        _unbind_cancel()
+        if not _claim_stop(self):
+            return
 
         # 2) if already logged in, log out
         if self.logged_in:
@@ -2144,21 +4315,14 @@ class KGBWorker(threading.Thread):
         except Exception:
             pass
 
-        # 4) recycle the shared browser
-        self.driver.switch_to.window(self.driver.window_handles[0])
-        self.driver.execute_script(
-            "window.open('https://autobank.payatom.in/operator_index.php');"
-        )
-        for handle in self.driver.window_handles[:-1]:
-            self.driver.switch_to.window(handle)
-            self.driver.close()
-        self.driver.switch_to.window(self.driver.window_handles[0])
-
-        # 5) pop the profile assignment, return it to the pool, and mark inactive
-        profile = _profile_assignments.pop(self.alias, None)
-        if profile:
-            _free_profiles.append(profile)
-            _active[profile] = False
+        try:
+            # 4) recycle the shared browser
+            _recycle_pooled_driver(self.driver)
+        except Exception:
+            pass
+        finally:
+            # 5) return the profile lease to the pool, even if Chrome is gone
+            _leases.release(self.alias, self.profile_dir)
     
 
     def _logout(self):
@@ -2206,7 +4370,17 @@ class IDBIWorker(threading.Thread):
       4) Upload to AutoBank as “IDBI”
       5) On any error: screenshot all tabs, retry up to 5×
     """
-    def __init__(self, bot, chat_id, alias, cred, loop, profile_dir):
+    def __init__(
+        self,
+        bot,
+        chat_id,
+        alias,
+        cred,
+        loop,
+        driver: Optional[webdriver.Chrome] = None,
+        download_folder: Optional[str]      = None,
+        profile_dir: Optional[str]         = None,
+    ):
         super().__init__(daemon=True)
         self.bot         = bot
         self.chat_id     = chat_id
@@ -2214,11 +4388,22 @@ class IDBIWorker(threading.Thread):
         self.cred        = cred             # expects keys: login_id (or username), password, account_number
         self.loop        = loop
         self.profile     = profile_dir
+        self.profile_dir = profile_dir
+        self.autobank_win = None         # long-lived AutoBank upload tab
+        self.pending_uploads = deque()   # uploads handed back for the browser path
+        self.session = BankSession(self, "IDBI")   # keep-alive + resume after errors
         self.captcha_code= None
         self.logged_in   = False
         self.stop_evt    = threading.Event()
         self.retry_count = 0
 
+        # ─── reuse injected Chrome (or browser context) if provided ───
+        self.reused_driver = driver is not None
+        if self.reused_driver:
+            self.driver       = driver
+            self.download_dir = download_folder
+            return
+
         # Per‐alias download folder
         download_root = os.path.join(os.getcwd(), "downloads", alias)
         os.makedirs(download_root, exist_ok=True)
@@ -2236,11 +4421,9 @@ class IDBIWorker(threading.Thread):
             "profile.default_content_setting_values.automatic_downloads": 1,
         })
 
-        self.driver = webdriver.Chrome(options=opts)
-        # clear cookies/cache
-        self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
-        self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
-        self.driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        self.driver = webdriver.Chrome(options=_tune_chrome_options(opts))
+        # clear cookies/storage (the HTTP cache is kept)
+        _reset_session(self.driver, "IDBI")
 
     def _retry(self):
         """Close old tabs, open fresh one, reset login state."""
@@ -2291,10 +4474,13 @@ class IDBIWorker(threading.Thread):
         """
         Gracefully stops the IDBI thread:
           1) signals the loop to exit
-          2) quits Chrome
+          2) quits Chrome (or recycles the pooled one)
         """
         # 1) set the stop flag so any loops break out
         self.stop_evt.set()
+        _unbind_cancel()
+        if not _claim_stop(self):
+            return
 
         # 2) send a Telegram notice (optional)
         try:
@@ -2302,32 +4488,48 @@ class IDBIWorker(threading.Thread):
         except Exception:
             pass
 
-        # 3) tear down the browser
+        # 3) tear down the browser (or hand a pooled one back clean)
         try:
-            self.driver.quit()
+            if self.reused_driver:
+                _recycle_pooled_driver(self.driver)
+            else:
+                self.driver.quit()
         except Exception:
             pass
+
+        # 4) return the profile lease to the pool
+        _leases.release(self.alias, self.profile_dir)
             
     def run(self):
+        _bind_cancel(self)
         self._send("🚀 Starting IDBI automation")
 
         # Outer retry loop
         while not self.stop_evt.is_set():
             try:
-                # 1) Login + navigate into the statement page
-                self._login()
-                self.retry_count = 0
+                # 1) Login (unless the bank session survived the last error) + navigate
+                #    into the statement page
+                if not self.session.resume():
+                    self._login()
+                    self.retry_count = 0
                 self._read_balance_and_navigate_to_statement()
 
                 # 2) Steady-state: download & upload every minute
                 while not self.stop_evt.is_set():
                     self._download_and_upload_statement()
                     self.retry_count = 0
-                    time.sleep(60)
-
-                # clean exit if stop_evt was set
-                break
-
+                    _drain_browser_uploads(self)
+                    if _recycle_worker_browser(self):
+                        break  # fresh Chrome → log in again
+                    if not _scheduler.wait_turn(self, self.session.keep_alive, SESSION_KEEPALIVE):
+                        break
+                    if not self.logged_in:
+                        break  # bank ended the session while idle → log in again
+
+                # clean exit if stop_evt was set, else re-login after a browser recycle
+
+            except Cancelled:
+                break  # /stop interrupted a sleep or wait
             except Exception as e:
                 self.retry_count += 1
 
@@ -2340,8 +4542,7 @@ class IDBIWorker(threading.Thread):
                 try:    self._screenshot_tabs()
                 except: pass
                 self._send(f"⚠️ Error: {e!r}\nRetrying {self.retry_count}/5…")
-                self._retry()
-                # and then loop back to try logging in again
+                # loop back: resume the bank session if still valid, else _retry() + login
 
         # final cleanup once loop exits
         self.stop()
@@ -2349,7 +4550,9 @@ class IDBIWorker(threading.Thread):
         
     def _login(self):
         """1) Go to login page, solve CAPTCHA, submit credentials."""
+        _apply_url_blocklist(self.driver, "IDBI")
         self.driver.get("https://inet.idbibank.co.in/")
+        _log_page_load(self.driver, "IDBI", self.alias)
         wait = WebDriverWait(self.driver, 20)
 
         # (e1) Username
@@ -2377,7 +4580,7 @@ class IDBIWorker(threading.Thread):
             )
             self._send("⚠️ 2Captcha failed. Waiting for your reply…")
             while not self.captcha_code and not self.stop_evt.is_set():
-                time.sleep(0.5)
+                _sleep(0.5)
         if self.stop_evt.is_set():
             return
 
@@ -2389,7 +4592,7 @@ class IDBIWorker(threading.Thread):
         if not cont:
             raise TimeoutException("Continue-to-Login button not found")
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", cont)
-        time.sleep(0.2)
+        _sleep(0.2)
         try: cont.click()
         except: self.driver.execute_script("arguments[0].click();", cont)
         # Check for CAPTCHA error (e.g., invalid CAPTCHA warning)
@@ -2421,16 +4624,19 @@ class IDBIWorker(threading.Thread):
         )
         # scroll it into view and click
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", checkbox_span)
-        time.sleep(0.2)
+        _sleep(0.2)
         try:
             checkbox_span.click()
         except Exception:
             # fallback to JS click if normal click is blocked
             self.driver.execute_script("arguments[0].click();", checkbox_span)
             
-        time.sleep(2)
         pwd.send_keys("\n")  # submits form
-        time.sleep(10)
+        # wait for the submit to settle before dismissing whatever popup it raised
+        try:
+            _wait_network_idle(self.driver, 15, label="IDBI login submit")
+        except UnexpectedAlertPresentException:
+            pass  # a native alert is up; it is accepted below
         # 1) Try to send ENTER to dismiss your custom popup
         try:
             ActionChains(self.driver).send_keys(Keys.ENTER).perform()
@@ -2447,9 +4653,6 @@ class IDBIWorker(threading.Thread):
             # no alert or already accepted
             pass
 
-        # 3) Give the page a moment to start loading
-        time.sleep(5)
-
         # 4) Now wait for the dashboard to appear, but catch any late alert
         try:
             WebDriverWait(self.driver, 20).until(
@@ -2502,7 +4705,8 @@ class IDBIWorker(threading.Thread):
         row = WebDriverWait(self.driver, 60).until(
             EC.presence_of_element_located((By.XPATH, account_xpath))
         )
-        time.sleep(1)  # let any final JS finish up
+        # the balance cell is filled in by a follow-up XHR after the row renders
+        _wait_network_idle(self.driver, 15, label="IDBI accounts settle")
 
         # --- scrape the INR balance from that same <tr> ---
         bal = row.find_element(
@@ -2518,7 +4722,7 @@ class IDBIWorker(threading.Thread):
             EC.element_to_be_clickable((By.XPATH, ".//a[@title='A/C Statement']"))
         )
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", stmt)
-        time.sleep(0.2)
+        _sleep(0.2)
         try:
             stmt.click()
         except:
@@ -2540,7 +4744,7 @@ class IDBIWorker(threading.Thread):
                         self.driver.find_element(By.ID, "span_HREF_Notifications").click()
                     except:
                         pass
-                time.sleep(5)
+                _sleep(0.5)
         if not frm:
             raise TimeoutException("Statement page did not load in time")
 
@@ -2565,10 +4769,9 @@ class IDBIWorker(threading.Thread):
                 btn.click()
                 break
             except StaleElementReferenceException:
-                time.sleep(1)
+                _sleep(0.2)  # re-rendered under us; look it up again
         else:
             raise TimeoutException("Could not click VIEW STATEMENT")
-        time.sleep(5)
         # 3d) Wait for “Download:” to appear
         WebDriverWait(self.driver, 120).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, "span.downloadtext"))
@@ -2590,7 +4793,8 @@ class IDBIWorker(threading.Thread):
 
         # scroll into view and click (with JS fallback)
         self.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", xls_btn)
-        time.sleep(0.2)
+        _sleep(0.2)
+        download = _expect_download(self)
         try:
             xls_btn.click()
         except Exception:
@@ -2598,82 +4802,16 @@ class IDBIWorker(threading.Thread):
 
 
         # 3f) Wait for the file to land & upload as before…
-        end = time.time() + 60
-        xls_file = None
-        while time.time() < end:
-            files = [f for f in os.listdir(self.download_dir)
-                     if not f.lower().endswith(('.tmp', '.crdownload'))]
-            if files:
-                xls_file = max(files, key=lambda f: os.path.getctime(os.path.join(self.download_dir, f)))
-                full = os.path.join(self.download_dir, xls_file)
-                if os.path.exists(full):
-                    break
-            time.sleep(1)
-        if not xls_file:
-            raise TimeoutException("Timed out waiting for XLS download")
+        full = download.wait()
 
         self._upload_to_autobank(full)
         
     def _upload_to_autobank(self, statement_path):
-        driver = self.driver
-        wait = WebDriverWait(driver, 20)
-        original = driver.current_window_handle
-
-        # 1) Open a new tab for AutoBank
-        driver.execute_script("window.open();")
-        new_tab = [h for h in driver.window_handles if h != original][-1]
-        driver.switch_to.window(new_tab)
+        """Direct HTTP upload; drive the AutoBank page only if that isn't possible."""
+        _upload_statement(self, "IDBI", statement_path)
 
-        max_attempts = 5
-        for attempt in range(1, max_attempts+1):
-            try:
-                # a) Go to login page
-                driver.get("https://autobank.payatom.in/operator_index.php")
-                # b) Click SIGN IN if it’s there
-                try:
-                    login_btn = WebDriverWait(driver, 5).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, "a.auth-form-btn"))
-                    )
-                    login_btn.click()
-                except TimeoutException:
-                    pass  # already logged in
-
-                # c) Wait for the sidebar to confirm we’re in
-                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "nav.sidebar")))
-
-                # d) Navigate to upload form
-                driver.get("https://autobank.payatom.in/bankupload.php")
-                wait.until(EC.presence_of_element_located((By.ID, "drop-zone")))
-
-                # e) Select IDBI and attach the XLS
-                Select(driver.find_element(By.ID, "bank")) \
-                    .select_by_visible_text("IDBI")
-                acct = driver.find_element(By.ID, "account_number")
-                acct.clear()
-                acct.send_keys(self.cred["account_number"])
-                driver.find_element(By.ID, "file_input").send_keys(statement_path)
-
-                # f) Wait for success
-                wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, ".swal2-icon-success")))
-                self._send(f"✅ AutoBank upload succeeded (attempt {attempt}/{max_attempts})")
-                self._send(f"[DEBUG] XLS path: {statement_path})")
-                break
-
-            except Exception as e:
-                # on error, screenshot & retry
-                try:    self._screenshot_tabs()
-                except: pass
-                self._send(f"⚠️ AutoBank upload failed (attempt {attempt}/{max_attempts}): {e!r}")
-                if attempt == max_attempts:
-                    driver.close()
-                    driver.switch_to.window(original)
-                    raise
-                time.sleep(2)
-
-        # cleanup: close upload tab, back to main window
-        if driver.current_window_handle != original:
-            driver.close()
-            driver.switch_to.window(original)
+    def _upload_via_browser(self, statement_path):
+        _browser_upload(self, "IDBI", statement_path, timeout=20, screenshot=self._screenshot_tabs)
 
 class IDFCWorker(threading.Thread):
     """
@@ -2684,7 +4822,17 @@ class IDFCWorker(threading.Thread):
       4) Upload to AutoBank as “IDFC”
       5) On error: screenshot all tabs, retry up to 5× (cycle tabs + relogin)
     """
-    def __init__(self, bot, chat_id, alias, cred, loop, profile_dir):
+    def __init__(
+        self,
+        bot,
+        chat_id,
+        alias,
+        cred,
+        loop,
+        driver: Optional[webdriver.Chrome] = None,
+        download_folder: Optional[str]      = None,
+        profile_dir: Optional[str]         = None,
+    ):
         super().__init__(daemon=True)
         self.bot        = bot
         self.chat_id    = chat_id
@@ -2692,14 +4840,26 @@ class IDFCWorker(threading.Thread):
         self.cred       = cred            # expects keys: username, password, account_number
         self.loop       = loop
         self.profile    = profile_dir
+        self.profile_dir= profile_dir
+        self.autobank_win = None         # long-lived AutoBank upload tab
+        self.pending_uploads = deque()   # uploads handed back for the browser path
+        self.session = BankSession(self, "IDFC")   # keep-alive + resume after errors
         self.otp_code   = None            # same injection logic as captcha
         self.logged_in  = False
         self.stop_evt   = threading.Event()
         self.retry_count= 0
 
+        # ─── reuse injected Chrome (or browser context) if provided ───
+        self.reused_driver = driver is not None
+        if self.reused_driver:
+            self.driver       = driver
+            self.download_dir = download_folder
+            return
+
         # per‐alias download folder
         download_root = os.path.join(os.getcwd(), "downloads", alias)
         os.makedirs(download_root, exist_ok=True)
+        self.download_dir = download_root
         opts = webdriver.ChromeOptions()
         opts.add_argument(f"--user-data-dir={profile_dir}")
         opts.add_argument("--no-sandbox")
@@ -2709,10 +4869,9 @@ class IDFCWorker(threading.Thread):
             "download.prompt_for_download": False,
             "profile.default_content_setting_values.automatic_downloads": 1,
         })
-        self.driver = webdriver.Chrome(options=opts)
-        # clear cache/cookies
-        self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
-        self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+        self.driver = webdriver.Chrome(options=_tune_chrome_options(opts))
+        # clear cookies/storage (the HTTP cache is kept)
+        _reset_session(self.driver, "IDFC")
 
     def _send(self, text: str):
         """Send status back to Telegram."""
@@ -2763,7 +4922,9 @@ class IDFCWorker(threading.Thread):
     def _login(self):
         wait = WebDriverWait(self.driver, 30)
         # e1–e2: username → Proceed
+        _apply_url_blocklist(self.driver, "IDFC")
         self.driver.get("https://my.idfcfirstbank.com/login")
+        _log_page_load(self.driver, "IDFC", self.alias)
         wait.until(EC.presence_of_element_located((By.NAME, "customerUserName")))
         self.driver.find_element(By.NAME, "customerUserName")\
             .send_keys(self.cred["username"])
@@ -2788,7 +4949,7 @@ class IDFCWorker(threading.Thread):
         while self.otp_code is None and not self.stop_evt.is_set():
             if time.time() - start > 300:  # 5-min expiry
                 raise TimeoutException("OTP expired—restarting login")
-            time.sleep(0.5)
+            _sleep(0.5)
         if self.stop_evt.is_set():
             return
         # inject OTP and submit
@@ -2803,6 +4964,7 @@ class IDFCWorker(threading.Thread):
         )))
 
         self.logged_in = True
+        self.idfc_win  = self.driver.current_window_handle
         self._send("✅ Logged in to IDFC")
 
     def _select_date(self, field_id: str, target: date):
@@ -2848,16 +5010,19 @@ class IDFCWorker(threading.Thread):
             (By.CSS_SELECTOR, "[data-testid='AccountEffectiveBalance-amount']"))
         ).text.strip()
         self._send(f"💰 {bal}")
-        time.sleep(0.5)
+        gate = _balance_gate(self.alias)
+        if not gate.should_fetch(bal):
+            return  # balance unchanged → no statement this cycle
+        _sleep(0.5)
         # e9–e14: download Excel via datepicker
         self.driver.find_element(By.CSS_SELECTOR,
             "[data-testid='download-statement-link']").click()
-        time.sleep(0.5)
+        _sleep(0.5)
         # e10: choose Custom by clicking the label
         wait.until(EC.element_to_be_clickable(
             (By.CSS_SELECTOR, "label[for='AccountStatementDate-4']"))
         ).click()
-        time.sleep(0.5)
+        _sleep(0.5)
 
         # select From = yesterday, To = today
         # select dates based on current time (Asia/Kolkata)
@@ -2870,9 +5035,9 @@ class IDFCWorker(threading.Thread):
             to_date  = now.date()                      # today
 
         self._select_date("custom-from-date", frm_date)
-        time.sleep(5)
+        _wait_gone(self.driver, (By.CLASS_NAME, "react-datepicker-popper"), 10, "IDFC from-date picker")
         self._select_date("custom-to-date", to_date)
-        time.sleep(5)
+        _wait_gone(self.driver, (By.CLASS_NAME, "react-datepicker-popper"), 10, "IDFC to-date picker")
         # ▶️ open the custom dropdown
         self.driver.find_element(By.ID, "select-account-statement-format").click()
         # ▶️ wait for and click the “Excel” option
@@ -2881,126 +5046,72 @@ class IDFCWorker(threading.Thread):
             "//ul[@id='select-account-statement-format-list']//span[text()='Excel']"
         ))).click()
         # ▶️ now click Download
+        download = _expect_download(self)
         self.driver.find_element(By.CSS_SELECTOR, "[data-testid='PrimaryAction']").click()
-        time.sleep(5)
-        # wait for download to finish (same logic as KGBWorker)
-        dl_dir, timeout = os.path.join(os.getcwd(),"downloads",self.alias), 60
-        end = time.time() + timeout
-        stmt = None
-        while time.time()<end:
-            files = [f for f in os.listdir(dl_dir)
-                     if not f.endswith(('.tmp','.crdownload'))]
-            if files:
-                stmt = max(files, key=lambda f: os.path.getctime(os.path.join(dl_dir,f)))
-                break
-            time.sleep(1)
-        if not stmt:
-            raise TimeoutException("Statement download timed out")
+        # wait for exactly this request's file to finish
+        stmt_path = download.wait()
 
         # upload to AutoBank
-        self._upload_to_autobank(os.path.join(dl_dir, stmt))
+        self._upload_to_autobank(stmt_path)
 
         # e15: close the statement page
         self.driver.find_element(By.CSS_SELECTOR, "[aria-label='Cross']").click()
+        gate.fetched(bal)
     
     def _upload_to_autobank(self, xls_path):
-        original_handle = self.driver.current_window_handle
-        # 1) open new tab
-        self.driver.execute_script("window.open();")
-        new_tab = [h for h in self.driver.window_handles if h != original_handle][0]
-        self.driver.switch_to.window(new_tab)
+        """Direct HTTP upload; drive the AutoBank page only if that isn't possible."""
+        _upload_statement(self, "IDFC", xls_path)
 
-        max_attempts = 5
-        for attempt in range(1, max_attempts + 1):
-            try:
-                # go to AutoBank
-                self.driver.get("https://autobank.payatom.in/operator_index.php")
-
-                # sign-in if needed
-                try:
-                    sign_in = WebDriverWait(self.driver, 5).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, "a.auth-form-btn"))
-                    )
-                    sign_in.click()
-                except TimeoutException:
-                    pass
-
-                # navigate to upload page
-                WebDriverWait(self.driver, 20).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "nav.sidebar"))
-                )
-                self.driver.get("https://autobank.payatom.in/bankupload.php")
-                WebDriverWait(self.driver, 20).until(
-                    EC.presence_of_element_located((By.ID, "drop-zone"))
-                )
-
-                # select IDFC, fill account & attach file
-                Select(self.driver.find_element(By.ID, "bank")) \
-                    .select_by_visible_text("IDFC")
-                acct = self.driver.find_element(By.ID, "account_number")
-                acct.clear()
-                acct.send_keys(self.cred["account_number"])
-                self.driver.find_element(By.ID, "file_input")\
-                    .send_keys(xls_path)
-
-                # wait for success icon
-                WebDriverWait(self.driver, 120).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".swal2-icon-success"))
-                )
-
-                self._send(f"✅ AutoBank upload succeeded (attempt {attempt}/{max_attempts})")
-                self._send(f"[DEBUG] XLS path: {xls_path})")
-                break
-
-            except Exception as e:
-                # on failure: screenshot + notify
-                try:
-                    self._screenshot_tabs()
-                except:
-                    pass
-                self._send(f"⚠️ AutoBank upload failed (attempt {attempt}/{max_attempts}): {e!r}")
-                if attempt < max_attempts:
-                    continue
-                else:
-                    # give up & bubble up to full retry cycle
-                    self.driver.close()
-                    self.driver.switch_to.window(original_handle)
-                    raise
-
-        # cleanup: close upload tab, return to bank tab
-        self.driver.close()
-        self.driver.switch_to.window(original_handle)
+    def _upload_via_browser(self, xls_path):
+        _browser_upload(self, "IDFC", xls_path, timeout=120, screenshot=self._screenshot_tabs)
 
-        
     def run(self):
+        _bind_cancel(self)
         self._send("🚀 Starting IDFC automation")
         while not self.stop_evt.is_set():
             try:
-                self._login()
-                self.retry_count = 0
+                if not self.session.resume():   # still logged in after a non-auth error?
+                    self._login()
+                    self.retry_count = 0
                 # steady-state loop
                 while not self.stop_evt.is_set():
                     self._scrape_and_upload()
-                    time.sleep(60)
-                break
+                    self.retry_count = 0
+                    _drain_browser_uploads(self)
+                    if _recycle_worker_browser(self):
+                        break  # fresh Chrome → log in again
+                    if not _scheduler.wait_turn(self, self.session.keep_alive, SESSION_KEEPALIVE):
+                        break
+                    if not self.logged_in:
+                        break  # bank ended the session while idle → log in again
+            except Cancelled:
+                break  # /stop interrupted a sleep or wait
             except Exception as e:
-                if self.retry_count >= 5:
+                self.retry_count += 1
+                if self.retry_count > 5:
                     self._send(f"❌ Failed {self.retry_count} times—stopping.")
-                    break
+                    return self.stop()
                 self._send(f"⚠️ {e!r}")
-                self._retry()
-        # cleanup
-        try: self.driver.quit()
-        except: pass
+                # next pass resumes if the bank session survived, else _retry() + login
+        # stopped: recycle (or quit) Chrome and release the profile — once
+        self.stop()
 
     def stop(self):
         self.stop_evt.set()
+        _unbind_cancel()
+        if not _claim_stop(self):
+            return
         try:
             self._send("🚪 Logging out...")
-            # no explicit logout URL, so just quit
-        except: pass
-        try: self.driver.quit()
+            # no explicit logout URL, so just quit (or recycle the pooled Chrome)
         except: pass
+        try:
+            if self.reused_driver:
+                _recycle_pooled_driver(self.driver)
+            else:
+                self.driver.quit()
+        except Exception: pass
+        _leases.release(self.alias, self.profile_dir)
 
 # extend your pool logic to accept both types:
 _WORKER_CLASSES = {
@@ -3026,62 +5137,37 @@ async def on_startup(app: Application) -> None:
     # ensure base download directory exists
     os.makedirs(_download_base, exist_ok=True)
 
-    # Launch one Chrome window per profile dir, each with its own download folder
-    for profile in _free_profiles:
-        # a) create a download folder named for this profile
-        prof_name = os.path.basename(profile)
-        download_folder = os.path.join(_download_base, prof_name)
-        os.makedirs(download_folder, exist_ok=True)
-        _profile_downloads[profile] = download_folder
-
-        # b) start Chrome with that profile
-        opts = webdriver.ChromeOptions()
-        opts.add_argument(f"--user-data-dir={profile}")
-        opts.add_argument("--no-sandbox")
-        opts.add_argument("--disable-dev-shm-usage")
-        # ─── (B) ─── Give Chrome a unique download.default_directory ───
-        prefs = {
-            "download.default_directory": download_folder,
-            "download.prompt_for_download": False,
-            "profile.default_content_setting_values.automatic_downloads": 1,
-        }
-        opts.add_experimental_option("prefs", prefs)
-        driver = webdriver.Chrome(options=opts)
-
-        # c) instruct Chrome to dump all downloads into our profile folder
-        driver.execute_cdp_cmd(
-            "Browser.setDownloadBehavior",
-            {"behavior": "allow", "downloadPath": download_folder}
-        )
-        driver.get("https://autobank.payatom.in/bankupload.php")
-        # track driver and its state
-        _drivers[profile] = driver
-        _active[profile] = False
-
-        # prompt user to log in
+    # Launch the warm minimum of Chrome windows, each with its own download folder;
+    # the rest of the pool is started on demand by /run
+    prompted = set()
+    for profile in _free_profiles[:MIN_WARM_PROFILES]:
+        await asyncio.to_thread(_launch_profile, profile)
+        download_folder = _profile_downloads[profile]
+        if _slot_host(profile) in prompted:
+            continue
+        prompted.add(_slot_host(profile))
+
+        # prompt user to log in (a headless Chrome has no window, so the
+        # profile must already carry an AutoBank session from an earlier run)
         await app.bot.send_message(
             chat_id=config.TELEGRAM_CHAT_ID,
             text=(
                 f"🔐 Please log in to AutoBank now in Chrome profile:\n"
-                f"`{profile}`\n"
+                f"`{_slot_host(profile)}`\n"
                 f"Downloads will go to `{download_folder}`"
+                + ("\n_Headless mode: reusing the saved AutoBank session._" if CHROME_HEADLESS else "")
             ),
             parse_mode=ParseMode.MARKDOWN,
         )
 
-    # 2) Start a background thread to refresh inactive profiles every 10m
-    def _keep_alive_loop():
-        while True:
-            for prof, drv in _drivers.items():
-                if not _active[prof]:
-                    print(f"[KeepAlive] refreshing profile {prof}") 
-                    try:
-                        drv.switch_to.window(drv.window_handles[0])
-                        drv.refresh()
-                    except Exception:
-                        pass
-            time.sleep(600)
-    threading.Thread(target=_keep_alive_loop, daemon=True).start()
+    # 2) Start the pool manager (health probes, keep-alive, warm minimum)
+    global _notify_bot, _notify_loop
+    _notify_bot, _notify_loop = app.bot, asyncio.get_running_loop()
+    threading.Thread(target=_pool_manager_loop, daemon=True).start()
+    threading.Thread(target=_resource_monitor_loop, daemon=True).start()
+    _uploads.start()
+    _scheduler.start()
+    threading.Thread(target=_resume_pending_uploads, daemon=True).start()
 
     # 3) (Optional) your existing “restarted” message below…
 
@@ -3140,6 +5226,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "`/stop <alias>`  • Stop automation\n"
         "`/stopall`       • Stop all sessions\n"
         "`/running`       • List running aliases\n"
+        "`/cadence`       • Polling interval per alias\n"
         "`/active`        • Alive in last 3 min\n\n"
         "💰 *Balances & Reports*:\n"
         "`/balance`       • Show current balances\n"
@@ -3147,7 +5234,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📂 *Fetch once*:\n"
         "`/file <alias>`  • Download last statement\n\n"
         "📸 *Diagnostics*:\n"
-        "`/status <alias>` • Capture screenshots for an alias\n\n"
+        "`/status <alias>` • Capture screenshots for an alias\n"
+        "`/resources`     • Chrome memory / CPU per profile\n"
+        "`/uploads`       • AutoBank upload stats per bank\n"
+        "`/txn <amount|ref|text> [date]` • Search transactions\n"
+        "`/flows [date]`   • Daily inflow / outflow per bank & account\n\n"
         "🔧 *Maintenance*:\n"
         "`/restart`       • Restart the bot\n\n"
         "⚠️ Tap below for full details, examples & limitations."
@@ -3161,7 +5252,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def detailed_help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()  # removes the “loading…” icon
 
-    detailed = """
+    detailed = f"""
 🔷 *PayAtom Automation Bot — Full Help* 🔷
 
 👋 *Welcome!* This bot automates:
@@ -3208,6 +5299,10 @@ async def detailed_help_callback(update: Update, context: ContextTypes.DEFAULT_T
 • `/running`  
    – Shows which aliases are currently _spawned_.
 
+• `/cadence`  
+   – Current cycle interval per alias: shorter while the account is busy, longer when idle or overnight.  
+   – Also lists the slowest page waits (average / max seconds).
+
 • `/active`  
    – Shows which aliases have reported activity in the _last 3 minutes_.
 
@@ -3232,6 +5327,19 @@ async def detailed_help_callback(update: Update, context: ContextTypes.DEFAULT_T
 • `/status <alias>`  
    – Captures and sends screenshots of all open tabs for that alias.
 
+• `/resources`  
+   – Latest RSS / CPU per Chrome; ones over the limit are recycled between cycles.
+
+• `/uploads`  
+   – Upload queue depth and per-bank direct / browser / retry / failure counts.
+
+• `/txn <amount|ref|text> [date]`  
+   – Searches every parsed transaction across all accounts.  
+   – Example: `/txn 49500`, `/txn UTR12345`, `/txn amazon 12-05-2024`
+
+• `/flows [date]`  
+   – Inflow / outflow per bank and per account for a day (default today).
+
 ────────────────────────
 🔧 *Maintenance*
 
@@ -3264,7 +5372,7 @@ async def detailed_help_callback(update: Update, context: ContextTypes.DEFAULT_T
 ────────────────────────
 ⚠️ *Limitations*
 
-• Max **10** concurrent sessions (Chrome profiles).  
+• Max **{MAX_SESSIONS}** concurrent sessions (Chrome profiles, launched on demand).  
 • Captcha must be solved _manually_ in the Telegram group.  
 • If session expires or errors > 5 times, that alias stops.  
 • Statement window is last 24 h (IOB) or current view (others).  
@@ -3347,45 +5455,10 @@ async def run_alias(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if alias in _profile_assignments:
         return await update.message.reply_text(f"❌ Already running “{alias}”.")
-    if not _free_profiles:
-        return await update.message.reply_text(
-            "❌ Maximum of 10 concurrent sessions reached."
-        )
 
-    # Reserve a profile and grab its Chrome driver
-    profile = _free_profiles.pop(0)
-    _profile_assignments[alias] = profile
-    driver = _drivers[profile]
-    _active[profile] = True
-
-    # Collapse to a single AutoBank tab
-    main_handle = driver.window_handles[0]
-    for handle in driver.window_handles[1:]:
-        driver.switch_to.window(handle)
-        driver.close()
-    driver.switch_to.window(main_handle)
-
-    # Use the profile’s dedicated download folder set at startup
-    download_folder = _profile_downloads[profile]
-
-    # Spawn the worker with the existing driver and download folder
-    loop = asyncio.get_running_loop()
-    worker = WorkerClass(
-        bot=context.bot,
-        chat_id=update.effective_chat.id,
-        alias=alias,
-        cred=creds[alias],
-        loop=loop,
-        driver=driver,
-        download_folder=download_folder,
-        profile_dir=profile,
-    )
-    workers[alias] = worker
-    worker.start()
-
-    await update.message.reply_text(
-        f"Started *{alias}* using profile `{os.path.basename(profile)}`",
-        parse_mode=ParseMode.MARKDOWN,
+    await _lease_and_start(
+        context.bot, update.effective_chat.id, update.message.reply_text,
+        alias, WorkerClass,
     )
 
 
@@ -3452,7 +5525,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             await asyncio.sleep(1)
             for alias, worker in list(workers.items()):
                 try: worker.stop()
-                except: pass
+                except Exception: pass
             workers.clear()
             os.execv(sys.executable, [sys.executable] + sys.argv)
         else:
@@ -3524,30 +5597,25 @@ async def stop_alias(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     alias = context.args[0]
+    # A queued alias just leaves the queue
+    if _leases.cancel(alias):
+        await update.message.reply_text(f"✅ Removed `{alias}` from the queue")
+        return
+
     # Remove from our running workers
     worker = workers.pop(alias, None)
     if not worker:
         await update.message.reply_text(f"`{alias}` not running")
         return
 
-    # Release the Chrome profile
-    profile = _profile_assignments.pop(alias, None)
-    if profile:
-        # put it back at the front so it’s the next one reused
-        _free_profiles.insert(0, profile)
-
-    # Now actually stop the thread/browser
+    # Interrupt the worker and wait for its thread to finish its own stop()
+    # (logout, recycle, lease release → next queued alias), off the event loop
     try:
-        if hasattr(worker, "stop"):
-            # TMBWorker.stop() will log out, quit Chrome, and set the flag
-            worker.stop()
-        else:
-            # IOBWorker doesn’t have stop(); just flip its event flag
-            worker.stop_evt.set()
-            worker.stop()
+        await asyncio.to_thread(_stop_worker, worker)
     except Exception as e:
         logger.error(f"Error stopping {alias}: {e}", exc_info=True)
         await update.message.reply_text(f"⚠️ Error while stopping `{alias}`: {e}")
+    _leases.release(alias)   # no-op unless stop() failed before releasing
 
     await update.message.reply_text(f"✅ Stopped `{alias}`")
 
@@ -3585,7 +5653,7 @@ async def running(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     List all aliases currently running and which profile they’re on.
     """
-    if not workers:
+    if not workers and not _leases.queued():
         await update.message.reply_text("No aliases are currently running.")
         return
 
@@ -3593,7 +5661,17 @@ async def running(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for alias in workers:
         profile_dir = _profile_assignments.get(alias, "")
         profile = os.path.basename(profile_dir) if profile_dir else "<unknown>"
-        lines.append(f"- `{alias}` on profile `{profile}`")
+        gate = _balance_gates.get(alias)
+        cycles = f" — statements {gate.executed} fetched / {gate.skipped} skipped" if gate else ""
+        sched = _scheduler.stats(alias)
+        if sched and sched["missed"]:
+            cycles += f" — {sched['missed']} missed deadline(s)"
+        session = getattr(workers[alias], "session", None)
+        if session and session.resumed:
+            cycles += f" — {session.resumed} error(s) resumed without re-login"
+        lines.append(f"- `{alias}` on profile `{profile}`{cycles}")
+    for pos, alias in enumerate(_leases.queued(), start=1):
+        lines.append(f"- `{alias}` ⏳ queued (#{pos})")
 
     await update.message.reply_text(
         "🚥 *Currently running:* \n" + "\n".join(lines),
@@ -3620,6 +5698,144 @@ async def active(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode=ParseMode.MARKDOWN,
     )
 
+async def txn(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/txn <amount|ref|text> [date] — search parsed transactions of every alias."""
+    args = list(context.args)
+    if not args:
+        return await update.message.reply_text("Usage: /txn <amount|ref|text> [date]")
+
+    on = None
+    if len(args) > 1:
+        for fmt in ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d"):
+            try:
+                on = datetime.strptime(args[-1], fmt).date()
+                args.pop()
+                break
+            except ValueError:
+                continue
+
+    started = time.perf_counter()
+    rows = await asyncio.to_thread(_txn_store.search, " ".join(args), on)
+    took = (time.perf_counter() - started) * 1000
+    if not rows:
+        return await update.message.reply_text(f"No matching transactions ({took:.0f} ms).")
+
+    lines = []
+    for alias, txn_date, debit, credit, reference, narration in rows:
+        amount = f"+{credit:,.2f}" if credit else f"-{debit:,.2f}"
+        lines.append(
+            f"• <code>{html.escape(alias)}</code> {txn_date} <b>{amount}</b> "
+            f"{html.escape(reference)} {html.escape(narration[:40])}"
+        )
+    await update.message.reply_text(
+        f"🔎 <b>{len(rows)} match(es)</b> ({took:.0f} ms)\n" + "\n".join(lines),
+        parse_mode=ParseMode.HTML,
+    )
+
+async def flows(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/flows [date] — inflow / outflow per bank and account for one day."""
+    day = date.today()
+    if context.args:
+        for fmt in ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d"):
+            try:
+                day = datetime.strptime(context.args[0], fmt).date()
+                break
+            except ValueError:
+                continue
+        else:
+            return await update.message.reply_text("Usage: /flows [dd-mm-yyyy]")
+
+    per_alias, per_bank = _flows.report(day)
+    if not per_alias:
+        return await update.message.reply_text(f"No transactions recorded for {day:%d-%m-%Y}.")
+
+    lines = [f"{'':16}{'in':>14}{'out':>14}"]
+    for bank, (inflow, outflow) in per_bank.items():
+        lines.append(f"{bank[:16]:16}{inflow:>14,.2f}{outflow:>14,.2f}")
+    lines.append("")
+    # biggest movers first; Telegram caps a message at 4096 characters
+    ranked = sorted(per_alias.items(), key=lambda kv: -(kv[1][0] + kv[1][1]))
+    for n, (alias, (inflow, outflow)) in enumerate(ranked):
+        if sum(len(l) + 1 for l in lines) > 3700:
+            lines.append(f"… {len(ranked) - n} more")
+            break
+        lines.append(f"{alias[:16]:16}{inflow:>14,.2f}{outflow:>14,.2f}")
+
+    await update.message.reply_text(
+        f"💸 <b>Flows {day:%d-%m-%Y}</b>\n<pre>{html.escape(chr(10).join(lines))}</pre>",
+        parse_mode=ParseMode.HTML,
+    )
+
+async def cadence(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/cadence — current polling interval per running alias."""
+    rows = [(alias, _scheduler.stats(alias)) for alias in workers]
+    rows = [(alias, st) for alias, st in rows if st]
+    if not rows:
+        return await update.message.reply_text("No cycles scheduled yet.")
+
+    now = time.time()
+    lines = [f"{'alias':20}{'every':>7}{'next':>7}{'missed':>7}  last activity"]
+    for alias, st in sorted(rows, key=lambda r: r[1]["interval"]):
+        seen = (time.strftime("%H:%M", time.localtime(st["last_active"]))
+                if st["last_active"] else "—")
+        lines.append(
+            f"{alias[:20]:20}{st['interval']:>6.0f}s{max(0, st['due'] - now):>6.0f}s"
+            f"{st['missed']:>7}  {seen}"
+        )
+    # where the cycle time goes: the slowest page waits on average
+    waits = sorted(_wait_stats.items(), key=lambda kv: -kv[1][1] / kv[1][0])[:8]
+    if waits:
+        lines += ["", f"{'wait':27}{'avg':>6}{'max':>6}{'n':>5}"]
+        lines += [f"{label[:27]:27}{total / n:>5.1f}s{worst:>5.1f}s{n:>5}"
+                  for label, (n, total, worst) in waits]
+    await update.message.reply_text(
+        f"⏱️ <b>Polling cadence</b> ({CYCLE_MIN_INTERVAL}–{CYCLE_MAX_INTERVAL}s)\n"
+        f"<pre>{html.escape(chr(10).join(lines))}</pre>",
+        parse_mode=ParseMode.HTML,
+    )
+
+async def uploads(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Per-bank upload counters and the current queue depth."""
+    stats = _uploads.stats()
+    if not stats:
+        return await update.message.reply_text("No uploads yet.")
+    lines = []
+    for bank, st in sorted(stats.items()):
+        avg = st["secs"] / st["direct"] if st["direct"] else 0
+        lines.append(
+            f"`{bank}`: {st['direct']} direct ({avg:.1f}s avg), {st['browser']} browser, "
+            f"{st['retries']} retries, {st['failed']} failed, {st['unconfirmed']} unconfirmed"
+        )
+    await update.message.reply_text(
+        f"📤 *Uploads* (queue: {_uploads.pending()})\n" + "\n".join(lines),
+        parse_mode=ParseMode.MARKDOWN,
+    )
+
+async def resources(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the latest RSS / CPU sample for every pooled Chrome."""
+    if not _resource_samples:
+        return await update.message.reply_text("No resource samples yet.")
+
+    owners: dict[str, list] = {}        # Chrome → aliases on any of its slots
+    for alias, profile in _profile_assignments.items():
+        owners.setdefault(_slot_host(profile), []).append(alias)
+    lines = []
+    for host in sorted(_resource_samples):
+        sample = _resource_samples[host]
+        flag = " ♻️" if host in _recycle_requested else ""
+        aliases = owners.get(host)
+        used_by = f" ← `{', '.join(aliases)}`" if aliases else " (idle)"
+        lines.append(
+            f"`{os.path.basename(host)}`{used_by}: "
+            f"{sample['rss_mb']:.0f} MB, {sample['cpu']:.0f}% CPU, "
+            f"{sample['procs']} procs{flag}"
+        )
+    limits = f"Recycle at {RECYCLE_RSS_MB or '∞'} MB / {RECYCLE_CPU_PCT or '∞'}% CPU"
+    await update.message.reply_text(
+        "🖥️ *Chrome resources:*\n" + "\n".join(lines) + f"\n_{limits}_",
+        parse_mode=ParseMode.MARKDOWN,
+    )
+
 async def balance_all(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE
@@ -3666,12 +5882,9 @@ async def file_alias(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 2️⃣ If already running, just grab latest download
     if alias in _profile_assignments:
-        # instead of "downloads/…", build the full ~/autobot/downloads path
-        dl_dir = os.path.expanduser(f"~/autobot/downloads/{alias}")
-        files = glob.glob(os.path.join(dl_dir, "*"))
-        if not files:
+        latest = _artifacts.latest(alias)
+        if not latest:
             return await update.message.reply_text(f"No files for `{alias}` yet.")
-        latest = max(files, key=os.path.getctime)
         with open(latest, "rb") as fp:
             return await context.bot.send_document(
                 chat_id=update.effective_chat.id,
@@ -3728,7 +5941,7 @@ async def handle_restart_pin(update: Update, context: ContextTypes.DEFAULT_TYPE)
         for alias, worker in list(workers.items()):
             try:
                 worker.stop()
-            except:
+            except Exception:
                 pass
         workers.clear()
         os.execv(sys.executable, [sys.executable] + sys.argv)
@@ -3739,8 +5952,8 @@ async def handle_restart_pin(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def stop_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Stop *all* running aliases.  First send each through its logout routine,
-    wait 10 seconds, then forcibly stop/quit each one and release their profiles.
+    Stop *all* running aliases at once: interrupt every worker, then let each
+    log out and release its profile in parallel.
     """
     if not workers:
         return await update.message.reply_text("Nothing to stop — no aliases are running.")
@@ -3749,39 +5962,25 @@ async def stop_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     to_stop = list(workers.items())   # list of (alias, worker)
     # clear our tables so new /run can reuse profiles immediately
     workers.clear()
-    for alias, _ in to_stop:
-        _profile_assignments.pop(alias, None)
+    for alias in _leases.queued():
+        _leases.cancel(alias)
 
-    # 1) ask each worker to log themselves out
+    # 1) interrupt all workers first so none starts another step
     for alias, worker in to_stop:
-        try:
-            # if they've got a dedicated logout method, use it
-            if hasattr(worker, "_logout"):
-                worker._logout()
-            else:
-                # fallback: stop() includes logout+quit
-                worker.stop()
-        except Exception as e:
-            logger.error(f"Error during logout of {alias}: {e}", exc_info=True)
+        (getattr(worker, "stop_evt", None) or worker._stop_event).set()
 
-    # 2) wait a bit for those logout navigations to finish
-    await asyncio.sleep(10)
+    # 2) log out + recycle every browser in parallel (stop() includes the logout)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_stop_worker, worker) for _, worker in to_stop),
+        return_exceptions=True,
+    )
+    for (alias, _), result in zip(to_stop, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error during stop of {alias}: {result!r}")
 
-    # 3) now force‐stop every worker (quit leftover browsers, set stop flags)
+    # 3) release every lease (no-op for workers that already released theirs)
     for alias, worker in to_stop:
-        try:
-            worker.stop()
-        except Exception:
-            # ignore if already quit
-            pass
-
-    # 4) put all freed profiles back at the front so they’re used next
-    #    (we popped them above; PROFILE_DIRS order remains)
-    for _, worker in to_stop:
-        profile = getattr(worker, "profile_dir", None) \
-               or getattr(worker, "profile", None)
-        if profile:
-            _free_profiles.insert(0, profile)
+        _leases.release(alias)
 
     await update.message.reply_text("✅ All aliases have been logged out and stopped.")
 
@@ -3805,6 +6004,11 @@ def main():
     app.add_handler(CommandHandler("balance", balance_all))
     app.add_handler(CommandHandler("file", file_alias))
     app.add_handler(CommandHandler("status", status_alias))
+    app.add_handler(CommandHandler("resources", resources))
+    app.add_handler(CommandHandler("uploads", uploads))
+    app.add_handler(CommandHandler("txn", txn))
+    app.add_handler(CommandHandler("flows", flows))
+    app.add_handler(CommandHandler("cadence", cadence))
     app.add_handler(CommandHandler("restart", restart_bot))
     app.add_handler(CallbackQueryHandler(handle_restart_decision, pattern="^confirm_restart|cancel_restart$"))
     app.add_handler(CallbackQueryHandler(kgb_button, pattern=r"^kgb\|"))
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# statements.py
+# Bank statement readers: turn the TMB / IOB / KGB / IDBI / IDFC downloads into
+# one normalized stream of Transaction records.
+import csv
+import hashlib
+import re
+import sys
+import time
+from datetime import date, datetime
+from html.parser import HTMLParser
+from io import BytesIO, StringIO
+from typing import Iterator, NamedTuple, Optional
+
+
+class Transaction(NamedTuple):
+    date:      date
+    narration: str
+    debit:     float
+    credit:    float
+    balance:   Optional[float]
+    reference: str
+    bank:      str
+
+
+# --- raw rows -------------------------------------------------------------
+
+class _TableParser(HTMLParser):
+    """Collects <tr>/<td> text; several banks serve HTML tables named *.xls."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows: list = []
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None:
+            self._row.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def _xls_rows(raw: bytes) -> Iterator[list]:
+    import xlrd  # only needed for legacy .xls
+    book = xlrd.open_workbook(file_contents=raw, on_demand=True)
+    for sheet in book.sheets():
+        for i in range(sheet.nrows):
+            row = []
+            for cell in sheet.row(i):
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    row.append(xlrd.xldate_as_datetime(cell.value, book.datemode))
+                else:
+                    row.append(cell.value)
+            yield row
+
+
+def _xlsx_rows(raw: bytes) -> Iterator[list]:
+    import openpyxl  # only needed for .xlsx
+    book = openpyxl.load_workbook(BytesIO(raw), read_only=True, data_only=True)
+    for sheet in book.worksheets:
+        for row in sheet.iter_rows(values_only=True):
+            yield ["" if v is None else v for v in row]
+
+
+def read_rows(path: str) -> Iterator[list]:
+    """Yield the raw cell rows of any statement file, whatever its real format."""
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    if raw[:4] == b"\xd0\xcf\x11\xe0":          # OLE2 → real .xls
+        yield from _xls_rows(raw)
+        return
+    if raw[:2] == b"PK":                        # zip → .xlsx
+        yield from _xlsx_rows(raw)
+        return
+
+    text = raw.decode("utf-8-sig", errors="replace")
+    if "<table" in text[:20000].lower():
+        parser = _TableParser()
+        parser.feed(text)
+        yield from parser.rows
+        return
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(StringIO(text), dialect)
+
+
+# --- normalization --------------------------------------------------------
+
+# header keywords per normalized field, matched against lower-cased cells
+_HEADER_KEYS = {
+    "date":      ("txn date", "transaction date", "tran date", "value date", "date"),
+    "narration": ("narration", "description", "particulars", "remarks", "details"),
+    "debit":     ("debit", "withdrawal", "dr amount", "amount dr"),
+    "credit":    ("credit", "deposit", "cr amount", "amount cr"),
+    "balance":   ("balance",),
+    "reference": ("ref", "cheque", "chq", "instrument", "utr"),
+    "amount":    ("amount",),
+    "drcr":      ("dr/cr", "cr/dr", "type"),
+}
+
+# per bank: the date formats its export uses, tried in order
+BANK_FORMATS = {
+    "TMB":  ("%d/%m/%Y", "%d-%m-%Y", "%d-%b-%Y"),
+    "IOB":  ("%d-%b-%Y", "%d/%m/%Y", "%d-%m-%Y"),
+    "KGB":  ("%d-%m-%Y", "%d/%m/%Y", "%d-%b-%Y"),
+    "IDBI": ("%d/%m/%Y", "%d-%m-%Y", "%d-%b-%Y"),
+    "IDFC": ("%d-%b-%Y", "%d %b %Y", "%d/%m/%Y"),
+}
+
+_AMOUNT_RE = re.compile(r"[^\d.\-]")
+_TIME_RE   = re.compile(r"\s+\d{1,2}:\d{2}(:\d{2})?(\s*[AP]M)?$", re.IGNORECASE)
+
+
+def _amount(value) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if not text or text in ("-", "--"):
+        return None
+    negative = text.startswith("(") and text.endswith(")")
+    text = _AMOUNT_RE.sub("", text.upper().replace("CR", "").replace("DR", ""))
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def _date(value, formats) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _TIME_RE.sub("", str(value).strip())
+    for fmt in formats:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def header_map(row: list) -> dict:
+    """field → column index, if `row` looks like the transactions header."""
+    columns = {}
+    for idx, cell in enumerate(row):
+        label = str(cell).strip().lower()
+        if not label:
+            continue
+        for field, keys in _HEADER_KEYS.items():
+            if field not in columns and any(k in label for k in keys):
+                columns[field] = idx
+                break
+    has_amounts = ("debit" in columns and "credit" in columns) or "amount" in columns
+    return columns if "date" in columns and has_amounts else {}
+
+
+def has_amount(row: list, columns: dict) -> bool:
+    """True if any debit / credit / amount cell of `row` holds a number."""
+    for field in ("debit", "credit", "amount"):
+        idx = columns.get(field)
+        if idx is not None and idx < len(row) and _amount(row[idx]) is not None:
+            return True
+    return False
+
+
+def parse_statement(path: str, bank: str) -> Iterator[Transaction]:
+    """
+    Stream normalized transactions out of one downloaded statement.  Rows
+    before the header (account info) and rows without a valid date (opening
+    balance, totals, footers) are skipped.
+    """
+    formats = BANK_FORMATS.get(bank, BANK_FORMATS["TMB"])
+    columns: dict = {}
+    for row in read_rows(path):
+        if not columns:
+            columns = header_map(row)
+            continue
+
+        def cell(field, default=""):
+            idx = columns.get(field)
+            return row[idx] if idx is not None and idx < len(row) else default
+
+        txn_date = _date(cell("date"), formats)
+        if txn_date is None:
+            continue
+
+        if "debit" in columns:
+            debit, credit = _amount(cell("debit")) or 0.0, _amount(cell("credit")) or 0.0
+        else:
+            # single signed/typed amount column
+            amount = _amount(cell("amount")) or 0.0
+            is_debit = str(cell("drcr")).strip().upper().startswith("D") or amount < 0
+            debit, credit = (abs(amount), 0.0) if is_debit else (0.0, abs(amount))
+
+        yield Transaction(
+            date=txn_date,
+            narration=" ".join(str(cell("narration")).split()),
+            debit=debit,
+            credit=credit,
+            balance=_amount(cell("balance")),
+            reference=str(cell("reference")).strip(),
+            bank=bank,
+        )
+
+
+
+# --- dedup digest ---------------------------------------------------------
+
+# account-info / footer lines that only carry the export time, not account data
+_GENERATED_LINE_RE = re.compile(
+    r"(generated|printed|downloaded|run date|report (date|time)|as on|as of)",
+    re.IGNORECASE,
+)
+
+
+def _cell_rows(path: str) -> list:
+    """Statement as a list of cell rows; Excel files are read cell by cell if possible."""
+    try:
+        return [[str(v) for v in row] for row in read_rows(path)]
+    except Exception:
+        # no xlrd / openpyxl (or a corrupt file) → exact bytes
+        with open(path, "rb") as fh:
+            return [[fh.read().hex()]]
+
+
+def statement_digest(path: str) -> str:
+    """
+    SHA-256 over the statement rows, ignoring blank and 'generated on …' lines.
+    The latter are only dropped above the transactions header, or below it when
+    they carry no amount, so a narration like "rent as of may" still counts.
+    """
+    h = hashlib.sha256()
+    columns: dict = {}
+    for cells in _cell_rows(path):
+        row = " ".join("\t".join(cells).split())
+        if not row:
+            continue
+        if not columns:
+            columns = header_map(cells)
+            if not columns and _GENERATED_LINE_RE.search(row):
+                continue
+        elif _GENERATED_LINE_RE.search(row) and not has_amount(cells, columns):
+            continue
+        h.update(row.encode())
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+# --- throughput benchmark: python statements.py <BANK> <file> [<file> …] ---
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("usage: statements.py <BANK> <file> [<file> …]")
+    bank, files = sys.argv[1], sys.argv[2:]
+    start = time.perf_counter()
+    count = sum(1 for f in files for _ in parse_statement(f, bank))
+    elapsed = time.perf_counter() - start
+    print(f"{count} transactions from {len(files)} file(s) in {elapsed:.3f}s "
+          f"({count / elapsed if elapsed else 0:,.0f} txn/s)")
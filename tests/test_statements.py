@@ -0,0 +1,122 @@
+import os
+from datetime import date
+
+import pytest
+
+import statements
+from statements import Transaction
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def parse(name, bank):
+    return list(statements.parse_statement(os.path.join(FIXTURES, name), bank))
+
+
+def test_tmb_csv_skips_account_info_opening_and_totals():
+    txns = parse("tmb.csv", "TMB")
+    assert txns == [
+        Transaction(date(2026, 10, 1), "UPI/627401234567/RAMESH K", 0.0, 2500.0, 12500.0,
+                    "627401234567", "TMB"),
+        Transaction(date(2026, 10, 2), "NEFT-HDFC0001234-SUPPLIER CO", 1200.5, 0.0, 11299.5,
+                    "N275260012345", "TMB"),
+        Transaction(date(2026, 10, 5), "CHQ PAID 000123", 300.0, 0.0, 10999.5, "000123", "TMB"),
+    ]
+
+
+def test_iob_csv_withdrawal_deposit_and_cr_suffixed_balance():
+    txns = parse("iob.csv", "IOB")
+    assert [(t.date, t.debit, t.credit, t.balance) for t in txns] == [
+        (date(2026, 10, 3), 0.0, 1000.0, 6000.0),
+        (date(2026, 10, 4), 500.0, 0.0, 5500.0),
+    ]
+
+
+def test_kgb_html_served_as_xls():
+    txns = parse("kgb.xls", "KGB")
+    assert [(t.date, t.narration, t.debit, t.credit, t.balance) for t in txns] == [
+        (date(2026, 10, 4), "UPI/CR/627712345678/ SURESH M", 0.0, 750.0, 8750.0),
+        (date(2026, 10, 5), "IMPS/P2A/627812345678/VENDOR", 2000.0, 0.0, 6750.0),
+    ]
+
+
+def test_idbi_single_amount_with_cr_dr_column():
+    txns = parse("idbi.xls", "IDBI")
+    assert [(t.narration, t.debit, t.credit, t.balance) for t in txns] == [
+        ("NEFT CR-SBIN0001234-CUSTOMER", 0.0, 4000.0, 24000.0),
+        ("ECS DR LOAN EMI", 3500.0, 0.0, 20500.0),
+    ]
+
+
+def test_idfc_signed_and_typed_amounts():
+    txns = parse("idfc.csv", "IDFC")
+    assert [(t.date, t.debit, t.credit) for t in txns] == [
+        (date(2026, 10, 1), 0.0, 15000.0),
+        (date(2026, 10, 2), 899.0, 0.0),      # "(899.00)" with no Dr/Cr
+        (date(2026, 10, 3), 20000.0, 0.0),
+    ]
+    assert all(t.bank == "IDFC" for t in txns)
+
+
+def test_read_rows_sniffs_html_and_csv():
+    html_rows = list(statements.read_rows(os.path.join(FIXTURES, "kgb.xls")))
+    assert html_rows[0] == ["Account Number", "40123101012345"]
+    csv_rows = list(statements.read_rows(os.path.join(FIXTURES, "idfc.csv")))
+    assert csv_rows[0][:3] == ["Transaction Date", "Value Date", "Particulars"]
+
+
+def test_xlsx_statement(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(["Account No", "0123104000012345"])
+    sheet.append(["Txn Date", "Description", "Debit", "Credit", "Balance"])
+    sheet.append(["01/10/2026", "SALARY OCT", None, 50000, 50000])
+    sheet.append(["02/10/2026", "RENT", 15000, None, 35000])
+    path = tmp_path / "statement.xlsx"
+    book.save(path)
+
+    txns = list(statements.parse_statement(str(path), "IDBI"))
+    assert [(t.narration, t.debit, t.credit, t.balance) for t in txns] == [
+        ("SALARY OCT", 0.0, 50000.0, 50000.0),
+        ("RENT", 15000.0, 0.0, 35000.0),
+    ]
+
+
+def test_header_map_and_has_amount():
+    columns = statements.header_map(["Txn Date", "Description", "Debit", "Credit", "Balance"])
+    assert columns == {"date": 0, "narration": 1, "debit": 2, "credit": 3, "balance": 4}
+    assert statements.header_map(["Generated on", "05/10/2026 10:15"]) == {}
+    assert statements.has_amount(["01/10/2026", "rent as of may", "100", "", "900"], columns)
+    assert not statements.has_amount(["Statement generated on 05/10/2026", "", "", "", ""], columns)
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+EXPORT = """Account Number,610100050301234
+{generated}
+Txn Date,Description,Debit,Credit,Balance
+01/10/2026,UPI/627401234567/RAMESH K,,2500.00,12500.00
+02/10/2026,{narration},100.00,,12400.00
+Statement {generated}
+"""
+
+
+def test_digest_ignores_generated_on_header_and_footer(tmp_path):
+    first = write(tmp_path, "a.csv", EXPORT.format(
+        generated="Generated On: 05/10/2026 09:15:00", narration="RENT"))
+    second = write(tmp_path, "b.csv", EXPORT.format(
+        generated="Generated On: 05/10/2026 17:42:10", narration="RENT"))
+    assert statements.statement_digest(first) == statements.statement_digest(second)
+
+
+def test_digest_keeps_transaction_rows_with_generated_text(tmp_path):
+    first = write(tmp_path, "a.csv", EXPORT.format(
+        generated="Generated On: 05/10/2026 09:15:00", narration="INVOICE GENERATED ON 01/10"))
+    second = write(tmp_path, "b.csv", EXPORT.format(
+        generated="Generated On: 05/10/2026 09:15:00", narration="INVOICE GENERATED ON 02/10"))
+    assert statements.statement_digest(first) != statements.statement_digest(second)
@@ -0,0 +1,93 @@
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+import txn_archive
+from statements import Transaction
+from txn_archive import DailyFlows, TxnArchive
+
+
+def txn(day, credit=0.0, debit=0.0, bank="TMB", balance=None):
+    return Transaction(day, "narration", debit, credit, balance, "", bank)
+
+
+def fingerprint(t):
+    return int(t.credit * 100) * 1000 + int(t.debit * 100)
+
+
+def test_append_and_reopen_truncates_torn_tail(tmp_path):
+    archive = TxnArchive(str(tmp_path))
+    archive.append("shop_tmb", [txn(date(2026, 10, 1), credit=10), txn(date(2026, 10, 2), credit=20)],
+                   fingerprint)
+    # a crash in the middle of the next append: only some columns got the row
+    folder = os.path.join(str(tmp_path), "2026-10", "TMB")
+    for col in ("day", "alias", "debit"):
+        with open(os.path.join(folder, f"{col}.bin"), "ab") as fh:
+            fh.write(np.zeros(1, txn_archive.COLUMNS[col]).tobytes())
+
+    reopened = TxnArchive(str(tmp_path))
+    assert reopened.aliases == ["shop_tmb"]
+    assert list(reopened.scan()["credit"]) == [10.0, 20.0]
+
+    reopened.append("shop_tmb", [txn(date(2026, 10, 3), credit=30)], fingerprint)
+    rows = reopened.scan()
+    assert list(rows["credit"]) == [10.0, 20.0, 30.0]
+    assert list(rows["fingerprint"]) == [fingerprint(txn(None, credit=c)) for c in (10, 20, 30)]
+    sizes = {col: os.path.getsize(os.path.join(folder, f"{col}.bin")) // dt.itemsize
+             for col, dt in txn_archive.COLUMNS.items()}
+    assert set(sizes.values()) == {3}
+
+
+def test_query_date_bounds_are_inclusive_across_months(tmp_path):
+    archive = TxnArchive(str(tmp_path))
+    days = [date(2026, 9, 29), date(2026, 9, 30), date(2026, 10, 1), date(2026, 10, 2)]
+    archive.append("shop_tmb", [txn(d, credit=i + 1) for i, d in enumerate(days)], fingerprint)
+
+    rows = archive.query(date(2026, 9, 30), date(2026, 10, 1))
+    assert [txn_archive.day_date(d) for d in rows["day"]] == days[1:3]
+    assert len(archive.query(start=date(2026, 10, 2))["day"]) == 1
+    assert len(archive.query(end=date(2026, 9, 29))["day"]) == 1
+    assert len(archive.query(date(2026, 11, 1), date(2026, 11, 30))["day"]) == 0
+
+
+def test_totals_by_bank_and_alias(tmp_path):
+    archive = TxnArchive(str(tmp_path))
+    d = date(2026, 10, 5)
+    archive.append("a_tmb", [txn(d, credit=100), txn(d, debit=40)], fingerprint)
+    archive.append("b_iob", [txn(d, credit=7, bank="IOB")], fingerprint)
+    archive.append("c_tmb", [txn(d, credit=1)], fingerprint)
+    rows = archive.query(d, d)
+
+    assert archive.totals(rows, "alias") == {
+        "a_tmb": {"credit": 100.0, "debit": 40.0, "count": 2},
+        "b_iob": {"credit": 7.0, "debit": 0.0, "count": 1},
+        "c_tmb": {"credit": 1.0, "debit": 0.0, "count": 1},
+    }
+    assert archive.totals(rows, "bank") == {
+        "IOB": {"credit": 7.0, "debit": 0.0, "count": 1},
+        "TMB": {"credit": 101.0, "debit": 40.0, "count": 3},
+    }
+
+
+def test_daily_flows_rebuilt_from_archive_then_added_to(tmp_path):
+    today = date.today()
+    archive = TxnArchive(str(tmp_path))
+    archive.append("a_tmb", [txn(today, credit=100), txn(today - timedelta(days=1), debit=5)],
+                   fingerprint)
+    archive.append("b_iob", [txn(today, debit=30, bank="IOB")], fingerprint)
+    archive.append("a_tmb", [txn(today - timedelta(days=60), credit=999)], fingerprint)
+
+    flows = DailyFlows(archive, days=31)
+    per_alias, per_bank = flows.report(today)
+    assert per_alias == {"a_tmb": (100.0, 0.0), "b_iob": (0.0, 30.0)}
+    assert per_bank == {"IOB": (0.0, 30.0), "TMB": (100.0, 0.0)}
+    assert flows.report(today - timedelta(days=1))[0] == {"a_tmb": (0.0, 5.0)}
+    assert flows.report(today - timedelta(days=60)) == ({}, {})
+
+    # an alias first seen after construction widens the per-day rows
+    flows.add("c_idbi", [txn(today, credit=12, bank="IDBI")])
+    flows.add("a_tmb", [txn(today, credit=1)])
+    per_alias, per_bank = flows.report(today)
+    assert per_alias == {"a_tmb": (101.0, 0.0), "b_iob": (0.0, 30.0), "c_idbi": (12.0, 0.0)}
+    assert per_bank["IDBI"] == (12.0, 0.0)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# txn_archive.py
+# Append-only columnar archive of normalized transactions (see statements.py),
+# one raw column file per field, partitioned by month and bank, read back as
+# NumPy memmaps for vectorized filters and aggregates.
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+# column name → dtype; narration text stays in the SQLite transaction store
+COLUMNS = {
+    "day":         np.dtype("<i4"),   # days since 1970-01-01
+    "alias":       np.dtype("<i4"),   # index into aliases.json
+    "debit":       np.dtype("<f8"),
+    "credit":      np.dtype("<f8"),
+    "balance":     np.dtype("<f8"),   # NaN when the statement has no running balance
+    "fingerprint": np.dtype("<i8"),   # same fingerprint as the SQLite store
+}
+_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def day_number(d: date) -> int:
+    return d.toordinal() - _EPOCH
+
+
+def day_date(n: int) -> date:
+    return date.fromordinal(int(n) + _EPOCH)
+
+
+def _months(start: date, end: date):
+    """'YYYY-MM' partition names from `start` to `end` inclusive."""
+    y, m = start.year, start.month
+    while (y, m) <= (end.year, end.month):
+        yield f"{y:04d}-{m:02d}"
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+
+class TxnArchive:
+    """
+    <root>/<YYYY-MM>/<bank>/<column>.bin, each an append-only little-endian
+    array.  A partition's row count is the shortest column, so a crash in the
+    middle of an append never exposes a half-written row; the next append
+    cuts every column back to that count first, so rows stay aligned.
+    """
+
+    def __init__(self, root: str):
+        self.root  = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._alias_path = os.path.join(root, "aliases.json")
+        try:
+            with open(self._alias_path, encoding="utf-8") as fh:
+                self.aliases: list = json.load(fh)
+        except (OSError, ValueError):
+            self.aliases = []
+        self._alias_ids = {a: i for i, a in enumerate(self.aliases)}
+
+    # ─── writing ───
+
+    def alias_id(self, alias: str) -> int:
+        with self._lock:
+            return self._alias_id(alias)
+
+    def _alias_id(self, alias: str) -> int:
+        if alias not in self._alias_ids:
+            self._alias_ids[alias] = len(self.aliases)
+            self.aliases.append(alias)
+            tmp = self._alias_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(self.aliases, fh)
+            os.replace(tmp, self._alias_path)
+        return self._alias_ids[alias]
+
+    def append(self, alias: str, txns, fingerprint) -> int:
+        """Append transactions of one alias; `fingerprint(txn)` gives the int64 key."""
+        partitions: dict = {}
+        for t in txns:
+            partitions.setdefault((t.date.strftime("%Y-%m"), t.bank), []).append(t)
+        with self._lock:
+            alias_id = self._alias_id(alias)
+            for (month, bank), rows in partitions.items():
+                folder = os.path.join(self.root, month, bank)
+                os.makedirs(folder, exist_ok=True)
+                self._truncate_torn(folder)
+                arrays = {
+                    "day":         np.fromiter((day_number(t.date) for t in rows), np.int64, len(rows)),
+                    "alias":       np.full(len(rows), alias_id),
+                    "debit":       np.fromiter((t.debit for t in rows), np.float64, len(rows)),
+                    "credit":      np.fromiter((t.credit for t in rows), np.float64, len(rows)),
+                    "balance":     np.fromiter((np.nan if t.balance is None else t.balance
+                                                for t in rows), np.float64, len(rows)),
+                    "fingerprint": np.fromiter((fingerprint(t) for t in rows), np.int64, len(rows)),
+                }
+                for col, arr in arrays.items():
+                    with open(os.path.join(folder, f"{col}.bin"), "ab") as fh:
+                        fh.write(arr.astype(COLUMNS[col]).tobytes())
+        return sum(len(r) for r in partitions.values())
+
+    @staticmethod
+    def _column_rows(folder: str) -> dict:
+        sizes = {}
+        for col, dt in COLUMNS.items():
+            path = os.path.join(folder, f"{col}.bin")
+            sizes[col] = os.path.getsize(path) // dt.itemsize if os.path.exists(path) else 0
+        return sizes
+
+    @classmethod
+    def _truncate_torn(cls, folder: str) -> None:
+        """Drop the tail of an append that a crash / restart interrupted."""
+        rows = min(cls._column_rows(folder).values())
+        for col, dt in COLUMNS.items():
+            path = os.path.join(folder, f"{col}.bin")
+            if os.path.exists(path) and os.path.getsize(path) != rows * dt.itemsize:
+                os.truncate(path, rows * dt.itemsize)
+
+    # ─── reading ───
+
+    def partitions(self, months=None, banks=None) -> list:
+        """(month, bank, folder) for every partition matching the filters."""
+        found = []
+        for month in sorted(os.listdir(self.root)):
+            folder = os.path.join(self.root, month)
+            if not os.path.isdir(folder) or (months and month not in months):
+                continue
+            for bank in sorted(os.listdir(folder)):
+                if banks and bank not in banks:
+                    continue
+                found.append((month, bank, os.path.join(folder, bank)))
+        return found
+
+    @classmethod
+    def _load(cls, folder: str) -> dict:
+        rows = min(cls._column_rows(folder).values())
+        if rows == 0:
+            return {col: np.empty(0, dt) for col, dt in COLUMNS.items()}
+        return {
+            col: np.memmap(os.path.join(folder, f"{col}.bin"), dtype=dt, mode="r", shape=(rows,))
+            for col, dt in COLUMNS.items()
+        }
+
+    def scan(self, months=None, banks=None) -> dict:
+        """All columns over the selected partitions, plus a per-row `bank` code array."""
+        parts = self.partitions(months, banks)
+        loaded = [self._load(folder) for _, _, folder in parts]
+        if not loaded:
+            cols = {col: np.empty(0, dt) for col, dt in COLUMNS.items()}
+            cols["bank"], cols["banks"] = np.empty(0, np.int32), []
+            return cols
+        cols = {col: np.concatenate([p[col] for p in loaded]) for col in COLUMNS}
+        bank_names = sorted({bank for _, bank, _ in parts})
+        cols["bank"] = np.concatenate([
+            np.full(len(p["day"]), bank_names.index(bank), np.int32)
+            for (_, bank, _), p in zip(parts, loaded)
+        ])
+        cols["banks"] = bank_names
+        return cols
+
+    def query(self, start: date = None, end: date = None, banks=None, aliases=None,
+              min_amount: float = None) -> dict:
+        """Rows between `start` and `end` (inclusive) matching the filters, as arrays."""
+        months = set(_months(start, end)) if start and end else None
+        cols = self.scan(months, banks)
+        mask = np.ones(len(cols["day"]), bool)
+        if start:
+            mask &= cols["day"] >= day_number(start)
+        if end:
+            mask &= cols["day"] <= day_number(end)
+        if aliases:
+            ids = [self._alias_ids[a] for a in aliases if a in self._alias_ids]
+            mask &= np.isin(cols["alias"], ids)
+        if min_amount is not None:
+            mask &= np.maximum(cols["debit"], cols["credit"]) >= min_amount
+        out = {col: cols[col][mask] for col in (*COLUMNS, "bank")}
+        out["banks"] = cols["banks"]
+        return out
+
+    def totals(self, rows: dict, by: str = "alias") -> dict:
+        """Sum credits / debits grouped by `alias`, `bank` or `day`, vectorized."""
+        keys, inverse = np.unique(rows[by], return_inverse=True)
+        credit = np.bincount(inverse, weights=rows["credit"], minlength=len(keys))
+        debit  = np.bincount(inverse, weights=rows["debit"], minlength=len(keys))
+        count  = np.bincount(inverse, minlength=len(keys))
+        if by == "alias":
+            labels = [self.aliases[k] for k in keys]
+        elif by == "bank":
+            labels = [rows["banks"][k] for k in keys]
+        else:
+            labels = [day_date(k) for k in keys]
+        return {
+            label: {"credit": float(c), "debit": float(d), "count": int(n)}
+            for label, c, d, n in zip(labels, credit, debit, count)
+        }
+
+
+class DailyFlows:
+    """
+    Inflow / outflow per day and alias, kept as one credit and one debit array
+    (indexed by alias id) per day.  New statements are folded in with a
+    bincount per batch; the last `days` days are rebuilt from the archive on
+    start-up.
+    """
+
+    def __init__(self, archive: TxnArchive, days: int = 31):
+        self.archive = archive
+        self.days    = days
+        self._lock   = threading.Lock()
+        self._credit: dict = {}     # day number → float64[alias id]
+        self._debit:  dict = {}
+        self._bank_of: dict = {}    # alias id → bank
+
+        today = date.today()
+        rows = archive.query(today - timedelta(days=days), today)
+        banks = np.array(rows["banks"] or [""], dtype=object)
+        for alias_id, bank in zip(rows["alias"], banks[rows["bank"]]):
+            self._bank_of[int(alias_id)] = bank
+        self._accumulate(rows["day"], rows["alias"], rows["credit"], rows["debit"])
+
+    def add(self, alias: str, txns) -> None:
+        """Fold one statement's new transactions into the daily sums."""
+        if not txns:
+            return
+        alias_id = self.archive.alias_id(alias)
+        self._bank_of[alias_id] = txns[0].bank
+        self._accumulate(
+            np.fromiter((day_number(t.date) for t in txns), np.int64, len(txns)),
+            np.full(len(txns), alias_id),
+            np.fromiter((t.credit for t in txns), np.float64, len(txns)),
+            np.fromiter((t.debit for t in txns), np.float64, len(txns)),
+        )
+
+    def _accumulate(self, days, alias_ids, credit, debit) -> None:
+        if len(days) == 0:
+            return
+        alias_ids = np.asarray(alias_ids, np.int64)
+        keys, inverse = np.unique(days, return_inverse=True)
+        oldest = day_number(date.today()) - self.days
+        with self._lock:
+            # sized under the lock: another thread may have added an alias and
+            # widened the stored rows since this batch was built
+            width = max(len(self.archive.aliases), int(alias_ids.max()) + 1,
+                        *(len(v) for v in self._credit.values()))
+            # one flat (day slot × alias) bincount per column, then one row per day
+            flat = inverse * width + alias_ids
+            size = len(keys) * width
+            credit = np.bincount(flat, weights=credit, minlength=size).reshape(len(keys), width)
+            debit  = np.bincount(flat, weights=debit, minlength=size).reshape(len(keys), width)
+            for i, key in enumerate(keys.tolist()):
+                for sums, new in ((self._credit, credit[i]), (self._debit, debit[i])):
+                    cur = sums.get(key, np.zeros(0))
+                    sums[key] = np.concatenate([cur, np.zeros(width - len(cur))]) + new
+            for key in [k for k in self._credit if k < oldest]:
+                self._credit.pop(key, None)
+                self._debit.pop(key, None)
+
+    def report(self, day: date) -> tuple:
+        """({alias: (in, out)}, {bank: (in, out)}) for `day`, active aliases only."""
+        key = day_number(day)
+        with self._lock:
+            credit = self._credit.get(key, np.zeros(0)).copy()
+            debit  = self._debit.get(key, np.zeros(0)).copy()
+        active = np.flatnonzero((credit != 0) | (debit != 0))
+        per_alias = {self.archive.aliases[i]: (credit[i], debit[i]) for i in active}
+
+        bank_names = sorted({self._bank_of.get(int(i), "") for i in active})
+        codes = np.array([bank_names.index(self._bank_of.get(int(i), "")) for i in active], np.int64)
+        bank_in  = np.bincount(codes, weights=credit[active], minlength=len(bank_names))
+        bank_out = np.bincount(codes, weights=debit[active], minlength=len(bank_names))
+        per_bank = {b: (bank_in[j], bank_out[j]) for j, b in enumerate(bank_names)}
+        return per_alias, per_bank
+
+
+# --- month-end reconciliation: python txn_archive.py <root> <YYYY-MM> ---
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: txn_archive.py <archive root> <YYYY-MM>")
+    archive = TxnArchive(sys.argv[1])
+    year, month = map(int, sys.argv[2].split("-"))
+    first = date(year, month, 1)
+    last  = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    started = time.perf_counter()
+    rows = archive.query(first, last)
+    for alias, t in sorted(archive.totals(rows, "alias").items()):
+        print(f"{alias:30} +{t['credit']:>16,.2f} -{t['debit']:>16,.2f} {t['count']:>8} txn")
+    print(f"{len(rows['day'])} rows in {time.perf_counter() - started:.3f}s")